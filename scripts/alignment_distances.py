@@ -0,0 +1,310 @@
+# Pairwise nucleotide distances (p-distance, JC69, K2P) between isolates from the core-gene alignments.
+# Alignments are encoded as uint8 base codes and expanded to one-hot nucleotide masks block by block,
+# so the comparable-site, transition and transversion counts of all isolate pairs come out of a few
+# matrix products per block (pairwise gap deletion) instead of a Python loop over pairs and columns.
+# The distance matrices use the jaccard_distance.py CSV layout and are plotted with analyze_aflX_diversity.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alignment_io import find_alignments, read_alignment
+
+BLOCK_COLUMNS = 16384  # alignment columns expanded to one-hot masks per matrix product
+
+MODELS = {"p": "p-distance", "jc69": "JC69 Distance", "k2p": "K2P Distance"}
+
+
+def _block_site_counts(block):
+    """
+    Counts comparable sites, transitions and transversions for all pairs over one block of columns.
+
+    Returns:
+        tuple: Three (isolates x isolates) float64 arrays.
+    """
+    n = block.shape[0]
+    present = block < 4
+    comparable = np.zeros((n, n))
+    transitions = np.zeros((n, n))
+    transversions = np.zeros((n, n))
+
+    # Columns without gaps/ambiguities add one comparable site to every pair; invariant columns add no
+    # differences, so only variable columns need the full one-hot products
+    complete = present.all(axis=0)
+    valid_codes = np.where(present, block, 255)
+    variable = (valid_codes.min(axis=0) != np.where(present, block, 0).max(axis=0)) & present.any(axis=0)
+
+    invariant_gapped = ~complete & ~variable & present.any(axis=0)
+    comparable += np.count_nonzero(complete & ~variable)
+    if invariant_gapped.any():
+        mask = present[:, invariant_gapped].astype(np.float32)
+        comparable += mask @ mask.T
+
+    if variable.any():
+        codes = block[:, variable]
+        one_hot = (codes[:, None, :] == np.arange(4, dtype=np.uint8)[None, :, None]).astype(np.float32)
+        # Purine (A/G) and pyrimidine (C/T) masks; same-class pairs are identities plus transitions
+        purine_pyrimidine = np.concatenate((one_hot[:, 0] + one_hot[:, 2], one_hot[:, 1] + one_hot[:, 3]), axis=1)
+        mask = present[:, variable].astype(np.float32)
+        one_hot = one_hot.reshape(n, -1)
+
+        variable_comparable = mask @ mask.T
+        identical = one_hot @ one_hot.T
+        same_class = purine_pyrimidine @ purine_pyrimidine.T
+        comparable += variable_comparable
+        transitions += same_class - identical
+        transversions += variable_comparable - same_class
+    return comparable, transitions, transversions
+
+
+def pairwise_site_counts(codes, block_columns=BLOCK_COLUMNS, threads=1):
+    """
+    Computes pairwise-deletion site counts for all isolate pairs of an alignment.
+
+    The alignment is processed in column blocks (float32 products are exact for counts up to 2^24,
+    and blocks are accumulated in float64); blocks run on a thread pool, since NumPy releases the
+    GIL inside the matrix products.
+
+    Args:
+        codes (np.ndarray): uint8 code matrix from read_alignment().
+        block_columns (int): Columns per block.
+        threads (int): Threads processing blocks in parallel.
+
+    Returns:
+        dict: 'comparable', 'transitions' and 'transversions' (isolates x isolates) int64 arrays.
+    """
+    n, n_columns = codes.shape
+    totals = [np.zeros((n, n)) for _ in range(3)]
+    blocks = (codes[:, start:start + block_columns] for start in range(0, n_columns, block_columns))
+
+    def accumulate(block_counts):
+        for total, counts in zip(totals, block_counts):
+            total += counts
+
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            for block_counts in executor.map(_block_site_counts, blocks):
+                accumulate(block_counts)
+    else:
+        for block in blocks:
+            accumulate(_block_site_counts(block))
+
+    return dict(zip(("comparable", "transitions", "transversions"), (np.rint(t).astype(np.int64) for t in totals)))
+
+
+def distances_from_counts(counts, model):
+    """
+    Converts pairwise site counts into a distance matrix.
+
+    Pairs without comparable sites, and pairs beyond the model's saturation limit (JC69: p >= 0.75;
+    K2P: 1 - 2P - Q <= 0 or 1 - 2Q <= 0), get NaN.
+
+    Args:
+        counts (dict): Output of pairwise_site_counts().
+        model (str): One of MODELS ('p', 'jc69', 'k2p').
+
+    Returns:
+        np.ndarray: (isolates x isolates) distance matrix.
+    """
+    comparable = counts["comparable"].astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        transition_fraction = counts["transitions"] / comparable
+        transversion_fraction = counts["transversions"] / comparable
+        p = transition_fraction + transversion_fraction
+        if model == "p":
+            distance = p
+        elif model == "jc69":
+            distance = -0.75 * np.log(1.0 - p / 0.75)
+        elif model == "k2p":
+            distance = (-0.5 * np.log(1.0 - 2.0 * transition_fraction - transversion_fraction)
+                        - 0.25 * np.log(1.0 - 2.0 * transversion_fraction))
+        else:
+            raise ValueError(f"Unknown distance model '{model}'. Choose from {', '.join(MODELS)}.")
+    distance[~np.isfinite(distance)] = np.nan
+    np.fill_diagonal(distance, 0.0)
+    return distance
+
+
+def alignment_site_counts(alignment_file, strip_gene_prefix=True, block_columns=BLOCK_COLUMNS, threads=1):
+    """
+    Reads one alignment and returns its pairwise site counts. Runs in a worker process.
+
+    Isolates appearing more than once (e.g., paralogous hits) keep their first sequence.
+
+    Returns:
+        tuple: (alignment_file, list of isolate names, counts dict)
+    """
+    names, codes = read_alignment(alignment_file, strip_gene_prefix)
+    _, first_rows = np.unique(names, return_index=True)
+    if len(first_rows) < len(names):
+        print(f"Warning: {len(names) - len(first_rows)} duplicate isolate(s) in '{alignment_file}'; "
+              f"keeping the first sequence of each.", file=sys.stderr)
+        keep = np.sort(first_rows)
+        names = [names[i] for i in keep]
+        codes = codes[keep]
+    return alignment_file, names, pairwise_site_counts(codes, block_columns, threads)
+
+
+def concatenate_site_counts(counts_by_gene):
+    """
+    Sums per-gene site counts over the union of isolates.
+
+    Counts are additive across genes, so this equals the counts of the concatenated alignment with
+    missing genes coded as gaps, without building the supermatrix.
+
+    Args:
+        counts_by_gene (dict): gene -> (list of isolate names, counts dict).
+
+    Returns:
+        tuple: (sorted list of isolate names, counts dict).
+    """
+    isolates = sorted({name for names, _ in counts_by_gene.values() for name in names})
+    position = {name: i for i, name in enumerate(isolates)}
+    totals = {key: np.zeros((len(isolates), len(isolates)), dtype=np.int64)
+              for key in ("comparable", "transitions", "transversions")}
+    for names, counts in counts_by_gene.values():
+        index = np.array([position[name] for name in names])
+        for key, total in totals.items():
+            total[np.ix_(index, index)] += counts[key]
+    return isolates, totals
+
+
+def write_distance_matrices(names, counts, models, output_prefix):
+    """
+    Writes one distance matrix CSV per model (index 'Isolate') and returns them as DataFrames.
+    """
+    matrices = {}
+    for model in models:
+        distance_df = pd.DataFrame(distances_from_counts(counts, model), index=names, columns=names)
+        distance_df.index.name = "Isolate"
+        output_file = f"{output_prefix}_{model}_distance_matrix.csv"
+        distance_df.to_csv(output_file)
+        undefined_pairs = int(np.isnan(distance_df.values).sum() // 2)
+        if undefined_pairs:
+            print(f"Warning: {undefined_pairs} isolate pairs in {output_file} have no comparable sites "
+                  f"or are saturated under {model}; their distance is NaN.", file=sys.stderr)
+        matrices[model] = distance_df
+    return matrices
+
+
+def main():
+    """Main function to parse arguments and compute alignment distance matrices."""
+    parser = argparse.ArgumentParser(
+        description="Pairwise p-distance, JC69 and K2P distances between isolates from core gene alignments."
+    )
+    parser.add_argument(
+        "alignments",
+        nargs="+",
+        help="Alignment files and/or directories searched recursively for '*_aligned.fasta' "
+             "(e.g., the individual core gene tree output directory, or the concatenated core gene alignment)."
+    )
+    parser.add_argument(
+        "--mode",
+        type=str,
+        choices=['per_gene', 'concatenated', 'both'],
+        default='concatenated',
+        help="Write one matrix per gene, one matrix over all genes, or both. Default: concatenated"
+    )
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODELS),
+        default=list(MODELS),
+        help="Distance models to compute. Default: p jc69 k2p"
+    )
+    parser.add_argument(
+        "--output_prefix",
+        type=str,
+        default="alignment_distances",
+        help="Prefix for the output files. Default: 'alignment_distances'"
+    )
+    parser.add_argument(
+        "--keep_tip_labels",
+        action="store_true",
+        help="Do not strip the 'geneName_' prefix from sequence names."
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes/threads. Default: all cores")
+    parser.add_argument(
+        "--analysis",
+        type=str,
+        choices=['clustering', 'pcoa', 'both', 'none'],
+        default='both',
+        help="Analysis to run on the concatenated distance matrices with analyze_aflX_diversity. Default: both"
+    )
+    parser.add_argument(
+        "--linkage_method",
+        type=str,
+        choices=['average', 'complete', 'single', 'ward'],
+        default='average',
+        help="Linkage method for hierarchical clustering. Default: average"
+    )
+
+    args = parser.parse_args()
+    strip_gene_prefix = not args.keep_tip_labels
+    workers = args.workers or os.cpu_count()
+
+    alignments = find_alignments(args.alignments)
+    if not alignments:
+        print("Error: No alignments found.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Computing pairwise site counts for {len(alignments)} alignments...")
+
+    counts_by_gene = {}
+    if len(alignments) == 1:
+        # A single (e.g., concatenated) alignment: parallelize over column blocks instead of files
+        gene, alignment_file = next(iter(alignments.items()))
+        _, names, counts = alignment_site_counts(alignment_file, strip_gene_prefix, threads=workers)
+        counts_by_gene[gene] = (names, counts)
+    else:
+        gene_by_file = {path: gene for gene, path in alignments.items()}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(alignment_site_counts, path, strip_gene_prefix) for path in alignments.values()]
+            for future in futures:
+                try:
+                    alignment_file, names, counts = future.result()
+                except ValueError as e:
+                    print(f"Warning: {e}. Skipping.", file=sys.stderr)
+                    continue
+                counts_by_gene[gene_by_file[alignment_file]] = (names, counts)
+    if not counts_by_gene:
+        print("Error: No usable alignments.", file=sys.stderr)
+        sys.exit(1)
+
+    if args.mode in ['per_gene', 'both']:
+        for gene, (names, counts) in counts_by_gene.items():
+            write_distance_matrices(names, counts, args.models, f"{args.output_prefix}_{gene}")
+        print(f"Per-gene distance matrices for {len(counts_by_gene)} genes saved with prefix {args.output_prefix}_")
+
+    if args.mode in ['concatenated', 'both']:
+        isolates, counts = concatenate_site_counts(counts_by_gene)
+        matrices = write_distance_matrices(isolates, counts, args.models, f"{args.output_prefix}_concatenated")
+        print(f"Concatenated distance matrices over {len(isolates)} isolates saved with prefix "
+              f"{args.output_prefix}_concatenated_")
+
+        if args.analysis != 'none':
+            # Imported here so the distance engine does not depend on the plotting stack
+            from analyze_aflX_diversity import plot_hierarchical_clustering, plot_pcoa
+
+        for model, distance_df in matrices.items():
+            if args.analysis == 'none':
+                break
+            if distance_df.isna().values.any():
+                print(f"Warning: Skipping plots for {model}; the matrix contains undefined distances.", file=sys.stderr)
+                continue
+            plot_prefix = f"{args.output_prefix}_concatenated_{model}"
+            if args.analysis in ['clustering', 'both']:
+                plot_hierarchical_clustering(distance_df, args.linkage_method, f"{plot_prefix}_dendrogram.png",
+                                             distance_label=MODELS[model])
+            if args.analysis in ['pcoa', 'both']:
+                plot_pcoa(distance_df, f"{plot_prefix}_pcoa_plot.png",
+                          distance_basis=f"{MODELS[model]}, Core Gene Alignments")
+
+    print("\nAlignment distance analysis complete.")
+
+
+if __name__ == "__main__":
+    main()
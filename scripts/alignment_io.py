@@ -0,0 +1,94 @@
+# Aligned-FASTA input shared by the alignment statistics scripts (alignment_distances.py,
+# population_diversity.py) and the tip-label to isolate mapping shared with gene_tree_concordance.py.
+# Kept free of plotting and tree-analysis imports so the statistics scripts load only numpy.
+
+import os
+import sys
+
+import numpy as np
+
+# A/C/G/T/U (either case) -> 0..3, gaps, N and IUPAC ambiguity codes -> 4 (missing, deleted pairwise)
+NUCLEOTIDE_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(("Aa", "Cc", "Gg", "TtUu")):
+    for _base in _bases:
+        NUCLEOTIDE_CODES[ord(_base)] = _code
+
+
+def taxon_from_tip_label(tip_label, strip_gene_prefix=True):
+    """
+    Maps a tree tip label to its isolate name.
+
+    run_single_gene_phylogeny labels tips '>geneName_isolateName' (e.g., 'adhA_10B'), while the
+    concatenated tree uses the bare isolate name, so the gene prefix is stripped to share one taxon set.
+
+    Args:
+        tip_label (str): Tip label as written in the Newick file.
+        strip_gene_prefix (bool): If True, keep only the text after the last underscore.
+
+    Returns:
+        str: The isolate (taxon) name.
+    """
+    if strip_gene_prefix and "_" in tip_label:
+        return tip_label.rsplit("_", 1)[1]
+    return tip_label
+
+
+def read_alignment(alignment_file, strip_gene_prefix=True):
+    """
+    Reads an aligned FASTA file into a matrix of nucleotide codes.
+
+    Args:
+        alignment_file (str): Aligned FASTA file (e.g., '{gene}_aligned.fasta' from run_single_gene_phylogeny).
+        strip_gene_prefix (bool): Map 'geneName_isolateName' headers to the isolate name.
+
+    Returns:
+        tuple: (list of isolate names, np.ndarray uint8 code matrix of shape (isolates, columns)).
+
+    Raises:
+        ValueError: If the sequences do not all have the same length.
+    """
+    names, sequences = [], []
+    chunks = None
+    with open(alignment_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if chunks is not None:
+                    sequences.append(b"".join(chunks))
+                fields = line[1:].split()
+                names.append(taxon_from_tip_label(fields[0].decode() if fields else "", strip_gene_prefix))
+                chunks = []
+            elif chunks is not None:
+                chunks.append(line.strip())
+    if chunks is not None:
+        sequences.append(b"".join(chunks))
+
+    lengths = {len(sequence) for sequence in sequences}
+    if len(lengths) > 1:
+        raise ValueError(f"'{alignment_file}' is not aligned: sequence lengths {sorted(lengths)[:5]}")
+    if not sequences:
+        return names, np.empty((0, 0), dtype=np.uint8)
+    raw = np.frombuffer(b"".join(sequences), dtype=np.uint8).reshape(len(sequences), -1)
+    return names, NUCLEOTIDE_CODES[raw]
+
+
+def find_alignments(paths, suffix="_aligned.fasta"):
+    """
+    Expands files and directories into a dict gene -> alignment file.
+
+    Directories are searched recursively for files ending in suffix; the gene name is the file name
+    without the suffix. Collapsed-allele alignments ('*_aligned_unique.fasta') do not match the suffix.
+    """
+    alignments = {}
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for fname in sorted(files):
+                    if fname.endswith(suffix):
+                        alignments[fname[:-len(suffix)]] = os.path.join(root, fname)
+        elif os.path.isfile(path):
+            fname = os.path.basename(path)
+            gene = fname[:-len(suffix)] if fname.endswith(suffix) else os.path.splitext(fname)[0]
+            alignments[gene] = path
+        else:
+            print(f"Warning: '{path}' not found. Skipping.", file=sys.stderr)
+    return dict(sorted(alignments.items()))
@@ -0,0 +1,129 @@
+# Collapses byte-identical alleles before alignment and tree inference, and re-expands them afterwards.
+# Clonal A. flavus isolates often carry identical copies of a core gene; aligning and inferring a tree on
+# one representative per allele and adding the duplicates back as zero-length polytomies gives the same
+# tree at a fraction of the MAFFT/IQ-TREE cost.
+
+import hashlib
+import re
+
+# Newick tokens: quoted label | bracketed comment | structural character | unquoted label/number | whitespace
+# (shared with gene_tree_concordance.py; whitespace is kept so trees can be rewritten unchanged)
+NEWICK_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\[[^\]]*\]|[(),:;]|[^\s(),:;\[\]']+|\s+")
+# Characters that force a Newick label to be quoted
+NEWICK_UNSAFE_LABEL = re.compile(r"[\s(),:;\[\]']")
+
+
+def normalize_sequence(sequence):
+    """Uppercases a sequence and drops whitespace, gaps and stop symbols so identical alleles hash equally."""
+    return re.sub(r"[\s\-*.]", "", sequence).upper()
+
+
+def collapse_identical_alleles(records):
+    """
+    Keeps one representative per distinct allele.
+
+    Args:
+        records (list): (name, sequence) tuples in input order.
+
+    Returns:
+        tuple: (representatives: list of (name, sequence) for the first record of each allele,
+                groups: dict representative name -> list of all member names, representative first).
+    """
+    representative_by_digest = {}
+    representatives = []
+    groups = {}
+    for name, sequence in records:
+        digest = hashlib.sha1(normalize_sequence(sequence).encode("ascii", "replace")).digest()
+        representative = representative_by_digest.get(digest)
+        if representative is None:
+            representative_by_digest[digest] = name
+            representatives.append((name, sequence))
+            groups[name] = [name]
+        else:
+            groups[representative].append(name)
+    return representatives, groups
+
+
+def write_multiplicity_table(groups, output_file):
+    """
+    Writes one row per allele: allele id, representative, multiplicity and members.
+
+    Args:
+        groups (dict): Output of collapse_identical_alleles().
+        output_file (str): Path of the TSV file.
+    """
+    with open(output_file, "w") as f:
+        f.write("allele\trepresentative\tmultiplicity\tmembers\n")
+        for i, (representative, members) in enumerate(groups.items(), start=1):
+            f.write(f"allele_{i}\t{representative}\t{len(members)}\t{','.join(members)}\n")
+
+
+def expand_alignment(aligned_fasta_in, groups, aligned_fasta_out):
+    """
+    Writes the full alignment by repeating each representative's aligned row for every member.
+
+    Args:
+        aligned_fasta_in (str): Alignment of the representatives only.
+        groups (dict): Output of collapse_identical_alleles().
+        aligned_fasta_out (str): Path of the expanded alignment.
+    """
+    aligned = {}
+    order = []
+    name = None
+    with open(aligned_fasta_in, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                name = line[1:].split()[0]
+                aligned[name] = []
+                order.append(name)
+            elif line and name is not None:
+                aligned[name].append(line)
+
+    with open(aligned_fasta_out, "w") as out:
+        for representative in order:
+            sequence = "".join(aligned[representative])
+            for member in groups.get(representative, [representative]):
+                out.write(f">{member}\n{sequence}\n")
+
+
+def quote_newick_label(label):
+    """Quotes a tip label (doubling inner quotes) if it contains whitespace or Newick metacharacters."""
+    if NEWICK_UNSAFE_LABEL.search(label):
+        return "'" + label.replace("'", "''") + "'"
+    return label
+
+
+def expand_newick_polytomies(newick_string, groups):
+    """
+    Replaces every collapsed representative tip with a zero-length polytomy of all its members.
+
+    'rep:0.01' becomes '(rep:0,member2:0,member3:0):0.01', so the representative's branch length
+    is kept on the new clade. Tips of singleton alleles are left unchanged; member names that
+    need it are quoted (e.g., "'d e'"), so the result stays valid Newick.
+
+    Args:
+        newick_string (str): Tree inferred on the representatives.
+        groups (dict): Output of collapse_identical_alleles().
+
+    Returns:
+        str: Newick string containing every member.
+    """
+    output = []
+    expect_tip = True  # a label directly after '(' or ',' (or at the start) is a tip label
+    for token in NEWICK_TOKEN_PATTERN.findall(newick_string):
+        if token.isspace() or token.startswith("["):
+            output.append(token)
+            continue
+        if token in "(,":
+            expect_tip = True
+        elif token in "):;":
+            expect_tip = False
+        elif expect_tip:
+            label = token[1:-1].replace("''", "'") if token.startswith("'") else token
+            members = groups.get(label)
+            if members and len(members) > 1:
+                token = "(" + ",".join(f"{quote_newick_label(member)}:0" for member in members) + ")"
+            expect_tip = False
+        output.append(token)
+    return "".join(output)
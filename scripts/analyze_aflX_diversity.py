@@ -11,7 +11,8 @@ from skbio.stats.ordination import OrdinationResults
 import argparse
 import sys
 
-def plot_hierarchical_clustering(distance_df: pd.DataFrame, linkage_method: str, output_file: str):
+def plot_hierarchical_clustering(distance_df: pd.DataFrame, linkage_method: str, output_file: str,
+                                 distance_label: str = "Jaccard Distance", leaf_label: str = "Isolates"):
     """
     Performs hierarchical clustering and saves the resulting dendrogram.
 
@@ -19,6 +20,8 @@ def plot_hierarchical_clustering(distance_df: pd.DataFrame, linkage_method: str,
         distance_df (pd.DataFrame): A square DataFrame of pairwise distances.
         linkage_method (str): The linkage algorithm to use (e.g., 'average', 'complete', 'ward').
         output_file (str): Path to save the output plot.
+        distance_label (str): Y-axis label naming the distance measure. Default: 'Jaccard Distance'
+        leaf_label (str): X-axis label naming what the leaves are. Default: 'Isolates'
     """
     print(f"Performing hierarchical clustering using '{linkage_method}' linkage...")
     # Convert the square-form distance matrix back into a condensed distance matrix
@@ -42,20 +45,23 @@ def plot_hierarchical_clustering(distance_df: pd.DataFrame, linkage_method: str,
 
     # Customize and save the plot
     plt.title(f"Hierarchical Clustering Dendrogram ({linkage_method.capitalize()} Linkage)", fontsize=16)
-    plt.ylabel("Jaccard Distance", fontsize=12)
-    plt.xlabel("Isolates", fontsize=12)
+    plt.ylabel(distance_label, fontsize=12)
+    plt.xlabel(leaf_label, fontsize=12)
     plt.tight_layout()
     plt.savefig(output_file, dpi=300)
     plt.close() # Close the plot to free up memory
     print(f"Dendrogram saved to {output_file}")
 
-def plot_pcoa(distance_df: pd.DataFrame, output_file: str):
+def plot_pcoa(distance_df: pd.DataFrame, output_file: str,
+              distance_basis: str = "Gene Presence/Absence", leaf_label: str = "Isolates"):
     """
     Performs PCoA and saves the resulting 2D scatter plot.
 
     Args:
         distance_df (pd.DataFrame): A square DataFrame of pairwise distances.
         output_file (str): Path to save the output plot.
+        distance_basis (str): What the distances are based on, used in the plot title. Default: 'Gene Presence/Absence'
+        leaf_label (str): What the points are, used in the plot title. Default: 'Isolates'
     """
     print("Performing Principal Coordinates Analysis (PCoA)...")
     # Perform PCoA using scikit-bio, which correctly handles distance matrices
@@ -75,7 +81,7 @@ def plot_pcoa(distance_df: pd.DataFrame, output_file: str):
     sns.scatterplot(x='PC1', y='PC2', data=pcoa_coords, s=120, edgecolor='black', alpha=0.8)
 
     # Customize and save the plot
-    plt.title("PCoA of Isolates (based on Gene Presence/Absence)", fontsize=16)
+    plt.title(f"PCoA of {leaf_label} (based on {distance_basis})", fontsize=16)
     plt.xlabel(f"PC1 ({prop_explained['PC1']:.2%})", fontsize=12)
     plt.ylabel(f"PC2 ({prop_explained['PC2']:.2%})", fontsize=12)
     plt.axhline(0, color='gray', linestyle='--', linewidth=0.8)
@@ -21,6 +21,8 @@ do
 
     mkdir -p $bed_dir/"$sample"
 
+    # Columns 2-3 are the BLAST sstart/send as-is, i.e. a 1-based start (standard BED is 0-based);
+    # minhash_sketch.py --region_bed_dir converts them unless --zero_based_bed is given
     grep -v '#' $blastn_dir/"$sample"/BlastN_AF13-ABGC-AY510451_2_"$sample".tab \
     | awk '{
     sign = ($9 < $10) ? "+" : (($9 > $10) ? "-" : ".");
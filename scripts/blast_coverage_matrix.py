@@ -0,0 +1,237 @@
+# Builds quantitative gene x isolate matrices from the per-gene BLASTN tables.
+# Unlike create_presence_absence_aflxGenes_matrix.sh (presence = non-empty extracted FASTA), a gene
+# is scored by how much of its query length is covered by hits, so a short fragment no longer counts
+# the same as a full-length copy.
+
+import argparse
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+BLAST_COLUMNS = ["qseqid", "sseqid", "pident", "length", "mismatch", "gapopen",
+                 "qstart", "qend", "sstart", "send", "evalue", "bitscore"]
+
+
+def load_gene_lengths(gene_coordinates_file):
+    """
+    Reads query gene lengths from gene_coordinates.txt (gene_name, start, end; 1-based inclusive).
+
+    Args:
+        gene_coordinates_file (str): Path to gene_coordinates.txt.
+
+    Returns:
+        dict: Mapping of full gene name (e.g., 'pksA_polyketide_synthase') -> length in bp.
+    """
+    gene_lengths = {}
+    with open(gene_coordinates_file, "r") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            gene, start, end = line.split()[:3]
+            gene_lengths[gene] = int(end) - int(start) + 1
+    return gene_lengths
+
+
+def read_blast_tables(blast_dir, genes):
+    """
+    Reads every BLASTN_<gene>_<sample>.tab table below blast_dir into one DataFrame.
+
+    Comment lines are dropped while reading and all hit lines are parsed with a single
+    pandas call, instead of one parser (or awk/grep) invocation per file.
+
+    Args:
+        blast_dir (str): BLAST output directory with one subdirectory per sample.
+        genes (list): Full gene names to collect.
+
+    Returns:
+        tuple: (hits DataFrame with BLAST_COLUMNS plus integer 'gene_idx' and 'sample_idx', list of sample names).
+    """
+    samples = sorted(d for d in os.listdir(blast_dir) if os.path.isdir(os.path.join(blast_dir, d)))
+    hit_lines = []
+    for sample_idx, sample in enumerate(samples):
+        sample_dir = os.path.join(blast_dir, sample)
+        for gene_idx, gene in enumerate(genes):
+            blast_file = os.path.join(sample_dir, f"BLASTN_{gene}_{sample}.tab")
+            if not os.path.exists(blast_file):
+                continue
+            prefix = f"{gene_idx}\t{sample_idx}\t"
+            with open(blast_file, "r") as f:
+                hit_lines.extend(prefix + line for line in f if line.strip() and not line.startswith("#"))
+
+    columns = ["gene_idx", "sample_idx"] + BLAST_COLUMNS
+    if not hit_lines:
+        return pd.DataFrame(columns=columns), samples
+    hits = pd.read_csv(
+        io.StringIO("".join(hit_lines)), sep="\t", header=None, names=columns,
+        usecols=["gene_idx", "sample_idx", "pident", "qstart", "qend"],
+    )
+    return hits, samples
+
+
+def merged_interval_coverage(group_ids, starts, ends, n_groups):
+    """
+    Computes the union length of 1-based inclusive intervals per group with sorted, vectorized merging.
+
+    Intervals are sorted by (group, start) and shifted by a per-group offset so that one global
+    running maximum of the end coordinate never crosses group boundaries. An interval opens a new
+    merged block whenever it starts after the running maximum of all previous ends.
+
+    Args:
+        group_ids (np.ndarray): Group index of each interval (0 .. n_groups-1).
+        starts (np.ndarray): Interval starts.
+        ends (np.ndarray): Interval ends (inclusive), ends >= starts.
+        n_groups (int): Number of groups.
+
+    Returns:
+        np.ndarray: Covered length per group (float, length n_groups).
+    """
+    if len(starts) == 0:
+        return np.zeros(n_groups)
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    span = int(ends.max()) + 2
+    offset = group_ids * span
+    order = np.lexsort((starts, group_ids))
+    shifted_starts = starts[order] + offset[order]
+    shifted_ends = ends[order] + offset[order]
+
+    running_end = np.maximum.accumulate(shifted_ends)
+    new_block = np.empty(len(order), dtype=bool)
+    new_block[0] = True
+    new_block[1:] = shifted_starts[1:] > running_end[:-1]
+    block_starts = np.flatnonzero(new_block)
+
+    block_lengths = np.maximum.reduceat(shifted_ends, block_starts) - shifted_starts[block_starts] + 1
+    return np.bincount(group_ids[order][block_starts], weights=block_lengths, minlength=n_groups)
+
+
+def compute_coverage_matrices(hits, genes, samples, gene_lengths, min_identity=0.0):
+    """
+    Computes per gene x sample query coverage, identity-weighted coverage and copy number.
+
+    - coverage: fraction of the query covered by the union of qstart-qend intervals (0-1).
+    - identity-weighted coverage: coverage x alignment-length-weighted mean identity of the hits (0-1).
+    - copy number: total aligned query bases / query length (~1 per full-length copy).
+
+    Args:
+        hits (pd.DataFrame): Output of read_blast_tables().
+        genes (list): Full gene names, in gene_idx order.
+        samples (list): Sample names, in sample_idx order.
+        gene_lengths (dict): Gene name -> query length.
+        min_identity (float): Hits below this percent identity are ignored.
+
+    Returns:
+        dict: Matrix name -> DataFrame (samples x genes).
+    """
+    n_genes = len(genes)
+    n_cells = len(samples) * n_genes
+
+    if min_identity > 0 and len(hits):
+        hits = hits[hits["pident"] >= min_identity]
+
+    gene_idx = hits["gene_idx"].to_numpy(dtype=np.int64)
+    sample_idx = hits["sample_idx"].to_numpy(dtype=np.int64)
+    qstart = hits["qstart"].to_numpy(dtype=np.int64)
+    qend = hits["qend"].to_numpy(dtype=np.int64)
+    # BLAST reports query coordinates ascending, but guard against swapped values anyway
+    starts = np.minimum(qstart, qend)
+    ends = np.maximum(qstart, qend)
+    pident = hits["pident"].to_numpy(dtype=float)
+    cell = sample_idx * n_genes + gene_idx
+
+    query_lengths = np.array([gene_lengths[g] for g in genes], dtype=float)
+    cell_query_lengths = np.tile(query_lengths, len(samples))
+
+    covered = merged_interval_coverage(cell, starts, ends, n_cells)
+    aligned = np.bincount(cell, weights=(ends - starts + 1).astype(float), minlength=n_cells)
+    identity_sum = np.bincount(cell, weights=(ends - starts + 1) * pident, minlength=n_cells)
+
+    coverage = np.minimum(covered / cell_query_lengths, 1.0)
+    mean_identity = np.divide(identity_sum, aligned, out=np.zeros(n_cells), where=aligned > 0) / 100.0
+    matrices = {
+        "coverage": coverage,
+        "identity_weighted_coverage": coverage * mean_identity,
+        "copy_number": aligned / cell_query_lengths,
+    }
+
+    # Column names follow create_presence_absence_aflxGenes_matrix.sh (${gene%%_*})
+    short_names = [g.split("_")[0] for g in genes]
+    index = pd.Index(samples, name="Isolate")
+    return {
+        name: pd.DataFrame(values.reshape(len(samples), n_genes), index=index, columns=short_names)
+        for name, values in matrices.items()
+    }
+
+
+def main():
+    """Main function to parse arguments and write the coverage matrices."""
+    parser = argparse.ArgumentParser(
+        description="Build query-coverage, identity-weighted coverage, copy-number and thresholded presence/absence matrices from BLASTN tables."
+    )
+    parser.add_argument(
+        "blast_dir",
+        type=str,
+        help="BLAST output directory with one subdirectory per sample (BLASTN_<gene>_<sample>.tab)."
+    )
+    parser.add_argument(
+        "--gene_coordinates",
+        type=str,
+        default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "gene_coordinates.txt"),
+        help="Gene list with query coordinates, used for gene names and lengths. Default: gene_coordinates.txt next to this script"
+    )
+    parser.add_argument(
+        "--output_prefix",
+        type=str,
+        default="aflx_genes",
+        help="Prefix for the output CSV files. Default: 'aflx_genes'"
+    )
+    parser.add_argument(
+        "--min_coverage",
+        type=float,
+        default=0.8,
+        help="Minimum query coverage (0-1) for a gene to be scored present. Default: 0.8"
+    )
+    parser.add_argument(
+        "--min_identity",
+        type=float,
+        default=0.0,
+        help="Ignore hits below this percent identity. Default: 0 (keep all hits)"
+    )
+
+    args = parser.parse_args()
+
+    try:
+        gene_lengths = load_gene_lengths(args.gene_coordinates)
+    except FileNotFoundError:
+        print(f"Error: The file '{args.gene_coordinates}' was not found.", file=sys.stderr)
+        sys.exit(1)
+    genes = list(gene_lengths)
+
+    if not os.path.isdir(args.blast_dir):
+        print(f"Error: Directory '{args.blast_dir}' does not exist.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"Reading BLAST tables for {len(genes)} genes from {args.blast_dir}...")
+    hits, samples = read_blast_tables(args.blast_dir, genes)
+    print(f"Loaded {len(hits)} hits across {len(samples)} samples.")
+
+    matrices = compute_coverage_matrices(hits, genes, samples, gene_lengths, args.min_identity)
+    for name, matrix_df in matrices.items():
+        output_file = f"{args.output_prefix}_{name}_matrix.csv"
+        matrix_df.round(4).to_csv(output_file)
+        print(f"{name.replace('_', ' ').capitalize()} matrix saved to {output_file}")
+
+    # Binary matrix in the format consumed by jaccard_distance.calculate_jaccard_distance()
+    presence_absence = (matrices["coverage"] >= args.min_coverage).astype(int)
+    output_file = f"{args.output_prefix}_presence_absence_cov{args.min_coverage:g}_matrix.csv"
+    presence_absence.to_csv(output_file)
+    print(f"Presence/absence matrix (coverage >= {args.min_coverage:g}) saved to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,6 @@
-for file in *.fa; do
-    # Calculate the total length of sequences in the current file
-    length=$(grep -v "^>" "$file" | awk '{total += length($0)} END {print total}')
-    echo "$file: $length"
-done | tee lengths.txt
+# Sequence length statistics for every *.fa in the current directory.
+# Uses fasta_stats.py (memory-mapped, parallel, cached by size/mtime) instead of grep/awk per file;
+# per-file lengths, N50/L50, GC and N-content go to lengths.txt and the totals line to stderr.
+SCRIPT_DIR=$(dirname "$(readlink -f "$0")")
 
-# Calculate the total length across all files
-total_length=$(grep -v "^>" *.fa | awk '{total += length($0)} END {print total}')
-echo "Total length: $total_length"
\ No newline at end of file
+python "$SCRIPT_DIR"/fasta_stats.py *.fa | tee lengths.txt
@@ -0,0 +1,245 @@
+# FASTA statistics for assemblies and Extracted_* gene files (replaces count.sh).
+# Each file is memory-mapped and scanned in fixed-size blocks with NumPy byte counting, files are
+# processed in parallel, and results are cached per file by size and modification time.
+
+import argparse
+import json
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+FASTA_EXTENSIONS = (".fa", ".fasta", ".fna", ".fas")
+DEFAULT_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "aflx_fasta_stats.json")
+BLOCK_SIZE = 64 * 1024 * 1024  # bytes scanned per NumPy pass; bounds temporary memory on large assemblies
+
+STAT_COLUMNS = ["records", "total_length", "min_length", "max_length", "mean_length",
+                "N50", "L50", "gc_percent", "n_percent"]
+
+
+def n50_l50(lengths):
+    """Returns (N50, L50) for an array of record lengths."""
+    if len(lengths) == 0 or lengths.sum() == 0:
+        return 0, 0
+    sorted_lengths = np.sort(lengths)[::-1]
+    cumulative = np.cumsum(sorted_lengths)
+    l50 = int(np.searchsorted(cumulative, cumulative[-1] / 2.0)) + 1
+    return int(sorted_lengths[l50 - 1]), l50
+
+
+def _scan_mapped_bytes(buf):
+    """
+    Scans a FASTA byte buffer block by block.
+
+    Returns:
+        tuple: (sequence byte counts (256,), newline positions, carriage-return positions,
+                header start positions, header end positions, whether sequence precedes the first header).
+    """
+    file_size = len(buf)
+    byte_counts = np.zeros(256, dtype=np.int64)
+    newline_blocks, cr_blocks, header_blocks = [], [], []
+    for block_start in range(0, file_size, BLOCK_SIZE):
+        block = buf[block_start:block_start + BLOCK_SIZE]
+        byte_counts += np.bincount(block, minlength=256)
+        newline_blocks.append(np.flatnonzero(block == 10) + block_start)
+        cr_blocks.append(np.flatnonzero(block == 13) + block_start)
+        gt = np.flatnonzero(block == 62) + block_start
+        # '>' starts a header only at the beginning of the file or of a line
+        previous = buf[np.maximum(gt - 1, 0)]
+        header_blocks.append(gt[(gt == 0) | (previous == 10)])
+    newlines = np.concatenate(newline_blocks)
+    carriage_returns = np.concatenate(cr_blocks)
+    header_starts = np.concatenate(header_blocks)
+
+    # Each header ends at its first newline (or at EOF); header bytes are not sequence
+    next_newline = np.searchsorted(newlines, header_starts)
+    if len(newlines):
+        header_ends = np.where(next_newline < len(newlines),
+                               newlines[np.minimum(next_newline, len(newlines) - 1)], file_size)
+    else:
+        header_ends = np.full(len(header_starts), file_size)
+    # Gather all header bytes with one index array (header i covers offsets[i]..offsets[i+1]) and subtract
+    # a single bincount; headers are a tiny fraction of the file, so the index array stays small
+    header_lengths = header_ends - header_starts
+    offsets = np.concatenate(([0], np.cumsum(header_lengths)))
+    header_index = np.arange(offsets[-1]) + np.repeat(header_starts - offsets[:-1], header_lengths)
+    byte_counts -= np.bincount(buf[header_index], minlength=256)
+
+    first_header = int(header_starts[0]) if len(header_starts) else file_size
+    return byte_counts, newlines, carriage_returns, header_starts, header_ends, _has_sequence(buf[:first_header])
+
+
+def _has_sequence(buf):
+    """True if the buffer contains anything other than whitespace (checked block by block)."""
+    for block_start in range(0, len(buf), BLOCK_SIZE):
+        block = buf[block_start:block_start + BLOCK_SIZE]
+        if np.count_nonzero((block != 10) & (block != 13) & (block != 32) & (block != 9)):
+            return True
+    return False
+
+
+def scan_fasta(fasta_file):
+    """
+    Computes record lengths and base composition of a FASTA file by memory-mapping it.
+
+    Header lines are located from the positions of newline and '>' bytes; record lengths are the
+    byte spans between headers minus line breaks, and base counts are a bincount of all bytes minus
+    the bincount of the header lines. Sequence before the first header is reported as its own record.
+
+    Args:
+        fasta_file (str): Path to the FASTA file.
+
+    Returns:
+        dict: Statistics keyed by STAT_COLUMNS.
+    """
+    file_size = os.path.getsize(fasta_file)
+    if file_size == 0:
+        return dict.fromkeys(STAT_COLUMNS, 0)
+
+    with open(fasta_file, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        # All NumPy views of the map live inside _scan_mapped_bytes, so the map can be closed afterwards
+        byte_counts, newlines, carriage_returns, header_starts, header_ends, leading_sequence = _scan_mapped_bytes(
+            np.frombuffer(mm, dtype=np.uint8)
+        )
+
+    # Sequence span of record i: after its header line up to the next header (or EOF)
+    span_starts = np.minimum(header_ends + 1, file_size)
+    span_ends = np.append(header_starts[1:], file_size) if len(header_starts) else header_starts
+    if leading_sequence:
+        # Sequence before the first header (or a file without headers) counts as its own unnamed record
+        print(f"Warning: '{fasta_file}' has sequence before its first '>' header; counting it as a separate record.",
+              file=sys.stderr)
+        span_starts = np.concatenate(([0], span_starts))
+        span_ends = np.concatenate(([header_starts[0] if len(header_starts) else file_size], span_ends))
+    line_breaks = (np.searchsorted(newlines, span_ends) - np.searchsorted(newlines, span_starts)
+                   + np.searchsorted(carriage_returns, span_ends) - np.searchsorted(carriage_returns, span_starts))
+    lengths = (span_ends - span_starts - line_breaks).astype(np.int64)
+
+    total_length = int(lengths.sum())
+    gc = int(byte_counts[ord("G")] + byte_counts[ord("C")] + byte_counts[ord("g")] + byte_counts[ord("c")])
+    acgt = gc + int(byte_counts[ord("A")] + byte_counts[ord("T")] + byte_counts[ord("a")] + byte_counts[ord("t")])
+    n_count = int(byte_counts[ord("N")] + byte_counts[ord("n")])
+    n50, l50 = n50_l50(lengths)
+
+    return {
+        "records": int(len(lengths)),
+        "total_length": total_length,
+        "min_length": int(lengths.min()) if len(lengths) else 0,
+        "max_length": int(lengths.max()) if len(lengths) else 0,
+        "mean_length": round(total_length / len(lengths), 1) if len(lengths) else 0,
+        "N50": n50,
+        "L50": l50,
+        "gc_percent": round(100.0 * gc / acgt, 2) if acgt else 0.0,
+        "n_percent": round(100.0 * n_count / total_length, 3) if total_length else 0.0,
+    }
+
+
+def collect_fasta_files(paths):
+    """Expands directories (e.g., an Extracted_* directory) into the FASTA files they contain."""
+    fasta_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            fasta_files.extend(sorted(entry.path for entry in os.scandir(path)
+                                      if entry.is_file() and entry.name.endswith(FASTA_EXTENSIONS)))
+        elif os.path.isfile(path):
+            fasta_files.append(path)
+        else:
+            print(f"Warning: '{path}' not found. Skipping.", file=sys.stderr)
+    return fasta_files
+
+
+def load_cache(cache_file):
+    """Reads the statistics cache, returning an empty cache if it is missing or unreadable."""
+    try:
+        with open(cache_file, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache_file, cache):
+    """Writes the cache atomically, so parallel runs never leave a half-written file."""
+    os.makedirs(os.path.dirname(os.path.abspath(cache_file)), exist_ok=True)
+    temp_path = f"{cache_file}.tmp{os.getpid()}"
+    with open(temp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(temp_path, cache_file)
+
+
+def compute_fasta_stats(fasta_files, workers=None, cache_file=DEFAULT_CACHE_FILE):
+    """
+    Computes statistics for many FASTA files in parallel, reusing cached results for unchanged files.
+
+    A cached entry is reused when the file's size and modification time (ns) still match.
+
+    Args:
+        fasta_files (list): FASTA file paths.
+        workers (int): Worker processes. Default: all cores.
+        cache_file (str): JSON cache path. None disables caching.
+
+    Returns:
+        pd.DataFrame: One row per file (indexed by file path) with STAT_COLUMNS.
+    """
+    cache = load_cache(cache_file) if cache_file else {}
+    results = {}
+    to_scan = []
+    for fasta_file in fasta_files:
+        key = os.path.abspath(fasta_file)
+        stat = os.stat(fasta_file)
+        entry = cache.get(key)
+        if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            results[fasta_file] = entry["stats"]
+        else:
+            to_scan.append((fasta_file, key, stat.st_size, stat.st_mtime_ns))
+
+    if to_scan:
+        print(f"Scanning {len(to_scan)} files ({len(results)} cached)...", file=sys.stderr)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scanned = executor.map(scan_fasta, [item[0] for item in to_scan], chunksize=8)
+            for (fasta_file, key, size, mtime_ns), stats in zip(to_scan, scanned):
+                results[fasta_file] = stats
+                cache[key] = {"size": size, "mtime_ns": mtime_ns, "stats": stats}
+        if cache_file:
+            save_cache(cache_file, cache)
+
+    stats_df = pd.DataFrame.from_dict({f: results[f] for f in fasta_files}, orient="index", columns=STAT_COLUMNS)
+    stats_df.index.name = "file"
+    return stats_df
+
+
+def main():
+    """Main function to parse arguments and print FASTA statistics."""
+    parser = argparse.ArgumentParser(
+        description="Length, N50/L50, GC and N-content statistics for FASTA files (files or directories)."
+    )
+    parser.add_argument("paths", nargs="+", help="FASTA files and/or directories containing FASTA files.")
+    parser.add_argument("--output", type=str, default=None, help="Write the statistics table (TSV) to this file.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Default: all cores")
+    parser.add_argument("--cache", type=str, default=DEFAULT_CACHE_FILE,
+                        help=f"Cache file keyed by path, size and mtime. Default: {DEFAULT_CACHE_FILE}")
+    parser.add_argument("--no_cache", action="store_true", help="Ignore and do not update the cache.")
+
+    args = parser.parse_args()
+
+    fasta_files = collect_fasta_files(args.paths)
+    if not fasta_files:
+        print("Error: No FASTA files found.", file=sys.stderr)
+        sys.exit(1)
+
+    stats_df = compute_fasta_stats(fasta_files, args.workers, None if args.no_cache else args.cache)
+
+    if args.output:
+        stats_df.to_csv(args.output, sep="\t")
+        print(f"Statistics table saved to {args.output}", file=sys.stderr)
+    else:
+        print(stats_df.to_csv(sep="\t"), end="")
+
+    total_length = int(stats_df["total_length"].sum())
+    print(f"Total: {len(stats_df)} files, {int(stats_df['records'].sum())} records, {total_length} bp", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+# Gene-tree concordance analysis for the per-gene IQ-TREE trees.
+# Every tree is reduced to its set of bipartitions (splits), each encoded as an integer bitset
+# over the shared taxon set, so tree comparisons become hashed set lookups instead of tree traversals.
+
+import argparse
+import os
+import sys
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from alignment_io import taxon_from_tip_label
+from allele_collapsing import NEWICK_TOKEN_PATTERN
+
+
+def parse_newick_clades(newick_string, taxon_index, strip_gene_prefix=True):
+    """
+    Parses a Newick string into its leaf bitset and the bitsets of all of its clades.
+
+    Taxa get a bit position from taxon_index; unseen taxa are added to it, so the same
+    index can be shared by every tree in a run.
+
+    Args:
+        newick_string (str): A single Newick tree.
+        taxon_index (dict): Mapping of taxon name -> bit position (updated in place).
+        strip_gene_prefix (bool): Passed to taxon_from_tip_label().
+
+    Returns:
+        tuple: (leaf_mask (int), clade_masks (list of int)).
+
+    Raises:
+        ValueError: If the parentheses are unbalanced, or two tips map to the same taxon
+                    (e.g., isolate names containing underscores with strip_gene_prefix=True).
+    """
+    stack = [0]
+    clade_masks = []
+    seen_taxa = 0
+    expect_label = True   # a label directly after '(' or ',' is a tip; after ')' it is a support value
+    after_colon = False
+
+    for token in NEWICK_TOKEN_PATTERN.findall(newick_string):
+        if token.isspace() or token.startswith("["):
+            continue  # whitespace or comment
+        if token == "(":
+            stack.append(0)
+            expect_label = True
+        elif token == ",":
+            expect_label = True
+            after_colon = False
+        elif token == ")":
+            if len(stack) < 2:
+                raise ValueError("Unbalanced parentheses in Newick string.")
+            clade = stack.pop()
+            clade_masks.append(clade)
+            stack[-1] |= clade
+            expect_label = False
+            after_colon = False
+        elif token == ":":
+            after_colon = True
+        elif token == ";":
+            break
+        else:
+            if after_colon:
+                after_colon = False  # branch length
+            elif expect_label:
+                label = token[1:-1].replace("''", "'") if token.startswith("'") else token
+                taxon = taxon_from_tip_label(label, strip_gene_prefix)
+                if taxon not in taxon_index:
+                    taxon_index[taxon] = len(taxon_index)
+                taxon_bit = 1 << taxon_index[taxon]
+                if seen_taxa & taxon_bit:
+                    raise ValueError(f"Taxon '{taxon}' (tip '{label}') occurs more than once in the tree.")
+                seen_taxa |= taxon_bit
+                stack[-1] |= taxon_bit
+                expect_label = False
+            # otherwise an internal node label (e.g., IQ-TREE 'SH-aLRT/UFBoot' support): ignored
+
+    if len(stack) != 1:
+        raise ValueError("Unbalanced parentheses in Newick string.")
+    return stack[0], clade_masks
+
+
+def bipartitions_from_clades(clade_masks, shared_mask):
+    """
+    Converts clade bitsets into canonical, non-trivial unrooted bipartitions over the shared taxa.
+
+    Each split is restricted to shared_mask and stored as the side that does not contain the
+    lowest shared taxon, so both sides of the same split hash to the same integer.
+
+    Args:
+        clade_masks (list of int): Clade bitsets returned by parse_newick_clades().
+        shared_mask (int): Bitset of taxa present in every tree being compared.
+
+    Returns:
+        frozenset: Canonical split bitsets.
+    """
+    anchor_bit = shared_mask & -shared_mask
+    n_shared = bin(shared_mask).count("1")
+    splits = set()
+    for clade in clade_masks:
+        split = clade & shared_mask
+        if split & anchor_bit:
+            split ^= shared_mask
+        size = bin(split).count("1")
+        if 2 <= size <= n_shared - 2:
+            splits.add(split)
+    return frozenset(splits)
+
+
+def load_tree_directory(tree_dir, suffix=".treefile"):
+    """
+    Finds all tree files below tree_dir (e.g., one '<gene>/<gene>.treefile' per core gene).
+
+    '<gene>_unique.treefile' files, the collapsed-allele trees that run_single_gene_phylogeny
+    re-expands into '<gene>.treefile', are skipped so no gene is counted twice.
+
+    Args:
+        tree_dir (str): Directory searched recursively.
+        suffix (str): Tree file extension.
+
+    Returns:
+        dict: Mapping of tree name (file name without suffix) -> file path, sorted by name.
+    """
+    tree_files = {}
+    for root, _, files in os.walk(tree_dir):
+        for fname in files:
+            if fname.endswith(suffix):
+                name = fname[:-len(suffix)]
+                if name.endswith("_unique"):
+                    continue
+                if name in tree_files:
+                    print(f"Warning: Duplicate tree name '{name}' ({os.path.join(root, fname)}). Keeping the first one.", file=sys.stderr)
+                    continue
+                tree_files[name] = os.path.join(root, fname)
+    return dict(sorted(tree_files.items()))
+
+
+def compute_tree_bipartitions(tree_files, strip_gene_prefix=True):
+    """
+    Parses all trees and encodes their bipartitions over the taxa shared by every tree.
+
+    Args:
+        tree_files (dict): Mapping of tree name -> Newick file path.
+        strip_gene_prefix (bool): Passed to taxon_from_tip_label().
+
+    Returns:
+        tuple: (splits_by_tree (dict name -> frozenset of int), shared_taxa (list of str)).
+    """
+    taxon_index = {}
+    parsed = {}
+    for name, path in tree_files.items():
+        with open(path, "r") as f:
+            newick_string = f.read()
+        try:
+            parsed[name] = parse_newick_clades(newick_string, taxon_index, strip_gene_prefix)
+        except ValueError as e:
+            print(f"Error parsing tree '{path}': {e}. Skipping this tree.", file=sys.stderr)
+
+    if not parsed:
+        return {}, []
+
+    shared_mask = -1
+    for leaf_mask, _ in parsed.values():
+        shared_mask &= leaf_mask
+    all_taxa = sorted(taxon_index, key=taxon_index.get)
+    shared_taxa = [taxon for taxon in all_taxa if shared_mask >> taxon_index[taxon] & 1]
+    if len(shared_taxa) < len(all_taxa):
+        print(f"Warning: {len(all_taxa) - len(shared_taxa)} taxa are missing from at least one tree; "
+              f"trees are compared on the {len(shared_taxa)} shared taxa.", file=sys.stderr)
+
+    splits_by_tree = {
+        name: bipartitions_from_clades(clade_masks, shared_mask)
+        for name, (_, clade_masks) in parsed.items()
+    }
+    return splits_by_tree, shared_taxa
+
+
+def robinson_foulds_matrix(splits_by_tree, normalize=True):
+    """
+    Computes all-pairs Robinson-Foulds distances.
+
+    Trees are rows of a sparse tree x split incidence matrix, so the shared split counts for
+    every pair come from one sparse product: RF(a, b) = |A| + |B| - 2|A & B|.
+
+    Args:
+        splits_by_tree (dict): Mapping of tree name -> frozenset of split bitsets.
+        normalize (bool): If True, divide by |A| + |B| so distances fall in [0, 1].
+
+    Returns:
+        pd.DataFrame: Square RF distance matrix indexed by tree name.
+    """
+    names = list(splits_by_tree)
+    split_ids = {}
+    rows, cols = [], []
+    for row, name in enumerate(names):
+        for split in splits_by_tree[name]:
+            rows.append(row)
+            cols.append(split_ids.setdefault(split, len(split_ids)))
+
+    incidence = csr_matrix(
+        (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+        shape=(len(names), max(len(split_ids), 1))
+    )
+    shared = (incidence @ incidence.T).toarray()
+    sizes = np.diag(shared)
+    totals = sizes[:, None] + sizes[None, :]
+    rf = (totals - 2 * shared).astype(float)
+    if normalize:
+        rf = np.divide(rf, totals, out=np.zeros_like(rf), where=totals > 0)
+    return pd.DataFrame(rf, index=names, columns=names)
+
+
+def gene_concordance_factors(reference_splits, gene_splits_by_tree, shared_taxa):
+    """
+    Computes the gene concordance factor (gCF) of every branch in the reference tree.
+
+    gCF is the percentage of gene trees that contain the reference branch's bipartition.
+    Split counts over all gene trees are tallied once, so each branch is a single hash lookup.
+
+    Args:
+        reference_splits (frozenset): Split bitsets of the reference (e.g., concatenated) tree.
+        gene_splits_by_tree (dict): Mapping of gene name -> frozenset of split bitsets.
+        shared_taxa (list): Taxon names in bit order.
+
+    Returns:
+        pd.DataFrame: One row per reference branch with gCF, supporting gene count and the taxa on one side.
+    """
+    split_counts = Counter()
+    for splits in gene_splits_by_tree.values():
+        split_counts.update(splits)
+    n_genes = len(gene_splits_by_tree)
+
+    records = []
+    for split in reference_splits:
+        side_taxa = [taxon for bit, taxon in enumerate(shared_taxa) if split >> bit & 1]
+        supporting = split_counts.get(split, 0)
+        records.append({
+            "split_taxa": ",".join(side_taxa),
+            "split_size": len(side_taxa),
+            "supporting_genes": supporting,
+            "gene_trees": n_genes,
+            "gCF": 100.0 * supporting / n_genes if n_genes else 0.0,
+        })
+    columns = ["split_taxa", "split_size", "supporting_genes", "gene_trees", "gCF"]
+    return pd.DataFrame(records, columns=columns).sort_values(["gCF", "split_size"], ascending=[False, True]).reset_index(drop=True)
+
+
+def main():
+    """Main function to parse arguments and run the concordance analysis."""
+    parser = argparse.ArgumentParser(
+        description="Compare per-gene trees with each other (Robinson-Foulds) and with a reference tree (gene concordance factors)."
+    )
+    parser.add_argument(
+        "tree_dir",
+        type=str,
+        help="Directory searched recursively for gene trees (e.g., the individual core gene tree output directory)."
+    )
+    parser.add_argument(
+        "--reference_tree",
+        type=str,
+        default=None,
+        help="Reference tree (e.g., the concatenated core gene .treefile) for gene concordance factors."
+    )
+    parser.add_argument(
+        "--suffix",
+        type=str,
+        default=".treefile",
+        help="Tree file extension. Default: .treefile"
+    )
+    parser.add_argument(
+        "--keep_tip_labels",
+        action="store_true",
+        help="Do not strip the 'geneName_' prefix from tip labels."
+    )
+    parser.add_argument(
+        "--output_prefix",
+        type=str,
+        default="gene_tree_concordance",
+        help="Prefix for the output files. Default: 'gene_tree_concordance'"
+    )
+    parser.add_argument(
+        "--analysis",
+        type=str,
+        choices=['clustering', 'pcoa', 'both', 'none'],
+        default='both',
+        help="Analysis to run on the RF distance matrix with analyze_aflX_diversity. Default: both"
+    )
+    parser.add_argument(
+        "--linkage_method",
+        type=str,
+        choices=['average', 'complete', 'single', 'ward'],
+        default='average',
+        help="Linkage method for hierarchical clustering. Default: average"
+    )
+
+    args = parser.parse_args()
+    strip_gene_prefix = not args.keep_tip_labels
+
+    tree_files = load_tree_directory(args.tree_dir, args.suffix)
+    if args.reference_tree:
+        reference_path = os.path.abspath(args.reference_tree)
+        tree_files = {name: path for name, path in tree_files.items() if os.path.abspath(path) != reference_path}
+        reference_name = "reference_" + os.path.basename(args.reference_tree).rsplit(".", 1)[0]
+        tree_files[reference_name] = args.reference_tree
+    if len(tree_files) < 2:
+        print(f"Error: Need at least 2 trees, found {len(tree_files)} in '{args.tree_dir}'.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Parsing {len(tree_files)} trees...")
+
+    splits_by_tree, shared_taxa = compute_tree_bipartitions(tree_files, strip_gene_prefix)
+    if len(shared_taxa) < 4:
+        print(f"Error: Only {len(shared_taxa)} taxa are shared by all trees; at least 4 are needed.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Trees share {len(shared_taxa)} taxa.")
+
+    # Robinson-Foulds distances between all trees (including the reference, if given)
+    rf_df = robinson_foulds_matrix(splits_by_tree, normalize=True)
+    rf_file = f"{args.output_prefix}_rf_distance_matrix.csv"
+    rf_df.to_csv(rf_file)
+    robinson_foulds_matrix(splits_by_tree, normalize=False).astype(int).to_csv(f"{args.output_prefix}_rf_counts_matrix.csv")
+    print(f"Normalized Robinson-Foulds distance matrix saved to {rf_file}")
+
+    # Gene concordance factors on the reference tree
+    if args.reference_tree:
+        if reference_name not in splits_by_tree:
+            print(f"Error: The reference tree '{args.reference_tree}' could not be parsed.", file=sys.stderr)
+            sys.exit(1)
+        gene_splits = {name: splits for name, splits in splits_by_tree.items() if name != reference_name}
+        gcf_df = gene_concordance_factors(splits_by_tree[reference_name], gene_splits, shared_taxa)
+        gcf_file = f"{args.output_prefix}_gCF.tsv"
+        gcf_df.to_csv(gcf_file, sep="\t", index=False)
+        print(f"Gene concordance factors for {len(gcf_df)} reference branches saved to {gcf_file}")
+
+    if args.analysis != 'none':
+        # Imported here so the tree parsing and distance functions do not depend on the plotting stack
+        from analyze_aflX_diversity import plot_hierarchical_clustering, plot_pcoa
+    if args.analysis in ['clustering', 'both']:
+        plot_hierarchical_clustering(rf_df, args.linkage_method, f"{args.output_prefix}_dendrogram.png",
+                                     distance_label="Normalized RF Distance", leaf_label="Gene Trees")
+    if args.analysis in ['pcoa', 'both']:
+        plot_pcoa(rf_df, f"{args.output_prefix}_pcoa_plot.png",
+                  distance_basis="Robinson-Foulds Distance", leaf_label="Gene Trees")
+
+    print("\nConcordance analysis complete.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,662 @@
+# Plans the BLAST, extraction and tree stages as cost-balanced HPC job arrays.
+# Work units (gene x sample, or per gene) are enumerated from the existing directory layouts,
+# packed into shards of roughly equal estimated cost, and run either as a PBS/SLURM array
+# (one shard per array task) or locally with a process pool.
+
+import argparse
+import heapq
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from process_supervisor import run_supervised, set_max_heavy_jobs
+
+# Default locations, matching the existing stage scripts
+GENES_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/data/aflatoxin_genes_extracted_from_cluster"
+CONTIGS_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/data/announced-contigs"
+DB_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/data/database_announced_contigs"
+BLAST_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/blastn_aflxGenes_2_contigs"
+EXTRACTED_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/extracted_algnd_aflx_genes"
+CORE_GENES_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/extracted_algnd_aflx_genes/core_aflx_genes_aligned"
+TREE_OUTPUT_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/extracted_algnd_aflx_genes/concatenated_core_genes/phylogenetic_tree/core_individual_gene_trees"
+
+# Environment setup written into the array scripts for each stage. MAFFT and IQ-TREE2 are installed
+# differently across clusters, so the tree stage has no default and needs plan --setup.
+STAGE_SETUP = {
+    "blast": "module load chpc/BIOMODULES\nmodule load ncbi-blast/2.16.0+",
+    "extract": "module load chpc/BIOMODULES\nmodule load ncbi-blast/2.16.0+",
+}
+
+TELEMETRY_COLUMNS = ["unit_id", "stage", "cost", "elapsed_seconds", "status"]
+
+
+# --- Work unit enumeration ---
+
+def fasta_residue_count(fasta_file):
+    """Returns (number of sequences, number of residues) in a FASTA file."""
+    n_seqs = 0
+    n_residues = 0
+    with open(fasta_file, "r") as f:
+        for line in f:
+            if line.startswith(">"):
+                n_seqs += 1
+            else:
+                n_residues += len(line.strip())
+    return n_seqs, n_residues
+
+
+def enumerate_blast_units(dirs, threads):
+    """
+    One unit per gene x sample, as in blastn_aflxCluster_genes_2_contigs.sh.
+    Cost = query length x subject assembly size.
+    """
+    units = []
+    samples = sorted(d for d in os.listdir(dirs["db_dir"]) if os.path.isdir(os.path.join(dirs["db_dir"], d)))
+    for fname in sorted(os.listdir(dirs["genes_dir"])):
+        if not fname.endswith(".fa"):
+            continue
+        gene = fname[:-len(".fa")]
+        gene_file = os.path.join(dirs["genes_dir"], fname)
+        _, query_length = fasta_residue_count(gene_file)
+        for sample in samples:
+            contig_file = os.path.join(dirs["contigs_dir"], f"{sample}.fa")
+            if os.path.exists(contig_file):
+                subject_size = os.path.getsize(contig_file)
+            else:
+                sample_db_dir = os.path.join(dirs["db_dir"], sample)
+                subject_size = sum(os.path.getsize(os.path.join(sample_db_dir, f)) for f in os.listdir(sample_db_dir))
+            units.append({
+                "unit_id": f"blast:{gene}:{sample}",
+                "stage": "blast",
+                "params": {
+                    "gene_file": gene_file,
+                    "db_prefix": os.path.join(dirs["db_dir"], sample, f"Aspergillus_contig_{sample}"),
+                    "threads": threads,
+                },
+                "outputs": [os.path.join(dirs["blast_dir"], sample, f"BLASTN_{gene}_{sample}.tab")],
+                "cost": float(max(query_length, 1) * max(subject_size, 1)),
+            })
+    return units
+
+
+def enumerate_extract_units(dirs, threads):
+    """
+    One unit per BLASTN_<gene>_<sample>.tab table, as in extract_aflx_genes_from_alignment.sh.
+    Cost = number of hits (one blastdbcmd call each).
+    """
+    units = []
+    for sample in sorted(os.listdir(dirs["blast_dir"])):
+        sample_path = os.path.join(dirs["blast_dir"], sample)
+        if not os.path.isdir(sample_path):
+            continue
+        suffix = f"_{sample}.tab"
+        for fname in sorted(os.listdir(sample_path)):
+            if not (fname.startswith("BLASTN_") and fname.endswith(suffix)):
+                continue
+            gene = fname[len("BLASTN_"):-len(suffix)]
+            blast_file = os.path.join(sample_path, fname)
+            with open(blast_file, "r") as f:
+                n_hits = sum(1 for line in f if line.strip() and not line.startswith("#"))
+            units.append({
+                "unit_id": f"extract:{gene}:{sample}",
+                "stage": "extract",
+                "params": {
+                    "blast_file": blast_file,
+                    "gene": gene,
+                    "db_prefix": os.path.join(dirs["db_dir"], sample, f"Aspergillus_contig_{sample}"),
+                },
+                "outputs": [os.path.join(dirs["extracted_dir"], sample, f"Extracted_{gene}_{sample}.fa")],
+                "cost": float(n_hits + 1),
+            })
+    return units
+
+
+def enumerate_tree_units(dirs, threads):
+    """
+    One unit per core gene directory, as in tree_and_alignment_for_individual_core_aflXgenes.py.
+    Cost = number of sequences x total residues (MAFFT/IQ-TREE scale super-linearly with taxa).
+    """
+    units = []
+    for gene in sorted(os.listdir(dirs["core_genes_dir"])):
+        gene_dir = os.path.join(dirs["core_genes_dir"], gene)
+        if not os.path.isdir(gene_dir):
+            continue
+        n_seqs = 0
+        n_residues = 0
+        for fname in os.listdir(gene_dir):
+            if fname.startswith(f"Extracted_{gene}_") and (fname.endswith(".fa") or fname.endswith(".fasta")):
+                seqs, residues = fasta_residue_count(os.path.join(gene_dir, fname))
+                n_seqs += seqs
+                n_residues += residues
+        if n_seqs < 2:
+            continue
+        units.append({
+            "unit_id": f"tree:{gene}",
+            "stage": "tree",
+            "params": {
+                "core_gene_dir": gene_dir,
+                "output_base_dir": dirs["tree_output_dir"],
+                "gene_name": gene,
+                "threads": threads,
+            },
+            "outputs": [os.path.join(dirs["tree_output_dir"], gene, f"{gene}.treefile")],
+            "cost": float(n_seqs * n_residues),
+        })
+    return units
+
+
+STAGE_ENUMERATORS = {
+    "blast": enumerate_blast_units,
+    "extract": enumerate_extract_units,
+    "tree": enumerate_tree_units,
+}
+
+
+# --- Cost model and packing ---
+
+def load_telemetry(telemetry_file):
+    """Reads the telemetry TSV written by merge_outputs(). Returns a list of row dicts."""
+    if not telemetry_file or not os.path.exists(telemetry_file):
+        return []
+    rows = []
+    with open(telemetry_file, "r") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        for line in f:
+            values = line.rstrip("\n").split("\t")
+            if len(values) == len(header):
+                rows.append(dict(zip(header, values)))
+    return rows
+
+
+def estimate_unit_seconds(units, telemetry_rows):
+    """
+    Sets 'estimated_seconds' on every unit from past telemetry.
+
+    A unit that ran successfully before reuses its last measured time. Other units are scaled by the
+    stage's median seconds-per-cost over past successful runs. Without any telemetry for the stage,
+    the raw cost is used (only the relative sizes matter for packing).
+
+    Args:
+        units (list): Work units from one of the enumerate_*_units() functions.
+        telemetry_rows (list): Rows returned by load_telemetry().
+
+    Returns:
+        bool: True if the estimates are calibrated in seconds.
+    """
+    measured = {}
+    rates = {}
+    for row in telemetry_rows:
+        if row.get("status") != "ok":
+            continue
+        try:
+            elapsed = float(row["elapsed_seconds"])
+            cost = float(row["cost"])
+        except (KeyError, ValueError):
+            continue
+        measured[row["unit_id"]] = elapsed
+        if cost > 0:
+            rates.setdefault(row["stage"], []).append(elapsed / cost)
+
+    calibrated = True
+    for unit in units:
+        if unit["unit_id"] in measured:
+            unit["estimated_seconds"] = measured[unit["unit_id"]]
+        elif unit["stage"] in rates:
+            unit["estimated_seconds"] = unit["cost"] * statistics.median(rates[unit["stage"]])
+        else:
+            calibrated = False
+    if not calibrated:
+        # Mixing seconds and raw costs would skew the packing, so fall back to raw costs everywhere
+        for unit in units:
+            unit["estimated_seconds"] = unit["cost"]
+    return calibrated
+
+
+def pack_units_into_shards(units, n_shards):
+    """
+    Longest-processing-time-first packing: each unit, largest first, goes to the least loaded shard.
+
+    Args:
+        units (list): Work units with 'estimated_seconds' set.
+        n_shards (int): Number of shards (array tasks).
+
+    Returns:
+        list: Shards, each a dict with 'units' and total 'estimated_seconds'.
+    """
+    n_shards = max(1, min(n_shards, len(units)))
+    shards = [{"shard": i, "estimated_seconds": 0.0, "units": []} for i in range(n_shards)]
+    heap = [(0.0, i) for i in range(n_shards)]
+    for unit in sorted(units, key=lambda u: u["estimated_seconds"], reverse=True):
+        load, shard_index = heapq.heappop(heap)
+        shards[shard_index]["units"].append(unit)
+        shards[shard_index]["estimated_seconds"] = load + unit["estimated_seconds"]
+        heapq.heappush(heap, (shards[shard_index]["estimated_seconds"], shard_index))
+    return shards
+
+
+# --- Array script emission ---
+
+def format_walltime(seconds):
+    """Formats seconds as HH:MM:SS."""
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{(seconds % 3600) // 60:02d}:{seconds % 60:02d}"
+
+
+def write_array_script(plan, plan_file, scheduler, walltime, ncpus, mem_gb, project, queue, setup):
+    """
+    Writes a PBS or SLURM array script in which each task runs the shard matching its array index.
+
+    Each task gets its own heavy-tool slot directory: tasks already have their own CPU allocation,
+    so tasks sharing a node must not queue behind each other's MAFFT/IQ-TREE slots.
+
+    Args:
+        setup (str): Shell lines loading the stage's tools (e.g., 'module load ...').
+
+    Returns:
+        str: Path of the written script.
+    """
+    n_shards = len(plan["shards"])
+    job_name = f"{plan['stage']}_array"
+    planner_path = os.path.abspath(__file__)
+    lines = ["#!/bin/bash"]
+    if scheduler == "pbs":
+        lines += [
+            f"#PBS -l select=1:ncpus={ncpus}:mem={mem_gb}gb",
+            f"#PBS -N {job_name}",
+            f"#PBS -q {queue}",
+            f"#PBS -P {project}",
+            f"#PBS -l walltime={walltime}",
+        ]
+        # PBS Pro rejects single-element arrays, so a one-shard plan is submitted as a plain job
+        if n_shards > 1:
+            lines.append(f"#PBS -J 0-{n_shards - 1}")
+        index_variable = "${PBS_ARRAY_INDEX:-0}"
+        job_variable = "${PBS_JOBID}"
+        workdir = 'cd "$PBS_O_WORKDIR"'
+    else:
+        lines += [
+            f"#SBATCH --job-name={job_name}",
+            f"#SBATCH --cpus-per-task={ncpus}",
+            f"#SBATCH --mem={mem_gb}G",
+            f"#SBATCH --time={walltime}",
+            f"#SBATCH --array=0-{n_shards - 1}",
+        ]
+        if queue:
+            lines.append(f"#SBATCH --partition={queue}")
+        if project:
+            lines.append(f"#SBATCH --account={project}")
+        index_variable = "${SLURM_ARRAY_TASK_ID:-0}"
+        job_variable = "${SLURM_JOB_ID}"
+        workdir = 'cd "$SLURM_SUBMIT_DIR"'
+
+    lines += [
+        "",
+        f"# Generated by job_array_planner.py: {n_shards} shards, {sum(len(s['units']) for s in plan['shards'])} units",
+        setup,
+        "",
+        workdir,
+        f'export AFLX_HEAVY_JOBS_DIR="${{TMPDIR:-/tmp}}/aflx_heavy_job_slots_{job_variable}_{index_variable}"',
+        f'python "{planner_path}" run-shard "{os.path.abspath(plan_file)}" {index_variable}',
+        "",
+        f"# After all tasks finish: python \"{planner_path}\" merge \"{os.path.abspath(plan_file)}\"",
+        "",
+    ]
+    script_path = os.path.join(os.path.dirname(os.path.abspath(plan_file)), f"{plan['stage']}_array.{scheduler}.sh")
+    with open(script_path, "w") as f:
+        f.write("\n".join(lines))
+    return script_path
+
+
+def create_plan(stage, dirs, plan_dir, n_shards, threads=1, telemetry_file=None, skip_existing=False,
+                timeout_hours=None, max_memory_gb=None):
+    """
+    Enumerates, costs and packs the work units of one stage and writes plan.json into plan_dir.
+
+    Args:
+        stage (str): 'blast', 'extract' or 'tree'.
+        dirs (dict): Input/output directories (see the module-level defaults).
+        plan_dir (str): Directory for the plan, logs and per-shard telemetry.
+        n_shards (int): Number of shards (array tasks).
+        threads (int): Threads given to each tool invocation inside a task.
+        telemetry_file (str): TSV of past runs used to calibrate cost estimates.
+        skip_existing (bool): Leave out units whose outputs already exist and are non-empty.
+        timeout_hours (float): Wall-clock limit for each supervised tool run (blastn, MAFFT, IQ-TREE2).
+        max_memory_gb (float): Memory limit for each supervised tool run.
+
+    Returns:
+        tuple: (plan dict, path of plan.json).
+    """
+    # Array tasks may start in another working directory, so store absolute paths in the plan
+    dirs = {key: os.path.abspath(path) for key, path in dirs.items()}
+    units = STAGE_ENUMERATORS[stage](dirs, threads)
+    for unit in units:
+        unit["params"].update(timeout_hours=timeout_hours, max_memory_gb=max_memory_gb)
+    if skip_existing:
+        units = [u for u in units if not all(os.path.exists(p) and os.path.getsize(p) > 0 for p in u["outputs"])]
+    if not units:
+        print(f"Warning: No work units found for stage '{stage}'.", file=sys.stderr)
+
+    calibrated = estimate_unit_seconds(units, load_telemetry(telemetry_file))
+    shards = pack_units_into_shards(units, n_shards) if units else []
+
+    plan = {
+        "stage": stage,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "dirs": dirs,
+        "plan_dir": os.path.abspath(plan_dir),
+        "threads": threads,
+        "calibrated": calibrated,
+        "shards": shards,
+    }
+    os.makedirs(plan_dir, exist_ok=True)
+    plan_file = os.path.join(plan_dir, "plan.json")
+    with open(plan_file, "w") as f:
+        json.dump(plan, f, indent=1)
+
+    loads = [s["estimated_seconds"] for s in shards]
+    unit_label = "s" if calibrated else "cost units"
+    print(f"Planned {len(units)} '{stage}' units into {len(shards)} shards: {plan_file}")
+    if loads:
+        print(f"Estimated shard load ({unit_label}): max {max(loads):.1f}, mean {statistics.mean(loads):.1f}")
+    return plan, plan_file
+
+
+# --- Execution ---
+
+def run_blast_unit(unit, log_path):
+    """Runs blastn for one gene x sample with the options of blastn_aflxCluster_genes_2_contigs.sh."""
+    params = unit["params"]
+    output_file = unit["outputs"][0]
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    blast_command = [
+        "blastn",
+        "-query", params["gene_file"],
+        "-db", params["db_prefix"],
+        "-out", output_file,
+        "-outfmt", "7", "-num_threads", str(params["threads"]), "-mt_mode", "0", "-perc_identity", "90",
+    ]
+    timeout_hours = params.get("timeout_hours")
+    run_supervised(blast_command, log_path, heavy=False,
+                   timeout_seconds=timeout_hours * 3600 if timeout_hours else None,
+                   max_memory_gb=params.get("max_memory_gb"))
+
+
+def run_extract_unit(unit, log_path):
+    """Extracts every hit region with blastdbcmd, writing the same headers as extract_aflx_genes_from_alignment.sh."""
+    params = unit["params"]
+    output_fasta = unit["outputs"][0]
+    os.makedirs(os.path.dirname(output_fasta), exist_ok=True)
+    with open(params["blast_file"], "r") as blast_in, open(output_fasta, "w") as fasta_out, open(log_path, "w") as log:
+        for line in blast_in:
+            if not line.strip() or line.startswith("#"):
+                continue
+            # qseqid sseqid pident length mismatch gapopen qstart qend sstart send evalue bitscore
+            fields = line.split()
+            sseqid = fields[1]
+            sstart, send = int(fields[8]), int(fields[9])
+            start, end = min(sstart, send), max(sstart, send)
+            result = subprocess.run(
+                ["blastdbcmd", "-db", params["db_prefix"], "-entry", sseqid, "-range", f"{start}-{end}"],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            )
+            region_lines = result.stdout.splitlines()[1:]
+            if result.returncode != 0 or not region_lines:
+                log.write(f"Warning: No region extracted for {sseqid} in {params['blast_file']}: {result.stderr.strip()}\n")
+                continue
+            fasta_out.write(f">{params['gene']}_{sseqid}_{start}-{end}\n")
+            fasta_out.write("\n".join(region_lines) + "\n")
+
+
+def run_tree_unit(unit, log_path):
+    """Runs MAFFT and IQ-TREE2 for one core gene (tool output goes to the supervisor logs in the gene directory)."""
+    # Imported here so BLAST/extraction tasks do not depend on the tree script
+    from tree_and_alignment_for_individual_core_aflXgenes import run_single_gene_phylogeny
+    params = unit["params"]
+    run_single_gene_phylogeny(
+        params["core_gene_dir"],
+        params["output_base_dir"],
+        params["gene_name"],
+        threads=params["threads"],
+        timeout_hours=params.get("timeout_hours"),
+        max_memory_gb=params.get("max_memory_gb")
+    )
+
+
+STAGE_RUNNERS = {
+    "blast": run_blast_unit,
+    "extract": run_extract_unit,
+    "tree": run_tree_unit,
+}
+
+
+def shard_telemetry_path(plan, shard_index):
+    """Returns the telemetry file written by one shard."""
+    return os.path.join(plan["plan_dir"], "telemetry", f"shard_{shard_index}.tsv")
+
+
+def run_shard(plan_file, shard_index):
+    """
+    Runs every unit of one shard in turn and records per-unit telemetry.
+
+    A failing unit is recorded and does not stop the rest of the shard.
+
+    Args:
+        plan_file (str): Path to plan.json.
+        shard_index (int): Shard to run (the array task index).
+
+    Returns:
+        int: Number of failed units.
+    """
+    with open(plan_file, "r") as f:
+        plan = json.load(f)
+    if not 0 <= shard_index < len(plan["shards"]):
+        print(f"Error: Shard index {shard_index} is out of range (plan has {len(plan['shards'])} shards).", file=sys.stderr)
+        return 1
+    shard = plan["shards"][shard_index]
+    runner = STAGE_RUNNERS[plan["stage"]]
+    log_dir = os.path.join(plan["plan_dir"], "logs")
+    telemetry_path = shard_telemetry_path(plan, shard_index)
+    os.makedirs(log_dir, exist_ok=True)
+    os.makedirs(os.path.dirname(telemetry_path), exist_ok=True)
+
+    print(f"Running shard {shard_index} with {len(shard['units'])} units (estimated {shard['estimated_seconds']:.1f}).")
+    n_failed = 0
+    with open(telemetry_path, "w") as telemetry:
+        telemetry.write("\t".join(TELEMETRY_COLUMNS) + "\n")
+        for unit in shard["units"]:
+            log_path = os.path.join(log_dir, unit["unit_id"].replace(":", "__") + ".log")
+            start_time = time.monotonic()
+            try:
+                runner(unit, log_path)
+                ok = all(os.path.exists(p) and os.path.getsize(p) > 0 for p in unit["outputs"])
+                status = "ok" if ok else "missing_output"
+            except Exception as e:
+                print(f"Error: Unit {unit['unit_id']} failed: {e}", file=sys.stderr)
+                status = "failed"
+            elapsed = time.monotonic() - start_time
+            if status != "ok":
+                n_failed += 1
+            print(f"  {unit['unit_id']}: {status} in {elapsed:.1f}s")
+            telemetry.write(f"{unit['unit_id']}\t{unit['stage']}\t{unit['cost']}\t{elapsed:.3f}\t{status}\n")
+            telemetry.flush()
+    return n_failed
+
+
+def default_local_workers(threads):
+    """Number of shards that fit on this node when every tool invocation uses `threads` threads."""
+    return max(1, (os.cpu_count() or 1) // max(1, threads))
+
+
+def _init_local_worker(max_workers):
+    # Every worker runs one shard at a time, so up to max_workers heavy tools can run at once
+    # without oversubscribing the node; an explicit AFLX_MAX_HEAVY_JOBS still takes precedence.
+    if "AFLX_MAX_HEAVY_JOBS" not in os.environ:
+        set_max_heavy_jobs(max_workers)
+
+
+def run_local(plan_file, max_workers=None):
+    """
+    Local executor backend: runs all shards with a process pool, then merges.
+
+    Args:
+        plan_file (str): Path to plan.json.
+        max_workers (int): Number of shards run at the same time.
+                           Default: CPU cores // threads per tool invocation.
+    """
+    with open(plan_file, "r") as f:
+        plan = json.load(f)
+    n_shards = len(plan["shards"])
+    if max_workers is None:
+        max_workers = default_local_workers(plan.get("threads", 1))
+    print(f"Running {n_shards} shards with {max_workers} concurrent workers ({plan.get('threads', 1)} threads each).")
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_local_worker,
+                             initargs=(max_workers,)) as executor:
+        list(executor.map(run_shard, [plan_file] * n_shards, range(n_shards)))
+    return merge_outputs(plan_file)
+
+
+def merge_outputs(plan_file, telemetry_file=None):
+    """
+    Collects the results of all shards: adds per-shard telemetry to the telemetry file,
+    writes the merged output manifest and lists units to resubmit.
+
+    The telemetry file keeps one row per unit_id (the latest run), so merging the same plan
+    again does not duplicate rows and skew the cost calibration.
+
+    Args:
+        plan_file (str): Path to plan.json.
+        telemetry_file (str): Telemetry TSV to update. Default: <plan_dir>/telemetry.tsv
+
+    Returns:
+        int: Number of units that did not produce their outputs.
+    """
+    with open(plan_file, "r") as f:
+        plan = json.load(f)
+    telemetry_file = telemetry_file or os.path.join(plan["plan_dir"], "telemetry.tsv")
+
+    recorded = {}
+    for shard in plan["shards"]:
+        for row in load_telemetry(shard_telemetry_path(plan, shard["shard"])):
+            recorded[row["unit_id"]] = row
+
+    telemetry_rows = {row["unit_id"]: row for row in load_telemetry(telemetry_file) if "unit_id" in row}
+    telemetry_rows.update(recorded)
+    telemetry_dir = os.path.dirname(os.path.abspath(telemetry_file))
+    os.makedirs(telemetry_dir, exist_ok=True)
+    temp_path = f"{telemetry_file}.tmp{os.getpid()}"
+    with open(temp_path, "w") as telemetry:
+        telemetry.write("\t".join(TELEMETRY_COLUMNS) + "\n")
+        for row in telemetry_rows.values():
+            telemetry.write("\t".join(row.get(c, "") for c in TELEMETRY_COLUMNS) + "\n")
+    os.replace(temp_path, telemetry_file)
+
+    manifest_path = os.path.join(plan["plan_dir"], "outputs_manifest.tsv")
+    failed_path = os.path.join(plan["plan_dir"], "failed_units.txt")
+    failed = []
+    with open(manifest_path, "w") as manifest:
+        manifest.write("unit_id\tshard\tstatus\toutput\n")
+        for shard in plan["shards"]:
+            for unit in shard["units"]:
+                row = recorded.get(unit["unit_id"])
+                outputs_ok = all(os.path.exists(p) and os.path.getsize(p) > 0 for p in unit["outputs"])
+                status = row["status"] if row is not None else "not_run"
+                if not outputs_ok:
+                    failed.append(unit["unit_id"])
+                    if status == "ok":
+                        status = "missing_output"
+                for output in unit["outputs"]:
+                    manifest.write(f"{unit['unit_id']}\t{shard['shard']}\t{status}\t{output}\n")
+
+    with open(failed_path, "w") as f:
+        f.write("\n".join(failed) + ("\n" if failed else ""))
+
+    n_units = sum(len(s["units"]) for s in plan["shards"])
+    print(f"Merged {len(recorded)}/{n_units} unit records into {telemetry_file}")
+    print(f"Output manifest: {manifest_path}")
+    if failed:
+        print(f"Warning: {len(failed)} units have missing outputs; see {failed_path}", file=sys.stderr)
+    return len(failed)
+
+
+def main():
+    """Main function to parse arguments and plan, run or merge a job array."""
+    parser = argparse.ArgumentParser(
+        description="Plan BLAST, extraction and tree stages as cost-balanced job arrays and run or merge them."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = subparsers.add_parser("plan", help="Enumerate, cost and pack work units; write plan.json and an array script.")
+    plan_parser.add_argument("stage", choices=sorted(STAGE_ENUMERATORS), help="Pipeline stage to plan.")
+    plan_parser.add_argument("plan_dir", type=str, help="Directory for the plan, logs and telemetry.")
+    plan_parser.add_argument("--n_shards", type=int, default=16, help="Number of array tasks. Default: 16")
+    plan_parser.add_argument("--threads", type=int, default=24, help="Threads per tool invocation. Default: 24")
+    plan_parser.add_argument("--telemetry", type=str, default=None, help="Telemetry TSV from earlier runs for cost calibration.")
+    plan_parser.add_argument("--skip_existing", action="store_true", help="Skip units whose outputs already exist.")
+    plan_parser.add_argument("--scheduler", choices=["pbs", "slurm"], default="pbs", help="Array script flavour. Default: pbs")
+    plan_parser.add_argument("--walltime", type=str, default=None,
+                             help="Walltime per task (HH:MM:SS). Default: 1.5x the largest calibrated shard, else 48:00:00")
+    plan_parser.add_argument("--mem_gb", type=int, default=120, help="Memory per task in GB. Default: 120")
+    plan_parser.add_argument("--project", type=str, default="CBBI1470", help="PBS project / SLURM account. Default: CBBI1470")
+    plan_parser.add_argument("--queue", type=str, default="normal", help="PBS queue / SLURM partition. Default: normal")
+    plan_parser.add_argument("--setup", type=str, default=None,
+                             help="Shell lines loading the tools in each array task (e.g., 'module load mafft'). "
+                                  "Required for the tree stage; default for blast/extract: the ncbi-blast module")
+    plan_parser.add_argument("--timeout_hours", type=float, default=None,
+                             help="Wall-clock limit per blastn/MAFFT/IQ-TREE2 run. Default: none")
+    plan_parser.add_argument("--max_memory_gb", type=float, default=None,
+                             help="Memory limit per blastn/MAFFT/IQ-TREE2 run. Default: none")
+    plan_parser.add_argument("--genes_dir", default=GENES_DIR)
+    plan_parser.add_argument("--contigs_dir", default=CONTIGS_DIR)
+    plan_parser.add_argument("--db_dir", default=DB_DIR)
+    plan_parser.add_argument("--blast_dir", default=BLAST_DIR)
+    plan_parser.add_argument("--extracted_dir", default=EXTRACTED_DIR)
+    plan_parser.add_argument("--core_genes_dir", default=CORE_GENES_DIR)
+    plan_parser.add_argument("--tree_output_dir", default=TREE_OUTPUT_DIR)
+
+    shard_parser = subparsers.add_parser("run-shard", help="Run one shard (called by each array task).")
+    shard_parser.add_argument("plan_file", type=str)
+    shard_parser.add_argument("shard_index", type=int)
+
+    local_parser = subparsers.add_parser("run-local", help="Run all shards on this node with a process pool, then merge.")
+    local_parser.add_argument("plan_file", type=str)
+    local_parser.add_argument("--max_workers", type=int, default=None,
+                              help="Concurrent shards. Default: CPU cores // threads per tool invocation")
+
+    merge_parser = subparsers.add_parser("merge", help="Collect shard telemetry and outputs after all tasks finish.")
+    merge_parser.add_argument("plan_file", type=str)
+    merge_parser.add_argument("--telemetry", type=str, default=None, help="Telemetry TSV to update. Default: <plan_dir>/telemetry.tsv")
+
+    args = parser.parse_args()
+
+    if args.command == "plan":
+        setup = args.setup if args.setup is not None else STAGE_SETUP.get(args.stage)
+        if setup is None:
+            print(f"Error: --setup is required for the '{args.stage}' stage (shell lines loading its tools).", file=sys.stderr)
+            sys.exit(1)
+        dirs = {key: getattr(args, key) for key in
+                ["genes_dir", "contigs_dir", "db_dir", "blast_dir", "extracted_dir", "core_genes_dir", "tree_output_dir"]}
+        plan, plan_file = create_plan(args.stage, dirs, args.plan_dir, args.n_shards, args.threads,
+                                      args.telemetry, args.skip_existing, args.timeout_hours, args.max_memory_gb)
+        if not plan["shards"]:
+            sys.exit(1)
+        walltime = args.walltime
+        if walltime is None:
+            longest = max(s["estimated_seconds"] for s in plan["shards"])
+            walltime = format_walltime(max(longest * 1.5, 600)) if plan["calibrated"] else "48:00:00"
+        script_path = write_array_script(plan, plan_file, args.scheduler, walltime, args.threads,
+                                         args.mem_gb, args.project, args.queue, setup)
+        print(f"Array script written to {script_path}")
+    elif args.command == "run-shard":
+        sys.exit(1 if run_shard(args.plan_file, args.shard_index) else 0)
+    elif args.command == "run-local":
+        sys.exit(1 if run_local(args.plan_file, args.max_workers) else 0)
+    elif args.command == "merge":
+        sys.exit(1 if merge_outputs(args.plan_file, args.telemetry) else 0)
+
+
+if __name__ == "__main__":
+    main()
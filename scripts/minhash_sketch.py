@@ -0,0 +1,313 @@
+# MinHash (bottom-k) sketches of canonical k-mers straight from the announced contig assemblies.
+# Gives whole-genome (or aflatoxin-cluster-region) Jaccard and Mash distances between isolates without the
+# makeblastdb -> blastn -> blastdbcmd -> presence/absence chain. The distance matrices are written in the
+# same CSV layout as jaccard_distance.py, so analyze_aflX_diversity.py can read them directly.
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+CONTIGS_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/data/announced-contigs"
+SKETCH_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/minhash_sketches"
+BED_DIR = "/mnt/lustre/users/maloo/allan_project/allan-George/analysis/bed_files_aflx"
+
+CHUNK_BASES = 8 * 1024 * 1024  # bases hashed per NumPy pass
+
+# A/C/G/T (either case) -> 0..3, anything else (N, IUPAC codes) -> 4, which breaks k-mers
+BASE_CODES = np.full(256, 4, dtype=np.uint8)
+for _code, _bases in enumerate(("Aa", "Cc", "Gg", "Tt")):
+    for _base in _bases:
+        BASE_CODES[ord(_base)] = _code
+
+
+def mix_hash(values, seed):
+    """SplitMix64 finalizer applied element-wise to uint64 k-mer codes (wrapping arithmetic)."""
+    with np.errstate(over="ignore"):
+        z = values + np.uint64((0x9E3779B97F4A7C15 * (seed + 1)) & 0xFFFFFFFFFFFFFFFF)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def canonical_kmer_hashes(codes, k, seed):
+    """
+    Hashes every valid canonical k-mer of a 2-bit encoded sequence.
+
+    Forward and reverse-complement k-mer integers are built with k shifted vector ORs over the
+    whole array (a vectorized rolling hash); windows containing a non-ACGT base are dropped.
+
+    Args:
+        codes (np.ndarray): uint8 base codes (0-3 for ACGT, 4 for other symbols).
+        k (int): k-mer length (at most 31).
+        seed (int): Hash seed.
+
+    Returns:
+        np.ndarray: uint64 hashes of the canonical k-mers.
+    """
+    n_windows = len(codes) - k + 1
+    if n_windows <= 0:
+        return np.empty(0, dtype=np.uint64)
+
+    invalid = np.concatenate(([0], np.cumsum(codes == 4)))
+    valid = (invalid[k:] - invalid[:-k]) == 0
+
+    bases = np.minimum(codes, 3).astype(np.uint64)
+    complement = np.uint64(3) - bases
+    forward = np.zeros(n_windows, dtype=np.uint64)
+    reverse = np.zeros(n_windows, dtype=np.uint64)
+    for j in range(k):
+        forward = (forward << np.uint64(2)) | bases[j:j + n_windows]
+        reverse |= complement[j:j + n_windows] << np.uint64(2 * j)
+    canonical = np.minimum(forward, reverse)[valid]
+    return mix_hash(canonical, seed)
+
+
+def read_bed_regions(bed_files, one_based_start=False):
+    """
+    Reads (contig, start, end) intervals from BED files into one dict contig -> list of (start, end).
+
+    Args:
+        bed_files (list): BED files whose intervals are merged (e.g., one per gene cluster for an isolate).
+        one_based_start (bool): The start column holds a 1-based position, as in the BED files written by
+                                bed_files_creation.sh from the BLAST sstart/send; converted to 0-based half-open.
+
+    Returns:
+        dict: contig -> list of 0-based half-open (start, end) intervals.
+    """
+    regions = {}
+    for bed_file in bed_files:
+        with open(bed_file, "r") as f:
+            for line in f:
+                if not line.strip() or line.startswith(("#", "track", "browser")):
+                    continue
+                fields = line.split()
+                start = int(fields[1]) - 1 if one_based_start else int(fields[1])
+                regions.setdefault(fields[0], []).append((start, int(fields[2])))
+    return regions
+
+
+def iter_fasta_records(fasta_file):
+    """Streams (record id, sequence bytes) from a FASTA file one record at a time."""
+    name = None
+    chunks = []
+    with open(fasta_file, "rb") as f:
+        for line in f:
+            if line.startswith(b">"):
+                if name is not None:
+                    yield name, b"".join(chunks)
+                name = line[1:].split()[0].decode() if line[1:].split() else ""
+                chunks = []
+            else:
+                chunks.append(line.strip())
+    if name is not None:
+        yield name, b"".join(chunks)
+
+
+def sketch_fasta(fasta_file, k=21, sketch_size=5000, seed=42, regions=None):
+    """
+    Builds a bottom-k MinHash sketch of a FASTA file's canonical k-mers.
+
+    Records are streamed one at a time and hashed in chunks; after the sketch is full only hashes
+    below its current maximum are kept from each chunk, so memory stays at one chunk plus the sketch.
+
+    Args:
+        fasta_file (str): Contig FASTA file.
+        k (int): k-mer length.
+        sketch_size (int): Number of smallest distinct hashes kept.
+        seed (int): Hash seed (sketches are only comparable with the same k and seed).
+        regions (dict): Optional contig -> [(start, end)] (BED, 0-based half-open) restricting the sketch.
+
+    Returns:
+        np.ndarray: Sorted uint64 sketch.
+    """
+    sketch = np.empty(0, dtype=np.uint64)
+
+    def add_segment(segment):
+        nonlocal sketch
+        codes_all = BASE_CODES[np.frombuffer(segment, dtype=np.uint8)]
+        # Chunks overlap by k-1 bases so no k-mer is lost at a chunk boundary
+        for start in range(0, max(len(codes_all) - k + 1, 1), CHUNK_BASES):
+            hashes = canonical_kmer_hashes(codes_all[start:start + CHUNK_BASES + k - 1], k, seed)
+            if len(sketch) >= sketch_size:
+                hashes = hashes[hashes < sketch[-1]]
+            if len(hashes):
+                sketch = np.unique(np.concatenate((sketch, hashes)))[:sketch_size]
+
+    for record_id, sequence in iter_fasta_records(fasta_file):
+        if regions is None:
+            add_segment(sequence)
+        else:
+            for start, end in regions.get(record_id, []):
+                add_segment(sequence[max(start, 0):end])
+    return sketch
+
+
+def load_or_build_sketch(fasta_file, sketch_file, k, sketch_size, seed, bed_files=None, one_based_bed=False):
+    """
+    Returns the sketch for fasta_file, rebuilding it only when the stored one is stale.
+
+    A stored sketch is reused if its parameters match and the FASTA (and BED) sizes and mtimes are unchanged.
+    Runs in a worker process.
+
+    Args:
+        bed_files (list): Optional BED files restricting the sketch to their merged regions.
+        one_based_bed (bool): Passed to read_bed_regions() as one_based_start.
+
+    Returns:
+        tuple: (sketch_file, np.ndarray sketch, bool rebuilt)
+    """
+    sources = [fasta_file] + list(bed_files or [])
+    fingerprint = np.array([v for p in sources for v in (os.path.getsize(p), os.stat(p).st_mtime_ns)], dtype=np.int64)
+    params = np.array([k, sketch_size, seed, int(one_based_bed)], dtype=np.int64)
+
+    if os.path.exists(sketch_file):
+        try:
+            with np.load(sketch_file) as stored:
+                if np.array_equal(stored["params"], params) and np.array_equal(stored["fingerprint"], fingerprint):
+                    return sketch_file, stored["hashes"], False
+        except (OSError, KeyError, ValueError):
+            pass
+
+    regions = read_bed_regions(bed_files, one_based_bed) if bed_files else None
+    sketch = sketch_fasta(fasta_file, k, sketch_size, seed, regions)
+    np.savez(sketch_file, hashes=sketch, params=params, fingerprint=fingerprint)
+    return sketch_file, sketch, True
+
+
+def bottom_k_jaccard(sketch_a, sketch_b, sketch_size):
+    """
+    Estimates the Jaccard index of two sets from their sorted bottom-k sketches.
+
+    The estimate is the fraction of the bottom-k of the union that is present in both sketches.
+    """
+    if len(sketch_a) == 0 or len(sketch_b) == 0:
+        return 0.0
+    union_bottom = np.union1d(sketch_a, sketch_b)[:sketch_size]
+    shared = np.intersect1d(sketch_a, sketch_b, assume_unique=True)
+    shared_in_bottom = np.searchsorted(shared, union_bottom[-1], side="right")
+    return shared_in_bottom / len(union_bottom)
+
+
+# Sketches are handed to each worker once through the pool initializer instead of once per row
+_worker_sketches = None
+_worker_sketch_size = None
+
+
+def _init_distance_worker(sketches, sketch_size):
+    global _worker_sketches, _worker_sketch_size
+    _worker_sketches = sketches
+    _worker_sketch_size = sketch_size
+
+
+def _jaccard_row(i):
+    sketches = _worker_sketches
+    return i, [bottom_k_jaccard(sketches[i], sketches[j], _worker_sketch_size) for j in range(i + 1, len(sketches))]
+
+
+def pairwise_distances(sketches, names, k, sketch_size, workers=None):
+    """
+    Computes all-pairs Jaccard and Mash distances from bottom-k sketches.
+
+    Mash distance: D = -1/k * ln(2J / (1 + J)), capped at 1 when J = 0.
+
+    Returns:
+        tuple: (Jaccard distance DataFrame, Mash distance DataFrame), both square and indexed by isolate.
+    """
+    n = len(sketches)
+    jaccard = np.eye(n)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_distance_worker,
+                             initargs=(sketches, sketch_size)) as executor:
+        for i, row in executor.map(_jaccard_row, range(n), chunksize=max(1, n // 64)):
+            jaccard[i, i + 1:] = row
+            jaccard[i + 1:, i] = row
+
+    with np.errstate(divide="ignore"):
+        mash = np.where(jaccard > 0, -np.log(2 * jaccard / (1 + jaccard)) / k, 1.0)
+    mash = np.clip(mash, 0.0, 1.0)
+    np.fill_diagonal(mash, 0.0)
+
+    index = pd.Index(names, name="Isolate")
+    jaccard_df = pd.DataFrame(1.0 - jaccard, index=index, columns=names)
+    mash_df = pd.DataFrame(mash, index=index, columns=names)
+    return jaccard_df, mash_df
+
+
+def main():
+    """Main function to parse arguments, sketch all isolates and write the distance matrices."""
+    parser = argparse.ArgumentParser(
+        description="MinHash sketch the announced contigs and compute Jaccard/Mash distances between all isolates."
+    )
+    parser.add_argument("--contigs_dir", type=str, default=CONTIGS_DIR, help="Directory with one contig FASTA per isolate.")
+    parser.add_argument("--sketch_dir", type=str, default=SKETCH_DIR, help="Directory where sketches (.npz) are stored.")
+    parser.add_argument("--output_prefix", type=str, default="minhash", help="Prefix for the distance matrix CSVs.")
+    parser.add_argument("-k", "--kmer_size", type=int, default=21, help="k-mer length (max 31). Default: 21")
+    parser.add_argument("-s", "--sketch_size", type=int, default=5000, help="Hashes kept per sketch. Default: 5000")
+    parser.add_argument("--seed", type=int, default=42, help="Hash seed. Default: 42")
+    parser.add_argument("--region_bed_dir", type=str, default=None,
+                        help=f"Sketch only the regions of all <dir>/<isolate>/*.bed files (e.g., the aflatoxin cluster hits in {BED_DIR}).")
+    parser.add_argument("--zero_based_bed", action="store_true",
+                        help="BED starts are standard 0-based. Default: 1-based BLAST sstart, as written by bed_files_creation.sh")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Default: all cores")
+
+    args = parser.parse_args()
+
+    if not 1 <= args.kmer_size <= 31:
+        print("Error: k-mer size must be between 1 and 31.", file=sys.stderr)
+        sys.exit(1)
+    if not os.path.isdir(args.contigs_dir):
+        print(f"Error: Directory '{args.contigs_dir}' does not exist.", file=sys.stderr)
+        sys.exit(1)
+
+    fasta_files = {}
+    for fname in sorted(os.listdir(args.contigs_dir)):
+        if fname.endswith((".fa", ".fasta", ".fna")):
+            fasta_files[fname.rsplit(".", 1)[0]] = os.path.join(args.contigs_dir, fname)
+
+    bed_files = {}
+    if args.region_bed_dir:
+        for isolate in list(fasta_files):
+            isolate_bed_dir = os.path.join(args.region_bed_dir, isolate)
+            beds = sorted(f for f in os.listdir(isolate_bed_dir) if f.endswith(".bed")) if os.path.isdir(isolate_bed_dir) else []
+            if not beds:
+                print(f"Warning: No BED file for isolate '{isolate}' in '{isolate_bed_dir}'. Skipping this isolate.", file=sys.stderr)
+                del fasta_files[isolate]
+                continue
+            bed_files[isolate] = [os.path.join(isolate_bed_dir, bed) for bed in beds]
+
+    if len(fasta_files) < 2:
+        print(f"Error: Need at least 2 isolates, found {len(fasta_files)}.", file=sys.stderr)
+        sys.exit(1)
+
+    mode = "region" if args.region_bed_dir else "genome"
+    os.makedirs(args.sketch_dir, exist_ok=True)
+    names = list(fasta_files)
+    print(f"Sketching {len(names)} isolates ({mode}, k={args.kmer_size}, s={args.sketch_size})...")
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [
+            executor.submit(
+                load_or_build_sketch, fasta_files[name],
+                os.path.join(args.sketch_dir, f"{name}_{mode}_k{args.kmer_size}_s{args.sketch_size}.npz"),
+                args.kmer_size, args.sketch_size, args.seed, bed_files.get(name), not args.zero_based_bed
+            )
+            for name in names
+        ]
+        results = [future.result() for future in futures]
+    sketches = [sketch for _, sketch, _ in results]
+    print(f"Built {sum(rebuilt for _, _, rebuilt in results)} sketches, reused {sum(not rebuilt for _, _, rebuilt in results)} from {args.sketch_dir}.")
+
+    jaccard_df, mash_df = pairwise_distances(sketches, names, args.kmer_size, args.sketch_size, args.workers)
+    jaccard_file = f"{args.output_prefix}_{mode}_jaccard_distance_matrix.csv"
+    mash_file = f"{args.output_prefix}_{mode}_mash_distance_matrix.csv"
+    jaccard_df.to_csv(jaccard_file)
+    mash_df.to_csv(mash_file)
+    print(f"Jaccard distance matrix saved to {jaccard_file}")
+    print(f"Mash distance matrix saved to {mash_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,10 @@ import subprocess # For running external commands like MAFFT
 import sys        # For printing errors to stderr
 import tempfile   # For creating temporary files
 
-def run_mafft_alignment(input_concat_dir, output_alignment_dir, alignment_filename="core_genes_aligned.fasta", mafft_path="mafft"):
+from process_supervisor import run_supervised, ResourceLimitExceeded, MAFFT_PROGRESS_PATTERN
+
+def run_mafft_alignment(input_concat_dir, output_alignment_dir, alignment_filename="core_genes_aligned.fasta", mafft_path="mafft",
+                        timeout_hours=None, max_memory_gb=None):
     """
     Performs multiple sequence alignment on all concatenated FASTA files using MAFFT.
 
@@ -14,6 +17,8 @@ def run_mafft_alignment(input_concat_dir, output_alignment_dir, alignment_filena
         alignment_filename (str): Name of the output alignment file (e.g., "core_genes_aligned.fasta").
         mafft_path (str): Path to the MAFFT executable. Assumes 'mafft' is in PATH by default.
                           Specify full path if not (e.g., '/usr/local/bin/mafft').
+        timeout_hours (float): Wall-clock limit for MAFFT. The run is killed once exceeded. None disables it.
+        max_memory_gb (float): Memory limit for MAFFT. The run is killed once exceeded. None disables it.
     """
     print(f"Starting MAFFT alignment from files in: {input_concat_dir}")
     print(f"Alignment output will be saved to: {output_alignment_dir}/{alignment_filename}")
@@ -69,24 +74,26 @@ def run_mafft_alignment(input_concat_dir, output_alignment_dir, alignment_filena
     ]
     print(f"Executing MAFFT command: {' '.join(mafft_command)}")
 
-    # 7. Execute MAFFT
+    # 7. Execute MAFFT under the process supervisor
     try:
-        # We redirect stdout to a file and capture stderr
-        with open(output_alignment_path, 'w') as outfile:
-            process = subprocess.run(
-                mafft_command,
-                stdout=outfile,       # Redirect MAFFT's standard output to our output file
-                stderr=subprocess.PIPE, # Capture MAFFT's standard error
-                check=True,           # Raise an exception if the command returns a non-zero exit code
-                text=True             # Capture stderr as text
-            )
+        # The alignment goes straight to the output file; MAFFT's stderr is streamed to a log
+        mafft_log_path = os.path.splitext(output_alignment_path)[0] + "_mafft.log"
+        run_supervised(
+            mafft_command,
+            mafft_log_path,
+            stdout_path=output_alignment_path,
+            timeout_seconds=timeout_hours * 3600 if timeout_hours else None,
+            max_memory_gb=max_memory_gb,
+            progress_pattern=MAFFT_PROGRESS_PATTERN
+        )
         print(f"MAFFT alignment successful. Output saved to: {output_alignment_path}")
-        if process.stderr:
-            print(f"MAFFT stderr (may contain warnings/info): \n{process.stderr}", file=sys.stderr)
+        print(f"MAFFT stderr (may contain warnings/info) was written to: {mafft_log_path}")
 
     except subprocess.CalledProcessError as e:
         print(f"Error during MAFFT execution. Command '{e.cmd}' returned non-zero exit status {e.returncode}.", file=sys.stderr)
         print(f"MAFFT stderr: \n{e.stderr}", file=sys.stderr)
+    except ResourceLimitExceeded as e:
+        print(f"Error: MAFFT was stopped by the supervisor: {e.reason}.", file=sys.stderr)
     except FileNotFoundError:
         print(f"Error: MAFFT executable not found. Please ensure '{mafft_path}' is correct and MAFFT is installed and in your system's PATH.", file=sys.stderr)
     except Exception as e:
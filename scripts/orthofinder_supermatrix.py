@@ -0,0 +1,405 @@
+# Builds a protein supermatrix from OrthoFinder single-copy orthogroups (output of orthofinder.sh).
+# The results directory is indexed once; single-copy families are then streamed through a worker pool
+# (alignment + column trimming) and appended to one scratch file per species, so memory stays bounded by
+# the families in flight rather than the whole supermatrix.
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from process_supervisor import run_supervised, ResourceLimitExceeded
+from tree_construction_and_model_selection import run_iqtree_phylogeny
+
+ORTHOFINDER_OUT_DIR = "/home/maloo/lustre/allan_project/allan-George/analysis/orthoFinder"
+SUPERMATRIX_OUT_DIR = "/home/maloo/lustre/allan_project/allan-George/analysis/orthoFinder_supermatrix"
+
+
+def find_results_dir(orthofinder_dir):
+    """
+    Returns the OrthoFinder results directory: orthofinder_dir itself if it holds Orthogroups/,
+    otherwise the most recent Results_* directory below it.
+    """
+    if os.path.isdir(os.path.join(orthofinder_dir, "Orthogroups")):
+        return orthofinder_dir
+    candidates = []
+    for entry in os.scandir(orthofinder_dir):
+        if entry.is_dir() and entry.name.startswith("Results_"):
+            candidates.append((entry.stat().st_mtime, entry.path))
+    if not candidates:
+        raise FileNotFoundError(f"No OrthoFinder Results_* directory found in '{orthofinder_dir}'.")
+    return max(candidates)[1]
+
+
+def index_single_copy_orthogroups(results_dir):
+    """
+    Indexes the OrthoFinder results once.
+
+    Reads Orthogroups_SingleCopyOrthologues.txt and streams Orthogroups.tsv, keeping only the
+    single-copy rows, and lists the sequence and MSA directories with one scandir each instead
+    of one stat per orthogroup.
+
+    Args:
+        results_dir (str): OrthoFinder Results_* directory.
+
+    Returns:
+        dict: {'species': [names], 'families': [{'orthogroup', 'gene_to_species', 'sequence_file', 'msa_file'}]}
+    """
+    orthogroups_dir = os.path.join(results_dir, "Orthogroups")
+    with open(os.path.join(orthogroups_dir, "Orthogroups_SingleCopyOrthologues.txt"), "r") as f:
+        single_copy = {line.strip() for line in f if line.strip()}
+
+    gene_maps = {}
+    with open(os.path.join(orthogroups_dir, "Orthogroups.tsv"), "r") as f:
+        species = f.readline().rstrip("\n").split("\t")[1:]
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] not in single_copy:
+                continue
+            gene_maps[fields[0]] = {
+                gene.strip(): species_name
+                for species_name, cell in zip(species, fields[1:])
+                for gene in cell.split(",") if gene.strip()
+            }
+
+    def list_fasta(directory):
+        if not os.path.isdir(directory):
+            return {}
+        return {entry.name.rsplit(".", 1)[0]: entry.path for entry in os.scandir(directory) if entry.name.endswith((".fa", ".fasta"))}
+
+    sequence_files = list_fasta(os.path.join(results_dir, "Single_Copy_Orthologue_Sequences"))
+    msa_files = list_fasta(os.path.join(results_dir, "MultipleSequenceAlignments"))
+
+    families = []
+    for orthogroup in sorted(single_copy):
+        if orthogroup not in sequence_files and orthogroup not in msa_files:
+            print(f"Warning: No sequences found for single-copy orthogroup {orthogroup}. Skipping.", file=sys.stderr)
+            continue
+        families.append({
+            "orthogroup": orthogroup,
+            "gene_to_species": gene_maps.get(orthogroup, {}),
+            "sequence_file": sequence_files.get(orthogroup),
+            "msa_file": msa_files.get(orthogroup),
+        })
+    return {"species": species, "families": families}
+
+
+def read_fasta(fasta_text):
+    """Parses FASTA text into a list of (header, sequence) tuples."""
+    records = []
+    header = None
+    chunks = []
+    for line in fasta_text.splitlines():
+        if line.startswith(">"):
+            if header is not None:
+                records.append((header, "".join(chunks)))
+            header = line[1:].strip()
+            chunks = []
+        elif line.strip():
+            chunks.append(line.strip())
+    if header is not None:
+        records.append((header, "".join(chunks)))
+    return records
+
+
+def species_for_header(header, gene_to_species):
+    """
+    Maps an OrthoFinder sequence header to its species via the Orthogroups.tsv gene IDs.
+
+    Orthogroups.tsv and the orthologue sequence files use the bare gene IDs, while the
+    MultipleSequenceAlignments headers are '<species>_<gene ID>', so a header starting with the
+    name of one of the family's species followed by '_' is mapped to that species as well.
+    """
+    gene_id = header.split()[0]
+    species = gene_to_species.get(gene_id) or gene_to_species.get(header)
+    if species is not None:
+        return species
+    # Longest name first, so 'A_flavus_10B' wins over 'A_flavus' for 'A_flavus_10B_g1'
+    for species in sorted(set(gene_to_species.values()), key=len, reverse=True):
+        if gene_id.startswith(f"{species}_"):
+            return species
+    return None
+
+
+def align_with_mafft(orthogroup, records, mafft_path="mafft", mafft_threads=1, log_dir=None, timeout_seconds=None):
+    """
+    Aligns (header, sequence) records with MAFFT under the process supervisor.
+
+    Returns:
+        list: Aligned (header, sequence) tuples.
+
+    Raises:
+        subprocess.CalledProcessError, ResourceLimitExceeded, FileNotFoundError: From run_supervised().
+    """
+    with tempfile.TemporaryDirectory(prefix=f"{orthogroup}_") as temp_dir:
+        temp_in_path = os.path.join(temp_dir, "input.fa")
+        temp_out_path = os.path.join(temp_dir, "aligned.fa")
+        with open(temp_in_path, "w") as temp_in:
+            for header, sequence in records:
+                temp_in.write(f">{header}\n{sequence}\n")
+        log_path = os.path.join(log_dir or temp_dir, f"{orthogroup}_mafft.log")
+        # Families are small and many run side by side, so they do not take node-wide heavy-job slots
+        run_supervised([mafft_path, "--auto", "--thread", str(mafft_threads), temp_in_path], log_path,
+                       stdout_path=temp_out_path, timeout_seconds=timeout_seconds, heavy=False,
+                       poll_interval=1.0, status_interval=float("inf"))
+        with open(temp_out_path, "r") as f:
+            return read_fasta(f.read())
+
+
+def trim_alignment_columns(aligned_records, max_gap_fraction):
+    """
+    Removes alignment columns whose gap fraction exceeds max_gap_fraction (like trimAl -gt).
+
+    Args:
+        aligned_records (list): (name, aligned sequence) tuples of equal length.
+        max_gap_fraction (float): Maximum allowed fraction of '-' or 'X' per column.
+
+    Returns:
+        list: (name, trimmed sequence) tuples.
+    """
+    matrix = np.frombuffer("".join(seq for _, seq in aligned_records).encode("ascii"), dtype=np.uint8)
+    matrix = matrix.reshape(len(aligned_records), -1)
+    gaps = (matrix == ord("-")) | (matrix == ord("X")) | (matrix == ord("x"))
+    keep = gaps.mean(axis=0) <= max_gap_fraction
+    trimmed = matrix[:, keep]
+    return [(name, row.tobytes().decode("ascii")) for (name, _), row in zip(aligned_records, trimmed)]
+
+
+def align_and_trim_family(family, mafft_path="mafft", max_gap_fraction=0.5, reuse_msa=True, mafft_threads=1,
+                          log_dir=None, timeout_seconds=None):
+    """
+    Aligns (or reuses OrthoFinder's MSA for) one single-copy family and trims gappy columns.
+
+    Runs in a worker process. MAFFT runs under the process supervisor with its input and output in
+    node-local temporary storage ($TMPDIR) rather than next to the results on the shared file system.
+    A family that only has an MSA is realigned from its ungapped sequences when reuse_msa is False.
+
+    Args:
+        log_dir (str): Directory for the per-family MAFFT logs. Default: the temporary directory.
+        timeout_seconds (float): Wall-clock limit per MAFFT run. None disables it.
+
+    Returns:
+        tuple: (orthogroup, {species: trimmed sequence} or None, message)
+    """
+    orthogroup = family["orthogroup"]
+    try:
+        if family["msa_file"] and (reuse_msa or not family["sequence_file"]):
+            with open(family["msa_file"], "r") as f:
+                aligned = read_fasta(f.read())
+            if not reuse_msa:
+                aligned = align_with_mafft(orthogroup, [(h, s.replace("-", "")) for h, s in aligned],
+                                           mafft_path, mafft_threads, log_dir, timeout_seconds)
+        elif family["sequence_file"]:
+            with open(family["sequence_file"], "r") as f:
+                records = read_fasta(f.read())
+            aligned = align_with_mafft(orthogroup, records, mafft_path, mafft_threads, log_dir, timeout_seconds)
+        else:
+            return orthogroup, None, "no sequence or MSA file"
+    except ResourceLimitExceeded as e:
+        return orthogroup, None, f"MAFFT stopped: {e.reason}"
+    except subprocess.CalledProcessError as e:
+        return orthogroup, None, f"MAFFT failed: {(e.stderr or '').strip()[-500:]}"
+    except OSError as e:
+        return orthogroup, None, str(e)
+
+    named = []
+    for header, sequence in aligned:
+        species = species_for_header(header, family["gene_to_species"])
+        if species is None:
+            return orthogroup, None, f"header '{header}' not found in Orthogroups.tsv"
+        named.append((species, sequence.upper()))
+    if len({len(seq) for _, seq in named}) != 1:
+        return orthogroup, None, "sequences are not aligned (unequal lengths)"
+    if len({name for name, _ in named}) != len(named):
+        return orthogroup, None, "a species occurs more than once"
+
+    trimmed = trim_alignment_columns(named, max_gap_fraction)
+    return orthogroup, dict(trimmed), None
+
+
+def build_supermatrix(orthofinder_dir, output_dir, mafft_path="mafft", workers=None, max_gap_fraction=0.5,
+                      min_trimmed_length=30, reuse_msa=True, max_in_flight=None, supermatrix_name="single_copy_supermatrix",
+                      mafft_timeout_hours=1.0):
+    """
+    Streams single-copy orthogroups through parallel alignment and trimming into a protein supermatrix.
+
+    Args:
+        orthofinder_dir (str): OrthoFinder output directory (or a Results_* directory).
+        output_dir (str): Directory for the supermatrix, partition file and per-family report.
+        mafft_path (str): MAFFT executable, used for families without an OrthoFinder MSA.
+        workers (int): Worker processes. Default: all cores.
+        max_gap_fraction (float): Columns with a larger gap fraction are trimmed.
+        min_trimmed_length (int): Families shorter than this after trimming are left out.
+        reuse_msa (bool): Use OrthoFinder's MultipleSequenceAlignments (orthofinder.sh runs -M msa -A mafft) when present.
+        max_in_flight (int): Families submitted but not yet written. Default: 4 x workers.
+        supermatrix_name (str): Base name of the output files.
+        mafft_timeout_hours (float): Wall-clock limit per family MAFFT run. None disables it.
+
+    Returns:
+        tuple: (supermatrix FASTA path, NEXUS partition file path), or (None, None) if nothing was written.
+    """
+    results_dir = find_results_dir(orthofinder_dir)
+    print(f"Indexing OrthoFinder results in: {results_dir}")
+    index = index_single_copy_orthogroups(results_dir)
+    species = index["species"]
+    families = index["families"]
+    print(f"Found {len(families)} single-copy orthogroups across {len(species)} species.")
+    if not families:
+        return None, None
+
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count()
+    max_in_flight = max_in_flight or 4 * workers
+
+    # One scratch file per species; each finished family is appended immediately
+    scratch_dir = tempfile.mkdtemp(prefix="supermatrix_", dir=output_dir)
+    scratch_files = {name: open(os.path.join(scratch_dir, f"{i}.seq"), "w") for i, name in enumerate(species)}
+    partitions = []
+    position = 1
+    report_path = os.path.join(output_dir, f"{supermatrix_name}_families.tsv")
+    log_dir = os.path.join(output_dir, "mafft_logs")
+    os.makedirs(log_dir, exist_ok=True)
+    timeout_seconds = mafft_timeout_hours * 3600 if mafft_timeout_hours else None
+
+    family_iter = iter(families)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor, open(report_path, "w") as report:
+            report.write("orthogroup\tstatus\ttrimmed_length\tmessage\n")
+            pending = {}
+            while True:
+                # Keep a bounded window of families in flight
+                for family in family_iter:
+                    future = executor.submit(align_and_trim_family, family, mafft_path, max_gap_fraction, reuse_msa,
+                                             1, log_dir, timeout_seconds)
+                    pending[future] = family["orthogroup"]
+                    if len(pending) >= max_in_flight:
+                        break
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    orthogroup = pending.pop(future)
+                    try:
+                        _, trimmed, message = future.result()
+                    except Exception as e:
+                        # An unexpected error in one family must not abort the whole build
+                        trimmed, message = None, f"{type(e).__name__}: {e}"
+                    if trimmed is None:
+                        report.write(f"{orthogroup}\tfailed\t0\t{message}\n")
+                        continue
+                    length = len(next(iter(trimmed.values())))
+                    if length < min_trimmed_length:
+                        report.write(f"{orthogroup}\ttoo_short\t{length}\t\n")
+                        continue
+                    for name, handle in scratch_files.items():
+                        # A single-copy family lacking a species is padded with gaps
+                        handle.write(trimmed.get(name, "-" * length))
+                    partitions.append((orthogroup, position, position + length - 1))
+                    position += length
+                    report.write(f"{orthogroup}\tok\t{length}\t\n")
+    except BaseException:
+        for handle in scratch_files.values():
+            handle.close()
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        raise
+
+    for handle in scratch_files.values():
+        handle.close()
+
+    if not partitions:
+        print("Error: No orthogroup passed alignment and trimming.", file=sys.stderr)
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+        return None, None
+
+    supermatrix_path = os.path.join(output_dir, f"{supermatrix_name}.fasta")
+    with open(supermatrix_path, "w") as out:
+        for i, name in enumerate(species):
+            scratch_path = os.path.join(scratch_dir, f"{i}.seq")
+            out.write(f">{name}\n")
+            with open(scratch_path, "r") as scratch:
+                while True:
+                    chunk = scratch.read(1 << 20)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+            out.write("\n")
+            os.remove(scratch_path)
+    os.rmdir(scratch_dir)
+
+    partition_path = os.path.join(output_dir, f"{supermatrix_name}_partitions.nex")
+    with open(partition_path, "w") as f:
+        f.write("#nexus\nbegin sets;\n")
+        for orthogroup, start, end in partitions:
+            f.write(f"    charset {orthogroup} = {start}-{end};\n")
+        f.write("end;\n")
+
+    print(f"Supermatrix with {len(partitions)} orthogroups ({position - 1} columns) saved to {supermatrix_path}")
+    print(f"Partition file saved to {partition_path}")
+    print(f"Per-orthogroup report saved to {report_path}")
+    return supermatrix_path, partition_path
+
+
+def main():
+    """Main function to parse arguments and build the supermatrix."""
+    parser = argparse.ArgumentParser(
+        description="Build a partitioned protein supermatrix from OrthoFinder single-copy orthogroups."
+    )
+    parser.add_argument("--orthofinder_dir", type=str, default=ORTHOFINDER_OUT_DIR,
+                        help="OrthoFinder output directory (the -o of orthofinder.sh) or a Results_* directory.")
+    parser.add_argument("--output_dir", type=str, default=SUPERMATRIX_OUT_DIR, help="Output directory.")
+    parser.add_argument("--mafft_path", type=str, default="mafft", help="MAFFT executable. Default: mafft")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Default: all cores")
+    parser.add_argument("--max_gap_fraction", type=float, default=0.5,
+                        help="Trim columns with a larger gap fraction. Default: 0.5")
+    parser.add_argument("--min_trimmed_length", type=int, default=30,
+                        help="Drop families shorter than this after trimming. Default: 30")
+    parser.add_argument("--mafft_timeout_hours", type=float, default=1.0,
+                        help="Wall-clock limit per family MAFFT run (0 disables it). Default: 1")
+    parser.add_argument("--realign", action="store_true",
+                        help="Realign with MAFFT even when OrthoFinder's MultipleSequenceAlignments are present.")
+    parser.add_argument("--run_iqtree", action="store_true",
+                        help="Run run_iqtree_phylogeny on the supermatrix with the partition file.")
+    parser.add_argument("--iqtree_path", type=str, default="iqtree2", help="IQ-TREE executable. Default: iqtree2")
+    parser.add_argument("--iqtree_bootstrap_reps", type=int, default=100,
+                        help="Bootstrap and SH-aLRT replicates for the supermatrix tree. Default: 100")
+    parser.add_argument("--iqtree_threads", type=str, default="AUTO",
+                        help="IQ-TREE threads (an integer or AUTO). Default: AUTO")
+    parser.add_argument("--iqtree_timeout_hours", type=float, default=None,
+                        help="Wall-clock limit for the IQ-TREE run. Default: none")
+    parser.add_argument("--iqtree_max_memory_gb", type=float, default=None,
+                        help="Memory limit for the IQ-TREE run. Default: none")
+
+    args = parser.parse_args()
+
+    try:
+        supermatrix_path, partition_path = build_supermatrix(
+            args.orthofinder_dir, args.output_dir, mafft_path=args.mafft_path, workers=args.workers,
+            max_gap_fraction=args.max_gap_fraction, min_trimmed_length=args.min_trimmed_length,
+            reuse_msa=not args.realign, mafft_timeout_hours=args.mafft_timeout_hours
+        )
+    except FileNotFoundError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    if supermatrix_path is None:
+        sys.exit(1)
+
+    if args.run_iqtree:
+        run_iqtree_phylogeny(
+            supermatrix_path,
+            os.path.join(args.output_dir, "phylogenetic_tree"),
+            iqtree_path=args.iqtree_path,
+            bootstrap_reps=args.iqtree_bootstrap_reps,
+            threads=args.iqtree_threads,
+            timeout_hours=args.iqtree_timeout_hours,
+            max_memory_gb=args.iqtree_max_memory_gb,
+            partition_file=partition_path
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+# Population-genetic diversity statistics for the core gene alignments: nucleotide diversity (pi),
+# Watterson's theta, Tajima's D, segregating sites and haplotype diversity, per gene and in sliding
+# windows along the concatenated cluster. Allele counts for every column come from one comparison pass
+# per allele over each block of columns, and window statistics are differences of cumulative sums.
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from alignment_io import find_alignments, read_alignment
+
+BLOCK_COLUMNS = 65536  # alignment columns counted per pass
+
+GENE_COLUMNS = ["gene", "sequences", "alignment_length", "sites", "segregating_sites", "pi", "theta_w",
+                "tajimas_d", "haplotypes", "haplotype_diversity"]
+WINDOW_COLUMNS = ["window_start", "window_end", "gene", "sites", "segregating_sites", "pi", "theta_w", "tajimas_d"]
+
+
+def column_allele_counts(codes, block_columns=BLOCK_COLUMNS):
+    """
+    Counts the A/C/G/T alleles of every alignment column.
+
+    Args:
+        codes (np.ndarray): uint8 code matrix from read_alignment() (0-3 for ACGT, 4 for missing).
+        block_columns (int): Columns counted per pass.
+
+    Returns:
+        np.ndarray: (columns x 4) int64 allele counts.
+    """
+    n_columns = codes.shape[1]
+    counts = np.empty((n_columns, 4), dtype=np.int64)
+    for start in range(0, n_columns, block_columns):
+        block = codes[:, start:start + block_columns]
+        # One uint8 comparison pass per allele; sums along the isolate axis give the column counts
+        for allele in range(4):
+            counts[start:start + block.shape[1], allele] = (block == allele).sum(axis=0, dtype=np.int32)
+    return counts
+
+
+def harmonic_numbers(max_n):
+    """Returns a1 = sum(1/i for i < n) and a2 = sum(1/i^2 for i < n) indexed by sample size n (0..max_n)."""
+    i = np.arange(1, max(max_n, 1), dtype=float)
+    a1 = np.concatenate(([0.0, 0.0], np.cumsum(1.0 / i)))[:max_n + 1]
+    a2 = np.concatenate(([0.0, 0.0], np.cumsum(1.0 / i ** 2)))[:max_n + 1]
+    return a1, a2
+
+
+def site_statistics(allele_counts):
+    """
+    Per-column contributions to the diversity statistics.
+
+    Missing data is handled per site: each column uses its own sample size n (sequences with an
+    A/C/G/T there), pi uses the unbiased per-site heterozygosity and Watterson's theta the per-site
+    1/a1(n). Columns with fewer than two called bases are excluded.
+
+    Returns:
+        dict: Per-column arrays 'n' (sample size), 'site' (bool, n >= 2), 'segregating' (bool),
+              'pi' (per-site diversity) and 'theta_w' (1/a1(n) at segregating sites, else 0).
+    """
+    n = allele_counts.sum(axis=1)
+    site = n >= 2
+    segregating = site & ((allele_counts > 0).sum(axis=1) >= 2)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pi = np.where(site, (n ** 2 - (allele_counts ** 2).sum(axis=1)) / (n * (n - 1.0)), 0.0)
+        a1, _ = harmonic_numbers(int(n.max()) if len(n) else 0)
+        theta_w = np.where(segregating, 1.0 / a1[n], 0.0)
+    return {"n": n, "site": site, "segregating": segregating, "pi": pi, "theta_w": theta_w}
+
+
+def tajimas_d(pi_total, theta_w_total, segregating_sites, n):
+    """
+    Tajima's D from summed pi and theta_W (vectorized over genes or windows).
+
+    The variance term uses sample size n; with missing data this is the mean sample size at the
+    segregating sites. Returns NaN where there are no segregating sites or n < 3.
+    """
+    pi_total, theta_w_total = np.asarray(pi_total, dtype=float), np.asarray(theta_w_total, dtype=float)
+    s = np.asarray(segregating_sites, dtype=float)
+    n = np.rint(np.asarray(n, dtype=float)).astype(np.int64)
+    a1_table, a2_table = harmonic_numbers(int(n.max()) if n.size else 0)
+    a1, a2 = a1_table[n], a2_table[n]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        b1 = (n + 1) / (3.0 * (n - 1))
+        b2 = 2.0 * (n ** 2 + n + 3) / (9.0 * n * (n - 1))
+        c1 = b1 - 1.0 / a1
+        c2 = b2 - (n + 2) / (a1 * n) + a2 / a1 ** 2
+        variance = (c1 / a1) * s + (c2 / (a1 ** 2 + a2)) * s * (s - 1)
+        d = (pi_total - theta_w_total) / np.sqrt(variance)
+    return np.where((s > 0) & (n >= 3) & (variance > 0), d, np.nan)
+
+
+def haplotype_diversity(codes):
+    """
+    Number of haplotypes and haplotype (gene) diversity over the columns without missing data.
+
+    Returns:
+        tuple: (number of distinct haplotypes, unbiased haplotype diversity n/(n-1) * (1 - sum(f^2))),
+        or (nan, nan) when every column has missing data and haplotypes cannot be told apart.
+    """
+    n = codes.shape[0]
+    if n < 2:
+        return n, np.nan
+    complete = codes[:, (codes < 4).all(axis=0)]
+    if complete.shape[1] == 0:
+        return np.nan, np.nan
+    # View each row as one opaque byte string so np.unique compares whole haplotypes
+    rows = np.ascontiguousarray(complete).view(np.dtype((np.void, complete.shape[1]))).ravel()
+    _, haplotype_counts = np.unique(rows, return_counts=True)
+    frequencies = haplotype_counts / n
+    return len(haplotype_counts), n / (n - 1.0) * (1.0 - (frequencies ** 2).sum())
+
+
+def gene_diversity(gene, alignment_file):
+    """
+    Computes the per-gene statistics and per-column values of one alignment. Runs in a worker process.
+
+    Returns:
+        tuple: (gene, dict of GENE_COLUMNS values, per-column site statistics dict)
+    """
+    _, codes = read_alignment(alignment_file, strip_gene_prefix=False)
+    sites = site_statistics(column_allele_counts(codes))
+    segregating_sites = int(sites["segregating"].sum())
+    n_sites = int(sites["site"].sum())
+    mean_n = sites["n"][sites["segregating"]].mean() if segregating_sites else codes.shape[0]
+    pi_total, theta_w_total = sites["pi"].sum(), sites["theta_w"].sum()
+    haplotypes, hd = haplotype_diversity(codes)
+    summary = {
+        "gene": gene,
+        "sequences": codes.shape[0],
+        "alignment_length": codes.shape[1],
+        "sites": n_sites,
+        "segregating_sites": segregating_sites,
+        "pi": pi_total / n_sites if n_sites else np.nan,
+        "theta_w": theta_w_total / n_sites if n_sites else np.nan,
+        "tajimas_d": float(tajimas_d(pi_total, theta_w_total, segregating_sites, mean_n)),
+        "haplotypes": haplotypes,
+        "haplotype_diversity": hd,
+    }
+    return gene, summary, sites
+
+
+def window_diversity(sites_by_gene, window_size, step):
+    """
+    Sliding-window statistics along the genes concatenated in the given order.
+
+    Per-column values are independent of the other columns, so concatenating them gene by gene gives
+    the same columns as the concatenated alignment (isolates missing a gene only lower n there).
+
+    Args:
+        sites_by_gene (dict): gene -> site_statistics() output, in concatenation order.
+        window_size (int): Window length in alignment columns.
+        step (int): Distance between window starts in columns.
+
+    Returns:
+        pd.DataFrame: One row per window with WINDOW_COLUMNS (1-based inclusive coordinates).
+    """
+    genes = list(sites_by_gene)
+    stacked = {key: np.concatenate([sites_by_gene[g][key] for g in genes]) for key in ("n", "site", "segregating", "pi", "theta_w")}
+    gene_of_column = np.repeat(np.arange(len(genes)), [len(sites_by_gene[g]["n"]) for g in genes])
+    n_columns = len(gene_of_column)
+    if n_columns == 0:
+        return pd.DataFrame(columns=WINDOW_COLUMNS)
+
+    starts = np.arange(0, max(n_columns - window_size, 0) + 1, step)
+    ends = np.minimum(starts + window_size, n_columns)
+
+    def window_sums(values):
+        cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=float)))
+        return cumulative[ends] - cumulative[starts]
+
+    n_sites = window_sums(stacked["site"])
+    segregating_sites = window_sums(stacked["segregating"])
+    pi_total, theta_w_total = window_sums(stacked["pi"]), window_sums(stacked["theta_w"])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean_n = window_sums(stacked["n"] * stacked["segregating"]) / segregating_sites
+        mean_n = np.where(segregating_sites > 0, mean_n, 0)
+        pi = np.where(n_sites > 0, pi_total / n_sites, np.nan)
+        theta_w = np.where(n_sites > 0, theta_w_total / n_sites, np.nan)
+
+    return pd.DataFrame({
+        "window_start": starts + 1,
+        "window_end": ends,
+        "gene": np.array(genes, dtype=object)[gene_of_column[(starts + ends - 1) // 2]],
+        "sites": n_sites.astype(np.int64),
+        "segregating_sites": segregating_sites.astype(np.int64),
+        "pi": pi,
+        "theta_w": theta_w,
+        "tajimas_d": tajimas_d(pi_total, theta_w_total, segregating_sites, mean_n),
+    }, columns=WINDOW_COLUMNS)
+
+
+def plot_gene_diversity(gene_df, output_file):
+    """Bar plots of pi, Watterson's theta and Tajima's D per gene."""
+    # Imported here so the statistics (and --no_plots runs) do not need matplotlib
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(2, 1, figsize=(max(10, 0.4 * len(gene_df)), 8), sharex=True)
+    positions = np.arange(len(gene_df))
+    axes[0].bar(positions - 0.2, gene_df["pi"], width=0.4, label="π")
+    axes[0].bar(positions + 0.2, gene_df["theta_w"], width=0.4, label="Watterson's θ")
+    axes[0].set_ylabel("Diversity per site", fontsize=12)
+    axes[0].legend()
+    axes[1].bar(positions, gene_df["tajimas_d"], color="grey")
+    axes[1].axhline(0, color="black", linewidth=0.8)
+    axes[1].set_ylabel("Tajima's D", fontsize=12)
+    axes[1].set_xticks(positions)
+    axes[1].set_xticklabels(gene_df["gene"], rotation=90)
+    axes[0].set_title("Nucleotide Diversity per Gene", fontsize=16)
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300)
+    plt.close()
+    print(f"Per-gene diversity plot saved to {output_file}")
+
+
+def plot_window_diversity(window_df, output_file):
+    """Line plots of pi, Watterson's theta and Tajima's D along the concatenated alignment."""
+    import matplotlib.pyplot as plt
+
+    midpoints = (window_df["window_start"] + window_df["window_end"]) / 2.0
+    fig, axes = plt.subplots(2, 1, figsize=(14, 8), sharex=True)
+    axes[0].plot(midpoints, window_df["pi"], label="π")
+    axes[0].plot(midpoints, window_df["theta_w"], label="Watterson's θ")
+    axes[0].set_ylabel("Diversity per site", fontsize=12)
+    axes[0].legend()
+    axes[1].plot(midpoints, window_df["tajimas_d"], color="grey")
+    axes[1].axhline(0, color="black", linewidth=0.8)
+    axes[1].set_ylabel("Tajima's D", fontsize=12)
+    axes[1].set_xlabel("Position in Concatenated Alignment", fontsize=12)
+
+    # Shade alternate genes and label them at the top
+    gene_changes = np.flatnonzero(window_df["gene"].values[1:] != window_df["gene"].values[:-1]) + 1
+    bounds = np.concatenate(([0], gene_changes, [len(window_df)]))
+    for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        if i % 2 == 0:
+            for ax in axes:
+                ax.axvspan(window_df["window_start"].iloc[lo], window_df["window_end"].iloc[hi - 1], color="lightgrey", alpha=0.4)
+        axes[0].text(midpoints.iloc[(lo + hi - 1) // 2], 1.01, window_df["gene"].iloc[lo], rotation=90,
+                     transform=axes[0].get_xaxis_transform(), ha="center", va="bottom", fontsize=7)
+    plt.tight_layout()
+    plt.savefig(output_file, dpi=300)
+    plt.close()
+    print(f"Sliding-window diversity plot saved to {output_file}")
+
+
+def main():
+    """Main function to parse arguments and compute diversity statistics."""
+    parser = argparse.ArgumentParser(
+        description="Nucleotide diversity, Watterson's theta, Tajima's D and haplotype diversity per gene and in sliding windows."
+    )
+    parser.add_argument(
+        "alignments",
+        nargs="+",
+        help="Alignment files and/or directories searched recursively for '*_aligned.fasta' "
+             "(e.g., the individual core gene tree output directory)."
+    )
+    parser.add_argument(
+        "--gene_order",
+        nargs="+",
+        default=None,
+        help="Genes in concatenation order for the sliding windows. Default: alphabetical"
+    )
+    parser.add_argument("--window_size", type=int, default=500, help="Window length in alignment columns. Default: 500")
+    parser.add_argument("--step", type=int, default=100, help="Step between windows in alignment columns. Default: 100")
+    parser.add_argument(
+        "--output_prefix",
+        type=str,
+        default="population_diversity",
+        help="Prefix for the output files. Default: 'population_diversity'"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes. Default: all cores")
+    parser.add_argument("--no_plots", action="store_true", help="Only write the tables.")
+
+    args = parser.parse_args()
+    if args.window_size < 1 or args.step < 1:
+        print("Error: --window_size and --step must be positive.", file=sys.stderr)
+        sys.exit(1)
+
+    alignments = find_alignments(args.alignments)
+    if args.gene_order:
+        missing = [gene for gene in args.gene_order if gene not in alignments]
+        if missing:
+            print(f"Warning: No alignment found for {', '.join(missing)}.", file=sys.stderr)
+        alignments = {gene: alignments[gene] for gene in args.gene_order if gene in alignments}
+    if not alignments:
+        print("Error: No alignments found.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Computing diversity statistics for {len(alignments)} alignments...")
+
+    summaries, sites_by_gene = {}, {}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {gene: executor.submit(gene_diversity, gene, path) for gene, path in alignments.items()}
+        for gene, future in futures.items():
+            try:
+                _, summary, sites = future.result()
+            except ValueError as e:
+                print(f"Warning: {e}. Skipping.", file=sys.stderr)
+                continue
+            summaries[gene] = summary
+            sites_by_gene[gene] = sites
+    if not summaries:
+        print("Error: No usable alignments.", file=sys.stderr)
+        sys.exit(1)
+
+    gene_df = pd.DataFrame(list(summaries.values()), columns=GENE_COLUMNS)
+    gene_file = f"{args.output_prefix}_gene_diversity.tsv"
+    gene_df.to_csv(gene_file, sep="\t", index=False)
+    print(f"Per-gene diversity table saved to {gene_file}")
+
+    window_df = window_diversity(sites_by_gene, args.window_size, args.step)
+    window_file = f"{args.output_prefix}_window_diversity.tsv"
+    window_df.to_csv(window_file, sep="\t", index=False)
+    print(f"Sliding-window diversity table ({len(window_df)} windows) saved to {window_file}")
+
+    if not args.no_plots:
+        plot_gene_diversity(gene_df, f"{args.output_prefix}_gene_diversity.png")
+        if len(window_df):
+            plot_window_diversity(window_df, f"{args.output_prefix}_window_diversity.png")
+
+    print("\nDiversity analysis complete.")
+
+
+if __name__ == "__main__":
+    main()
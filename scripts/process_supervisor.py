@@ -0,0 +1,394 @@
+import fcntl
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import logging
+from collections import deque, namedtuple
+from logging.handlers import RotatingFileHandler
+
+# psutil is optional; without it resource sampling falls back to scanning /proc for the child's process group.
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Progress lines printed by the heavy tools wrapped in this project.
+# IQ-TREE: "Iteration 100 / LogL: -12345.678 / Time: 0h:0m:12s (0h:0m:30s left)"
+# MAFFT:   "STEP    12 / 15" (progressive and iterative refinement steps)
+IQTREE_PROGRESS_PATTERN = re.compile(r"^(Iteration \d+ / LogL: .*|ModelFinder will test .*|Best-fit model: .*|Model\s+-LnL.*)")
+MAFFT_PROGRESS_PATTERN = re.compile(r"STEP\s+\d+\s*/\s*\d+")
+
+SupervisedResult = namedtuple(
+    "SupervisedResult",
+    ["returncode", "elapsed_seconds", "peak_rss_mb", "cpu_seconds", "last_progress", "log_path"]
+)
+
+
+class ResourceLimitExceeded(subprocess.SubprocessError):
+    """Raised when a supervised child is killed for exceeding its wall-clock or memory limit."""
+
+    def __init__(self, cmd, reason, log_tail=""):
+        self.cmd = cmd
+        self.reason = reason
+        self.stderr = log_tail
+        super().__init__(f"Command '{' '.join(cmd)}' was killed: {reason}")
+
+
+# --- Node-wide limit on concurrent heavy tools (MAFFT, IQ-TREE, ...) ---
+# Each heavy job holds an exclusive flock on one of N slot files in a shared directory. The locks are
+# visible to every process on the node (thread pools, process pools and separate scripts alike) and
+# are released by the kernel if the holder dies, so a crashed wrapper never leaks a slot.
+_heavy_tool_slots = int(os.environ.get("AFLX_MAX_HEAVY_JOBS", "1"))
+_heavy_tool_slot_dir = os.environ.get(
+    "AFLX_HEAVY_JOBS_DIR", os.path.join(tempfile.gettempdir(), f"aflx_heavy_job_slots_{os.getuid()}")
+)
+SLOT_RETRY_SECONDS = 1.0
+
+
+def set_max_heavy_jobs(max_jobs, slot_dir=None):
+    """
+    Resets the number of heavy external tools allowed to run at the same time on this node.
+
+    Every process using the same slot directory and slot count shares the limit. Should be called
+    before any supervised job starts (e.g., at the top of main()).
+
+    Args:
+        max_jobs (int): Maximum number of concurrent heavy tool processes.
+        slot_dir (str): Directory holding the slot lock files. Default: unchanged
+                        (AFLX_HEAVY_JOBS_DIR or a per-user directory under the system temp dir).
+    """
+    global _heavy_tool_slots, _heavy_tool_slot_dir
+    if max_jobs < 1:
+        raise ValueError("max_jobs must be at least 1.")
+    _heavy_tool_slots = max_jobs
+    if slot_dir is not None:
+        _heavy_tool_slot_dir = slot_dir
+
+
+def _acquire_heavy_slot():
+    """
+    Blocks until one of the heavy-tool slot files can be locked.
+
+    Returns:
+        file: The open slot file; closing it releases the slot.
+    """
+    os.makedirs(_heavy_tool_slot_dir, exist_ok=True)
+    while True:
+        for slot in range(_heavy_tool_slots):
+            slot_file = open(os.path.join(_heavy_tool_slot_dir, f"slot_{slot}.lock"), "a")
+            try:
+                fcntl.flock(slot_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot_file
+            except BlockingIOError:
+                slot_file.close()
+        time.sleep(SLOT_RETRY_SECONDS)
+
+
+def _open_rotating_log(log_path, max_log_bytes, log_backups):
+    """Creates a logger that writes raw child output lines to a rotating log file."""
+    log_dir = os.path.dirname(log_path)
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    logger = logging.getLogger(f"process_supervisor.{log_path}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    handler = RotatingFileHandler(log_path, maxBytes=max_log_bytes, backupCount=log_backups)
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    return logger, handler
+
+
+def _sample_resources(pid):
+    """
+    Returns (rss_mb, cpu_seconds) summed over the child and all of its descendants.
+    Returns (0.0, 0.0) if the process has already gone away.
+
+    Without psutil the descendants are the members of the child's process group.
+    """
+    if psutil is not None:
+        try:
+            parent = psutil.Process(pid)
+            processes = [parent] + parent.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return 0.0, 0.0
+        rss_bytes = 0
+        cpu_seconds = 0.0
+        for proc in processes:
+            try:
+                rss_bytes += proc.memory_info().rss
+                cpu_times = proc.cpu_times()
+                cpu_seconds += cpu_times.user + cpu_times.system
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return rss_bytes / (1024 * 1024), cpu_seconds
+
+    # /proc fallback (Linux only). The child leads its own process group (start_new_session), so the
+    # group members are the child plus descendants such as the binary behind the mafft shell wrapper.
+    clock_ticks = os.sysconf("SC_CLK_TCK")
+    page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    rss_mb = 0.0
+    cpu_seconds = 0.0
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return 0.0, 0.0
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            # Fields after the command name: state is index 0, pgrp 2, utime 11, stime 12, rss 21 (pages)
+            if int(fields[2]) != pid:
+                continue
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / clock_ticks
+            rss_mb += int(fields[21]) * page_mb
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss_mb, cpu_seconds
+
+
+def _wait_child(process, timeout=None):
+    """
+    Reaps the child with os.wait4 so its kernel resource usage is available.
+
+    Args:
+        process (subprocess.Popen): The child.
+        timeout (float): Seconds to wait. None blocks until the child exits.
+
+    Returns:
+        resource.struct_rusage: Resource usage of the child and its reaped descendants,
+                                or None if the child is still running after timeout.
+    """
+    if timeout is None:
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+        return rusage
+    deadline = time.monotonic() + timeout
+    delay = 0.001
+    while True:
+        pid, status, rusage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            process.returncode = os.waitstatus_to_exitcode(status)
+            return rusage
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        # Short first sleeps catch quick commands; back off to keep polling cheap for long ones
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, 0.1)
+
+
+def _kill_process_group(process):
+    """
+    Terminates the child's whole process group, escalating to SIGKILL if needed.
+
+    Returns:
+        resource.struct_rusage: Resource usage of the reaped child (None if it was already reaped).
+    """
+    if process.returncode is not None:
+        return None
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    rusage = _wait_child(process, timeout=10)
+    if rusage is None:
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        rusage = _wait_child(process)
+    return rusage
+
+
+def run_supervised(
+    command,
+    log_path,
+    stdout_path=None,
+    timeout_seconds=None,
+    max_memory_gb=None,
+    progress_pattern=None,
+    heavy=True,
+    poll_interval=5.0,
+    status_interval=60.0,
+    max_log_bytes=50 * 1024 * 1024,
+    log_backups=3,
+    tail_lines=50
+):
+    """
+    Runs an external tool under supervision.
+
+    Child output is streamed line by line into a rotating log file instead of being held in
+    memory, progress lines are echoed as live status, and the child is killed if it exceeds
+    its wall-clock or memory limit. CPU time and RSS of the whole process tree are sampled
+    every poll_interval seconds; the final CPU time and peak RSS also take the kernel's resource
+    usage of the reaped child into account, so children exiting before the first sample are measured.
+
+    Args:
+        command (list): Command and arguments to execute.
+        log_path (str): Path of the rotating log file receiving the child's output.
+        stdout_path (str): If given, the child's stdout is written directly to this file
+                           (e.g., MAFFT alignments) and only stderr goes to the log.
+        timeout_seconds (float): Wall-clock limit in seconds. None disables the limit.
+        max_memory_gb (float): Resident memory limit for the child process tree. None disables it.
+        progress_pattern (re.Pattern): Regex matching progress lines to report as live status.
+        heavy (bool): If True, waits for one of the node-wide heavy-tool slots before starting.
+        poll_interval (float): Seconds between resource samples and limit checks.
+        status_interval (float): Minimum seconds between printed status updates.
+        max_log_bytes (int): Size at which the log file is rotated.
+        log_backups (int): Number of rotated log files to keep.
+        tail_lines (int): Number of trailing output lines kept for error reports.
+
+    Returns:
+        SupervisedResult: Exit code, elapsed time, peak RSS (MB), CPU seconds, last progress line and log path.
+
+    Raises:
+        FileNotFoundError: If the executable cannot be found.
+        subprocess.CalledProcessError: If the child exits with a non-zero status
+                                       (stderr holds the tail of the log).
+        ResourceLimitExceeded: If the child is killed for exceeding a limit.
+    """
+    slot_file = _acquire_heavy_slot() if heavy else None
+    try:
+        return _run_supervised_unlocked(
+            command, log_path, stdout_path, timeout_seconds, max_memory_gb, progress_pattern,
+            poll_interval, status_interval, max_log_bytes, log_backups, tail_lines
+        )
+    finally:
+        if slot_file is not None:
+            slot_file.close()
+
+
+def _run_supervised_unlocked(
+    command, log_path, stdout_path, timeout_seconds, max_memory_gb, progress_pattern,
+    poll_interval, status_interval, max_log_bytes, log_backups, tail_lines
+):
+    logger, handler = _open_rotating_log(log_path, max_log_bytes, log_backups)
+    log_tail = deque(maxlen=tail_lines)
+    state = {"last_progress": None}
+    state_lock = threading.Lock()
+
+    stdout_file = open(stdout_path, "w") if stdout_path else None
+    try:
+        process = subprocess.Popen(
+            command,
+            stdout=stdout_file if stdout_file else subprocess.PIPE,
+            stderr=subprocess.PIPE if stdout_file else subprocess.STDOUT,
+            text=True,
+            errors="replace",  # a stray non-UTF-8 byte must not kill the reader and block the child
+            bufsize=1,
+            start_new_session=True  # own process group, so limits can kill the whole tree
+        )
+    except FileNotFoundError:
+        if stdout_file:
+            stdout_file.close()
+        logger.removeHandler(handler)
+        handler.close()
+        raise
+
+    def pump(stream):
+        # Read line by line so memory use stays bounded regardless of log size
+        for line in stream:
+            line = line.rstrip("\n")
+            logger.info(line)
+            with state_lock:
+                log_tail.append(line)
+                if progress_pattern is not None and progress_pattern.search(line):
+                    state["last_progress"] = line.strip()
+        stream.close()
+
+    reader_stream = process.stderr if stdout_file else process.stdout
+    reader = threading.Thread(target=pump, args=(reader_stream,), daemon=True)
+    reader.start()
+
+    start_time = time.monotonic()
+    last_status_time = start_time
+    peak_rss_mb = 0.0
+    cpu_seconds = 0.0
+    kill_reason = None
+    rusage = None
+
+    try:
+        while True:
+            rusage = _wait_child(process, timeout=poll_interval)
+            if rusage is not None:
+                break
+
+            elapsed = time.monotonic() - start_time
+            rss_mb, sampled_cpu = _sample_resources(process.pid)
+            peak_rss_mb = max(peak_rss_mb, rss_mb)
+            cpu_seconds = max(cpu_seconds, sampled_cpu)
+
+            if timeout_seconds is not None and elapsed > timeout_seconds:
+                kill_reason = f"wall-clock limit of {timeout_seconds}s exceeded"
+            elif max_memory_gb is not None and rss_mb > max_memory_gb * 1024:
+                kill_reason = f"memory limit of {max_memory_gb} GB exceeded (RSS {rss_mb:.0f} MB)"
+            if kill_reason:
+                print(f"Killing '{command[0]}' (pid {process.pid}): {kill_reason}.", file=sys.stderr)
+                rusage = _kill_process_group(process)
+                break
+
+            if time.monotonic() - last_status_time >= status_interval:
+                with state_lock:
+                    progress = state["last_progress"]
+                status = f"[{command[0]} pid {process.pid}] {elapsed:.0f}s elapsed, RSS {rss_mb:.0f} MB, CPU {sampled_cpu:.0f}s"
+                if progress:
+                    status += f" | {progress}"
+                print(status)
+                last_status_time = time.monotonic()
+    except BaseException:
+        # e.g. KeyboardInterrupt: never leave an orphaned multi-hour job behind
+        _kill_process_group(process)
+        raise
+    finally:
+        reader.join()
+        if stdout_file:
+            stdout_file.close()
+        logger.removeHandler(handler)
+        handler.close()
+
+    elapsed = time.monotonic() - start_time
+    tail_text = "\n".join(log_tail)
+    if rusage is not None:
+        # ru_maxrss is in kilobytes on Linux
+        peak_rss_mb = max(peak_rss_mb, rusage.ru_maxrss / 1024)
+        cpu_seconds = max(cpu_seconds, rusage.ru_utime + rusage.ru_stime)
+
+    if kill_reason:
+        raise ResourceLimitExceeded(command, kill_reason, tail_text)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command, stderr=tail_text)
+
+    return SupervisedResult(
+        returncode=process.returncode,
+        elapsed_seconds=elapsed,
+        peak_rss_mb=peak_rss_mb,
+        cpu_seconds=cpu_seconds,
+        last_progress=state["last_progress"],
+        log_path=log_path
+    )
+
+
+if __name__ == "__main__":
+    # Example usage: supervise any command, e.g.
+    #   python process_supervisor.py run.log 3600 8 -- iqtree2 -s aln.fasta -m TEST
+    if len(sys.argv) < 5 or "--" not in sys.argv:
+        print("Usage: python process_supervisor.py <log_path> <timeout_seconds> <max_memory_gb> -- <command> [args...]", file=sys.stderr)
+        sys.exit(1)
+    split_at = sys.argv.index("--")
+    LOG_PATH, TIMEOUT_SECONDS, MAX_MEMORY_GB = sys.argv[1:split_at]
+    result = run_supervised(
+        sys.argv[split_at + 1:],
+        LOG_PATH,
+        timeout_seconds=float(TIMEOUT_SECONDS),
+        max_memory_gb=float(MAX_MEMORY_GB),
+        status_interval=10.0
+    )
+    print(f"Finished in {result.elapsed_seconds:.1f}s (peak RSS {result.peak_rss_mb:.0f} MB, CPU {result.cpu_seconds:.0f}s). Log: {result.log_path}")
@@ -0,0 +1,313 @@
+# Per-sample read QC and trimming driver (replaces the single fastqc.sh call and the empty trimmomatic.sh).
+# Paired FASTQ files are grouped into a sample manifest, and FastQC + Trimmomatic run per sample in a
+# worker pool with a fixed thread budget per job, so one slow or corrupt sample no longer stalls the batch.
+
+import argparse
+import os
+import re
+import shlex
+import sys
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+from process_supervisor import run_supervised
+
+RAW_DATA_DIR = "/home/maloo/lustre/allan_project/allan-George/data/raw_data"
+FASTQC_DIR = "/home/maloo/lustre/allan_project/allan-George/analysis/fastqc_results"
+TRIMMED_DIR = "/home/maloo/lustre/allan_project/allan-George/analysis/trimmed_reads"
+
+# e.g. 10B_R1.fastq.gz, 10B_S3_L001_R1_001.fastq.gz, 10B_1.fq.gz
+FASTQ_PAIR_PATTERN = re.compile(
+    r"^(?P<sample>.+?)(?:_S\d+)?(?:_L\d{3})?[._](?:R)?(?P<read>[12])(?:_001)?\.(?:fastq|fq)(?:\.gz)?$"
+)
+
+TRIMMOMATIC_STEPS = "LEADING:3 TRAILING:3 SLIDINGWINDOW:4:15 MINLEN:36"
+TRIMMOMATIC_SUMMARY_PATTERN = re.compile(
+    r"Input Read Pairs: (?P<input_pairs>\d+) Both Surviving: (?P<both_surviving>\d+) \((?P<both_surviving_pct>[\d.]+)%\) "
+    r"Forward Only Surviving: (?P<forward_only>\d+) \([\d.]+%\) Reverse Only Surviving: (?P<reverse_only>\d+) \([\d.]+%\) "
+    r"Dropped: (?P<dropped>\d+) \((?P<dropped_pct>[\d.]+)%\)"
+)
+
+
+def build_sample_manifest(raw_data_dir):
+    """
+    Groups paired FASTQ files in raw_data_dir by sample.
+
+    Args:
+        raw_data_dir (str): Directory containing the raw paired-end FASTQ files.
+
+    Returns:
+        dict: Mapping of sample name -> {'R1': path, 'R2': path}, sorted by sample. Samples missing a mate are skipped.
+    """
+    pairs = {}
+    for fname in sorted(os.listdir(raw_data_dir)):
+        match = FASTQ_PAIR_PATTERN.match(fname)
+        if not match:
+            continue
+        pairs.setdefault(match.group("sample"), {})[f"R{match.group('read')}"] = os.path.join(raw_data_dir, fname)
+
+    manifest = {}
+    for sample, reads in sorted(pairs.items()):
+        if "R1" in reads and "R2" in reads:
+            manifest[sample] = reads
+        else:
+            print(f"Warning: Sample '{sample}' has no mate file ({', '.join(reads.values())}). Skipping.", file=sys.stderr)
+    return manifest
+
+
+def fastq_stem(fastq_file):
+    """Returns the name FastQC uses for its reports (file name without .fastq/.fq and .gz)."""
+    name = os.path.basename(fastq_file)
+    return re.sub(r"\.(fastq|fq)(\.gz)?$", "", name)
+
+
+def is_up_to_date(outputs, done_marker, inputs):
+    """
+    True if the step's completion marker and every output exist and are newer than every input.
+
+    The marker is only written after a successful run, so partial outputs of a failed or killed
+    run (and the log the supervisor always writes) never make a step look up to date.
+    """
+    try:
+        newest_input = max(os.path.getmtime(p) for p in inputs)
+        return (os.path.getmtime(done_marker) >= newest_input
+                and all(os.path.getsize(p) > 0 and os.path.getmtime(p) >= newest_input for p in outputs))
+    except OSError:
+        return False
+
+
+def outputs_exist(outputs):
+    """True if every output exists and is non-empty."""
+    return all(os.path.exists(p) and os.path.getsize(p) > 0 for p in outputs)
+
+
+def write_done_marker(done_marker):
+    """Marks a step as completed successfully."""
+    with open(done_marker, "w") as f:
+        f.write("done\n")
+
+
+def remove_done_marker(done_marker):
+    """Invalidates a step before it is (re)run, so an interrupted rerun is not mistaken for a finished one."""
+    try:
+        os.remove(done_marker)
+    except FileNotFoundError:
+        pass
+
+
+def sample_outputs(sample, reads, fastqc_dir, trimmed_dir):
+    """Expected FastQC and Trimmomatic outputs for one sample (completion markers: done_markers())."""
+    sample_fastqc_dir = os.path.join(fastqc_dir, sample)
+    fastqc_zips = [os.path.join(sample_fastqc_dir, f"{fastq_stem(reads[r])}_fastqc.zip") for r in ("R1", "R2")]
+    sample_trimmed_dir = os.path.join(trimmed_dir, sample)
+    trimmed = {
+        name: os.path.join(sample_trimmed_dir, f"{sample}_{name}.fastq.gz")
+        for name in ("R1_paired", "R1_unpaired", "R2_paired", "R2_unpaired")
+    }
+    return sample_fastqc_dir, fastqc_zips, sample_trimmed_dir, trimmed
+
+
+def done_markers(sample, fastqc_dir, trimmed_dir):
+    """Completion markers of the FastQC and Trimmomatic steps of one sample."""
+    return (os.path.join(fastqc_dir, sample, f"{sample}_fastqc.done"),
+            os.path.join(trimmed_dir, sample, f"{sample}_trimmomatic.done"))
+
+
+def process_sample(sample, reads, fastqc_dir, trimmed_dir, threads, fastqc_path="fastqc",
+                   trimmomatic_command="trimmomatic", adapters=None, timeout_hours=None, force=False):
+    """
+    Runs FastQC on the raw pair and Trimmomatic PE for one sample, skipping steps whose outputs are up to date.
+
+    Args:
+        sample (str): Sample name.
+        reads (dict): {'R1': path, 'R2': path}.
+        fastqc_dir (str): Base FastQC output directory (one subdirectory per sample).
+        trimmed_dir (str): Base Trimmomatic output directory (one subdirectory per sample).
+        threads (int): Thread budget for this sample's jobs.
+        fastqc_path (str): FastQC executable.
+        trimmomatic_command (str): Trimmomatic launcher, e.g. 'trimmomatic' or 'java -jar /path/trimmomatic-0.36.jar'.
+        adapters (str): Adapter FASTA for ILLUMINACLIP. None disables adapter clipping.
+        timeout_hours (float): Wall-clock limit per tool run. None disables it.
+        force (bool): Rerun even if outputs are up to date.
+
+    Returns:
+        dict: Per-step status for the summary table.
+    """
+    sample_fastqc_dir, fastqc_zips, sample_trimmed_dir, trimmed = sample_outputs(sample, reads, fastqc_dir, trimmed_dir)
+    fastqc_done, trimmomatic_done = done_markers(sample, fastqc_dir, trimmed_dir)
+    inputs = [reads["R1"], reads["R2"]]
+    timeout_seconds = timeout_hours * 3600 if timeout_hours else None
+    status = {"sample": sample, "fastqc_status": "up_to_date", "trimmomatic_status": "up_to_date"}
+
+    # 1. FastQC on the raw reads
+    if force or not is_up_to_date(fastqc_zips, fastqc_done, inputs):
+        os.makedirs(sample_fastqc_dir, exist_ok=True)
+        remove_done_marker(fastqc_done)
+        # FastQC uses one thread per file, so a pair never needs more than two
+        fastqc_command = [fastqc_path, "-t", str(min(threads, 2)), "-o", sample_fastqc_dir] + inputs
+        try:
+            run_supervised(fastqc_command, os.path.join(sample_fastqc_dir, f"{sample}_fastqc.log"),
+                           timeout_seconds=timeout_seconds, heavy=False)
+            if outputs_exist(fastqc_zips):
+                write_done_marker(fastqc_done)
+                status["fastqc_status"] = "ok"
+            else:
+                print(f"Error: FastQC exited normally for sample {sample} but did not write {', '.join(fastqc_zips)}",
+                      file=sys.stderr)
+                status["fastqc_status"] = "failed"
+        except Exception as e:
+            print(f"Error: FastQC failed for sample {sample}: {e}", file=sys.stderr)
+            status["fastqc_status"] = "failed"
+
+    # 2. Trimmomatic PE
+    trim_log = os.path.join(sample_trimmed_dir, f"{sample}_trimmomatic.log")
+    trimmed_paths = [trimmed[name] for name in ("R1_paired", "R1_unpaired", "R2_paired", "R2_unpaired")]
+    if force or not is_up_to_date(trimmed_paths[::2], trimmomatic_done, inputs):
+        os.makedirs(sample_trimmed_dir, exist_ok=True)
+        remove_done_marker(trimmomatic_done)
+        steps = TRIMMOMATIC_STEPS.split()
+        if adapters:
+            steps.insert(0, f"ILLUMINACLIP:{adapters}:2:30:10")
+        trimmomatic_args = shlex.split(trimmomatic_command) + [
+            "PE", "-threads", str(threads), "-phred33", reads["R1"], reads["R2"]
+        ] + trimmed_paths + steps
+        try:
+            run_supervised(trimmomatic_args, trim_log, timeout_seconds=timeout_seconds, heavy=False)
+            if outputs_exist(trimmed_paths[::2]):
+                write_done_marker(trimmomatic_done)
+                status["trimmomatic_status"] = "ok"
+            else:
+                print(f"Error: Trimmomatic exited normally for sample {sample} but did not write the paired outputs",
+                      file=sys.stderr)
+                status["trimmomatic_status"] = "failed"
+        except Exception as e:
+            print(f"Error: Trimmomatic failed for sample {sample}: {e}", file=sys.stderr)
+            status["trimmomatic_status"] = "failed"
+
+    return status
+
+
+def read_fastqc_summary(fastqc_zip):
+    """
+    Reads basic statistics and module verdicts from a FastQC report archive.
+
+    Returns:
+        dict: total_sequences, gc_percent, and the number of WARN and FAIL modules (empty if unreadable).
+    """
+    try:
+        with zipfile.ZipFile(fastqc_zip) as archive:
+            report_dir = os.path.basename(fastqc_zip)[:-len(".zip")]
+            data_text = archive.read(f"{report_dir}/fastqc_data.txt").decode()
+            summary_text = archive.read(f"{report_dir}/summary.txt").decode()
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return {}
+
+    stats = {}
+    for line in data_text.splitlines():
+        if line.startswith("Total Sequences\t"):
+            stats["total_sequences"] = int(line.split("\t")[1])
+        elif line.startswith("%GC\t"):
+            stats["gc_percent"] = float(line.split("\t")[1])
+    verdicts = [line.split("\t")[0] for line in summary_text.splitlines() if line.strip()]
+    stats["warn_modules"] = verdicts.count("WARN")
+    stats["fail_modules"] = verdicts.count("FAIL")
+    return stats
+
+
+def read_trimmomatic_summary(trim_log):
+    """Parses the 'Input Read Pairs: ... Dropped: ...' line from a Trimmomatic PE log."""
+    try:
+        with open(trim_log, "r") as f:
+            for line in f:
+                match = TRIMMOMATIC_SUMMARY_PATTERN.search(line)
+                if match:
+                    return {key: float(value) if key.endswith("_pct") else int(value)
+                            for key, value in match.groupdict().items()}
+    except OSError:
+        pass
+    return {}
+
+
+def aggregate_summaries(manifest, statuses, fastqc_dir, trimmed_dir):
+    """
+    Combines the per-sample FastQC and Trimmomatic summaries into one table.
+
+    Returns:
+        pd.DataFrame: One row per sample.
+    """
+    records = []
+    for sample, reads in manifest.items():
+        _, fastqc_zips, sample_trimmed_dir, _ = sample_outputs(sample, reads, fastqc_dir, trimmed_dir)
+        record = dict(statuses.get(sample, {"sample": sample}))
+        for read, fastqc_zip in zip(("R1", "R2"), fastqc_zips):
+            for key, value in read_fastqc_summary(fastqc_zip).items():
+                record[f"{read}_{key}"] = value
+        record.update(read_trimmomatic_summary(os.path.join(sample_trimmed_dir, f"{sample}_trimmomatic.log")))
+        records.append(record)
+    # convert_dtypes keeps read counts as integers when some samples have no summary
+    return pd.DataFrame(records).set_index("sample").convert_dtypes()
+
+
+def main():
+    """Main function to parse arguments and run per-sample QC and trimming."""
+    parser = argparse.ArgumentParser(
+        description="Run FastQC and Trimmomatic per sample in a worker pool and aggregate the summaries."
+    )
+    parser.add_argument("--raw_data_dir", type=str, default=RAW_DATA_DIR, help="Directory with raw paired FASTQ files.")
+    parser.add_argument("--fastqc_dir", type=str, default=FASTQC_DIR, help="FastQC output directory.")
+    parser.add_argument("--trimmed_dir", type=str, default=TRIMMED_DIR, help="Trimmomatic output directory.")
+    parser.add_argument("--total_threads", type=int, default=44, help="Threads available on the node. Default: 44")
+    parser.add_argument("--threads_per_sample", type=int, default=4, help="Thread budget per sample job. Default: 4")
+    parser.add_argument("--fastqc_path", type=str, default="fastqc", help="FastQC executable. Default: fastqc")
+    parser.add_argument("--trimmomatic", type=str, default="trimmomatic",
+                        help="Trimmomatic launcher, e.g. 'java -jar /path/trimmomatic-0.36.jar'. Default: trimmomatic")
+    parser.add_argument("--adapters", type=str, default=None, help="Adapter FASTA for ILLUMINACLIP (e.g., TruSeq3-PE.fa).")
+    parser.add_argument("--timeout_hours", type=float, default=None, help="Wall-clock limit per tool run.")
+    parser.add_argument("--force", action="store_true", help="Rerun samples even if their outputs are up to date.")
+    parser.add_argument("--summary_file", type=str, default=None,
+                        help="Aggregated summary table. Default: <fastqc_dir>/read_qc_summary.tsv")
+
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.raw_data_dir):
+        print(f"Error: Directory '{args.raw_data_dir}' does not exist.", file=sys.stderr)
+        sys.exit(1)
+    manifest = build_sample_manifest(args.raw_data_dir)
+    if not manifest:
+        print(f"Error: No paired FASTQ files found in '{args.raw_data_dir}'.", file=sys.stderr)
+        sys.exit(1)
+
+    threads_per_sample = max(1, min(args.threads_per_sample, args.total_threads))
+    workers = max(1, args.total_threads // threads_per_sample)
+    print(f"Found {len(manifest)} samples. Running {workers} samples at a time with {threads_per_sample} threads each.")
+
+    statuses = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                process_sample, sample, reads, args.fastqc_dir, args.trimmed_dir, threads_per_sample,
+                args.fastqc_path, args.trimmomatic, args.adapters, args.timeout_hours, args.force
+            ): sample
+            for sample, reads in manifest.items()
+        }
+        for future in as_completed(futures):
+            status = future.result()
+            statuses[status["sample"]] = status
+            print(f"  {status['sample']}: FastQC {status['fastqc_status']}, Trimmomatic {status['trimmomatic_status']}")
+
+    summary_df = aggregate_summaries(manifest, statuses, args.fastqc_dir, args.trimmed_dir)
+    summary_file = args.summary_file or os.path.join(args.fastqc_dir, "read_qc_summary.tsv")
+    os.makedirs(os.path.dirname(os.path.abspath(summary_file)), exist_ok=True)
+    summary_df.to_csv(summary_file, sep="\t")
+    print(f"\nSummary table saved to {summary_file}")
+
+    n_failed = sum(1 for s in statuses.values() if "failed" in (s["fastqc_status"], s["trimmomatic_status"]))
+    if n_failed:
+        print(f"Warning: {n_failed} samples had a failed step. See the per-sample logs.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
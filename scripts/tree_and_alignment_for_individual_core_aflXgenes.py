@@ -4,6 +4,12 @@ import sys
 import tempfile
 import re
 
+from process_supervisor import run_supervised, ResourceLimitExceeded, IQTREE_PROGRESS_PATTERN, MAFFT_PROGRESS_PATTERN
+from allele_collapsing import collapse_identical_alleles, write_multiplicity_table, expand_alignment, expand_newick_polytomies
+
+# IQ-TREE needs at least 4 sequences for bootstrapping; below this the gene is not collapsed
+MIN_ALLELES_FOR_COLLAPSING = 4
+
 def run_single_gene_phylogeny(
     core_gene_dir,                  # e.g., /mnt/lustre/.../core_aflx_genes_aligned/adhA
     output_base_dir,                # e.g., /mnt/lustre/.../individual_core_gene_trees
@@ -11,11 +17,16 @@ def run_single_gene_phylogeny(
     mafft_path="mafft",
     iqtree_path="iqtree2",
     bootstrap_reps=1000,
-    threads="AUTO"
+    threads="AUTO",
+    timeout_hours=None,
+    max_memory_gb=None,
+    collapse_identical=True
 ):
     """
     Performs alignment (MAFFT) and phylogenetic tree inference (IQ-TREE2) for a single core gene.
     Renames FASTA headers to '>geneName_isolateName' before alignment.
+    Isolates with identical alleles are collapsed to one representative for MAFFT and IQ-TREE2, and
+    re-expanded afterwards as zero-length polytomies in the tree and duplicated rows in the alignment.
 
     Args:
         core_gene_dir (str): Path to the directory containing all isolates' FASTA files for this specific gene.
@@ -25,6 +36,9 @@ def run_single_gene_phylogeny(
         iqtree_path (str): Path to the IQ-TREE2 executable.
         bootstrap_reps (int): Number of ultrafast bootstrap replicates.
         threads (str): Number of parallel threads for IQ-TREE2.
+        timeout_hours (float): Wall-clock limit applied to each MAFFT and IQ-TREE2 run. None disables it.
+        max_memory_gb (float): Memory limit applied to each MAFFT and IQ-TREE2 run. None disables it.
+        collapse_identical (bool): Align and infer the tree on one representative per identical allele.
     """
     print(f"\n--- Processing gene: {gene_name} ---")
     
@@ -52,7 +66,7 @@ def run_single_gene_phylogeny(
     print(f"Found {len(gene_fasta_files)} sequences for gene '{gene_name}' to align.")
 
     # 3. Prepare temporary input for MAFFT with renamed headers
-    mafft_input_content = ""
+    gene_records = []
     for fasta_file in gene_fasta_files:
         try:
             # Extract isolate name from filename (e.g., Extracted_..._10B.fa -> 10B)
@@ -61,24 +75,49 @@ def run_single_gene_phylogeny(
                 isolate_id = isolate_match.group(1)
                 
                 # Construct the NEW FASTA header: >geneName_isolateName
-                new_fasta_header = f">{gene_name}_{isolate_id}"
+                new_fasta_header = f"{gene_name}_{isolate_id}"
 
                 # Read sequence from FASTA file
                 with open(fasta_file, 'r') as f:
                     lines = f.readlines()
                     # Skip existing header, join sequence lines
                     sequence_lines = [line.strip() for line in lines if not line.startswith('>')]
-                    mafft_input_content += new_fasta_header + "\n" + "".join(sequence_lines) + "\n"
+                    gene_records.append((new_fasta_header, "".join(sequence_lines)))
             else:
                 print(f"Warning: Could not extract isolate ID from {fasta_file}. Skipping this file.", file=sys.stderr)
         except Exception as e:
             print(f"Error reading sequence from {fasta_file}: {e}. Skipping this file.", file=sys.stderr)
             continue # Continue to next file if one fails to read
 
-    if not mafft_input_content.strip():
+    if not gene_records:
         print(f"Error: No valid sequences collected for gene '{gene_name}'. Skipping alignment.", file=sys.stderr)
         return
 
+    # Collapse identical alleles to one representative each
+    allele_groups = None
+    if collapse_identical:
+        representatives, groups = collapse_identical_alleles(gene_records)
+        if len(representatives) < len(gene_records) and len(representatives) >= MIN_ALLELES_FOR_COLLAPSING:
+            allele_groups = groups
+            multiplicity_file = os.path.join(gene_output_dir, f"{gene_name}_allele_multiplicity.tsv")
+            write_multiplicity_table(allele_groups, multiplicity_file)
+            print(f"Collapsed {len(gene_records)} sequences of {gene_name} into {len(representatives)} distinct alleles. Multiplicity table: {multiplicity_file}")
+            gene_records = representatives
+        elif len(representatives) < MIN_ALLELES_FOR_COLLAPSING:
+            print(f"Only {len(representatives)} distinct alleles for {gene_name}; aligning all {len(gene_records)} sequences without collapsing.")
+
+    # Outputs of an earlier run must not survive a failed MAFFT or IQ-TREE2 run, or the stale tree
+    # would be picked up by job_array_planner and gene_tree_concordance as this run's result
+    final_treefile = os.path.join(gene_output_dir, f"{gene_name}.treefile")
+    stale_outputs = [final_treefile, os.path.join(gene_output_dir, f"{gene_name}_unique.treefile")]
+    if allele_groups:
+        stale_outputs.append(os.path.join(gene_output_dir, f"{gene_name}_aligned.fasta"))
+    for stale_output in stale_outputs:
+        if os.path.exists(stale_output):
+            os.remove(stale_output)
+
+    mafft_input_content = "".join(f">{name}\n{sequence}\n" for name, sequence in gene_records)
+
     with tempfile.NamedTemporaryFile(mode='w+', delete=False, suffix=f"_{gene_name}_mafft_in.fasta") as temp_mafft_in:
         temp_mafft_in.write(mafft_input_content)
         temp_mafft_in_path = temp_mafft_in.name
@@ -86,23 +125,34 @@ def run_single_gene_phylogeny(
 
     # 4. Run MAFFT alignment
     aligned_fasta_file = os.path.join(gene_output_dir, f"{gene_name}_aligned.fasta")
+    # With collapsed alleles, MAFFT and IQ-TREE2 work on the representatives-only alignment
+    if allele_groups:
+        inference_fasta_file = os.path.join(gene_output_dir, f"{gene_name}_aligned_unique.fasta")
+    else:
+        inference_fasta_file = aligned_fasta_file
     mafft_command = [mafft_path, "--auto", temp_mafft_in_path]
 
-    print(f"Running MAFFT for {gene_name}: {' '.join(mafft_command)} > {aligned_fasta_file}")
+    timeout_seconds = timeout_hours * 3600 if timeout_hours else None
+
+    print(f"Running MAFFT for {gene_name}: {' '.join(mafft_command)} > {inference_fasta_file}")
     try:
-        with open(aligned_fasta_file, 'w') as outfile:
-            subprocess.run(
-                mafft_command,
-                stdout=outfile,
-                stderr=subprocess.PIPE,
-                check=True,
-                text=True
-            )
+        run_supervised(
+            mafft_command,
+            os.path.join(gene_output_dir, f"{gene_name}_mafft.log"),
+            stdout_path=inference_fasta_file,
+            timeout_seconds=timeout_seconds,
+            max_memory_gb=max_memory_gb,
+            progress_pattern=MAFFT_PROGRESS_PATTERN
+        )
         print(f"MAFFT alignment for {gene_name} successful.")
     except subprocess.CalledProcessError as e:
         print(f"Error during MAFFT alignment for {gene_name}. Stderr: \n{e.stderr}", file=sys.stderr)
         if os.path.exists(temp_mafft_in_path): os.remove(temp_mafft_in_path)
         return
+    except ResourceLimitExceeded as e:
+        print(f"Error: MAFFT alignment for {gene_name} was stopped by the supervisor: {e.reason}.", file=sys.stderr)
+        if os.path.exists(temp_mafft_in_path): os.remove(temp_mafft_in_path)
+        return
     except FileNotFoundError:
         print(f"Error: MAFFT executable '{mafft_path}' not found for gene {gene_name}. Ensure it's in PATH.", file=sys.stderr)
         if os.path.exists(temp_mafft_in_path): os.remove(temp_mafft_in_path)
@@ -111,11 +161,17 @@ def run_single_gene_phylogeny(
         if os.path.exists(temp_mafft_in_path):
             os.remove(temp_mafft_in_path)
 
+    if allele_groups:
+        expand_alignment(inference_fasta_file, allele_groups, aligned_fasta_file)
+        print(f"Expanded alignment with all isolates written to: {aligned_fasta_file}")
+
     # 5. Run IQ-TREE2 phylogenetic inference
     iqtree_output_prefix = os.path.join(gene_output_dir, gene_name)
+    if allele_groups:
+        iqtree_output_prefix = os.path.join(gene_output_dir, f"{gene_name}_unique")
     iqtree_command = [
         iqtree_path,
-        "-s", aligned_fasta_file,
+        "-s", inference_fasta_file,
         "-m", "TEST",
         "--alrt", str(bootstrap_reps),
         "-b", str(bootstrap_reps),
@@ -126,16 +182,24 @@ def run_single_gene_phylogeny(
 
     print(f"Running IQ-TREE2 for {gene_name}: {' '.join(iqtree_command)}")
     try:
-        process = subprocess.run(
+        result = run_supervised(
             iqtree_command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True,
-            text=True
+            f"{iqtree_output_prefix}.stdout.log",
+            timeout_seconds=timeout_seconds,
+            max_memory_gb=max_memory_gb,
+            progress_pattern=IQTREE_PROGRESS_PATTERN
         )
-        print(f"IQ-TREE2 for {gene_name} successful. Tree: {iqtree_output_prefix}.treefile")
+        if allele_groups:
+            # Put the collapsed isolates back as zero-length polytomies
+            with open(f"{iqtree_output_prefix}.treefile", "r") as f:
+                unique_tree = f.read()
+            with open(final_treefile, "w") as f:
+                f.write(expand_newick_polytomies(unique_tree, allele_groups))
+        print(f"IQ-TREE2 for {gene_name} successful in {result.elapsed_seconds / 60:.1f} min (peak RSS {result.peak_rss_mb:.0f} MB). Tree: {final_treefile}")
     except subprocess.CalledProcessError as e:
         print(f"Error during IQ-TREE2 execution for {gene_name}. Stderr: \n{e.stderr}", file=sys.stderr)
+    except ResourceLimitExceeded as e:
+        print(f"Error: IQ-TREE2 for {gene_name} was stopped by the supervisor: {e.reason}. Last output: \n{e.stderr}", file=sys.stderr)
     except FileNotFoundError:
         print(f"Error: IQ-TREE2 executable '{iqtree_path}' not found for gene {gene_name}. Ensure it's in PATH.", file=sys.stderr)
     except Exception as e:
@@ -157,6 +221,10 @@ def main():
     BOOTSTRAP_REPLICATES = 1000
     NUM_THREADS = "AUTO" 
 
+    # Per-tool resource limits enforced by the process supervisor
+    TIMEOUT_HOURS = 12
+    MAX_MEMORY_GB = 100
+
     print(f"Starting analysis for {len(CORE_GENES)} individual core genes.")
     os.makedirs(INDIVIDUAL_GENE_TREES_OUTPUT_DIR, exist_ok=True)
 
@@ -174,7 +242,9 @@ def main():
             mafft_path=MAFFT_PATH,
             iqtree_path=IQ_TREE_PATH,
             bootstrap_reps=BOOTSTRAP_REPLICATES,
-            threads=NUM_THREADS
+            threads=NUM_THREADS,
+            timeout_hours=TIMEOUT_HOURS,
+            max_memory_gb=MAX_MEMORY_GB
         )
     
     print("\nAll individual core gene phylogenetic analyses complete.")
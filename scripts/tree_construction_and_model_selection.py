@@ -4,7 +4,10 @@ import os
 import subprocess
 import sys
 
-def run_iqtree_phylogeny(input_alignment_file, output_dir, iqtree_path="iqtree2", bootstrap_reps=1000, threads="AUTO"):
+from process_supervisor import run_supervised, ResourceLimitExceeded, IQTREE_PROGRESS_PATTERN
+
+def run_iqtree_phylogeny(input_alignment_file, output_dir, iqtree_path="iqtree2", bootstrap_reps=1000, threads="AUTO",
+                         timeout_hours=None, max_memory_gb=None, partition_file=None):
     """
     Performs phylogenetic tree inference using IQ-TREE, including model selection and bootstrapping.
 
@@ -17,6 +20,9 @@ def run_iqtree_phylogeny(input_alignment_file, output_dir, iqtree_path="iqtree2"
         bootstrap_reps (int): Number of ultrafast bootstrap replicates for branch support. Default is 1000.
         threads (str): Number of parallel threads to use. "AUTO" uses all available cores.
                        Specify an integer for a fixed number (e.g., "8").
+        timeout_hours (float): Wall-clock limit for IQ-TREE. The run is killed once exceeded. None disables it.
+        max_memory_gb (float): Memory limit for IQ-TREE. The run is killed once exceeded. None disables it.
+        partition_file (str): Optional NEXUS/RAxML partition file for a supermatrix (passed to IQ-TREE with -p).
     """
     print(f"Starting IQ-TREE phylogenetic inference for: {input_alignment_file}")
     print(f"Output files will be saved to: {output_dir}")
@@ -54,28 +60,27 @@ def run_iqtree_phylogeny(input_alignment_file, output_dir, iqtree_path="iqtree2"
         "-redo",                 # Overwrite existing files
         "--prefix", output_prefix_path # Output prefix and directory
     ]
+    # -p: edge-linked partition model, one model selected per partition
+    if partition_file:
+        iqtree_command[3:3] = ["-p", partition_file]
 
     print(f"Executing IQ-TREE command: {' '.join(iqtree_command)}")
 
-    # 5. Execute IQ-TREE
+    # 5. Execute IQ-TREE under the process supervisor.
+    # Output is streamed to a rotating log instead of being buffered in memory.
+    supervisor_log = f"{output_prefix_path}.stdout.log"
+    print(f"IQ-TREE output is streamed to: {supervisor_log}")
     try:
-        process = subprocess.run(
+        result = run_supervised(
             iqtree_command,
-            stdout=subprocess.PIPE,  # Capture standard output
-            stderr=subprocess.PIPE,  # Capture standard error
-            check=True,              # Raise CalledProcessError for non-zero exit codes
-            text=True                # Capture output as text
+            supervisor_log,
+            timeout_seconds=timeout_hours * 3600 if timeout_hours else None,
+            max_memory_gb=max_memory_gb,
+            progress_pattern=IQTREE_PROGRESS_PATTERN
         )
 
         print("IQ-TREE execution successful.")
-        
-        # Print stdout and stderr for user's review
-        if process.stdout:
-            print("\nIQ-TREE Standard Output:")
-            print(process.stdout)
-        if process.stderr:
-            print("\nIQ-TREE Standard Error (may contain warnings/progress):")
-            print(process.stderr)
+        print(f"Elapsed: {result.elapsed_seconds / 3600:.2f} h, peak RSS: {result.peak_rss_mb:.0f} MB, CPU time: {result.cpu_seconds / 3600:.2f} h")
 
         print(f"\nPhylogenetic analysis complete. Check '{output_dir}' for results.")
         print(f"The main tree file will be: {output_prefix_path}.treefile")
@@ -84,6 +89,9 @@ def run_iqtree_phylogeny(input_alignment_file, output_dir, iqtree_path="iqtree2"
         print(f"Error during IQ-TREE execution. Command '{e.cmd}' returned non-zero exit status {e.returncode}.", file=sys.stderr)
         print(f"IQ-TREE stderr: \n{e.stderr}", file=sys.stderr)
         print("Please check IQ-TREE output for detailed error messages.", file=sys.stderr)
+    except ResourceLimitExceeded as e:
+        print(f"Error: IQ-TREE was stopped by the supervisor: {e.reason}.", file=sys.stderr)
+        print(f"Last IQ-TREE output: \n{e.stderr}", file=sys.stderr)
     except FileNotFoundError:
         print(f"Error: IQ-TREE executable not found. Please ensure '{iqtree_path}' is correct and IQ-TREE is installed and in your system's PATH (after loading modules).", file=sys.stderr)
     except Exception as e:
@@ -110,10 +118,16 @@ if __name__ == "__main__":
     # You can specify an integer if you want to limit it (e.g., 8)
     NUM_THREADS = "AUTO" 
 
+    # Resource limits enforced by the process supervisor (keep below the PBS walltime/mem request)
+    TIMEOUT_HOURS = 46
+    MAX_MEMORY_GB = 110
+
     run_iqtree_phylogeny(
         INPUT_ALIGNMENT_FILE,
         OUTPUT_TREE_DIR,
         iqtree_path=IQ_TREE_PATH,
         bootstrap_reps=BOOTSTRAP_REPLICATES,
-        threads=NUM_THREADS
+        threads=NUM_THREADS,
+        timeout_hours=TIMEOUT_HOURS,
+        max_memory_gb=MAX_MEMORY_GB
     )
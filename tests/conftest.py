@@ -0,0 +1,28 @@
+import os
+import sys
+import textwrap
+
+import pytest
+
+# The pipeline scripts import each other as top-level modules (e.g., "from process_supervisor import ...")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+
+
+@pytest.fixture
+def fake_tool(tmp_path, monkeypatch):
+    """
+    Returns a factory writing executable Python stand-ins for external tools into one bin directory.
+
+    The directory is prepended to PATH for the test. The body is dedented and runs with os, sys and time imported.
+    """
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    def write(name, body):
+        path = bin_dir / name
+        path.write_text(f"#!{sys.executable}\nimport os, sys, time\n" + textwrap.dedent(body))
+        path.chmod(0o755)
+        return str(path)
+
+    return write
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import alignment_distances
+from alignment_distances import concatenate_site_counts, distances_from_counts, pairwise_site_counts
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+PURINES = {0, 2}  # A, G; C and T (1, 3) are pyrimidines
+
+
+def brute_force_counts(codes):
+    n = codes.shape[0]
+    counts = {key: np.zeros((n, n), dtype=np.int64) for key in ("comparable", "transitions", "transversions")}
+    for i in range(n):
+        for j in range(n):
+            for a, b in zip(codes[i], codes[j]):
+                if a == 4 or b == 4:
+                    continue
+                counts["comparable"][i, j] += 1
+                if a != b:
+                    key = "transitions" if (a in PURINES) == (b in PURINES) else "transversions"
+                    counts[key][i, j] += 1
+    return counts
+
+
+def counts_for(comparable, transitions, transversions):
+    """Site counts of a single pair (isolates 0 and 1)."""
+    def pair(diagonal, off_diagonal):
+        return np.array([[diagonal, off_diagonal], [off_diagonal, diagonal]], dtype=np.int64)
+    return {"comparable": pair(comparable, comparable), "transitions": pair(0, transitions),
+            "transversions": pair(0, transversions)}
+
+
+@pytest.mark.parametrize("block_columns,threads", [(alignment_distances.BLOCK_COLUMNS, 1), (7, 1), (7, 3)])
+def test_site_counts_match_brute_force(block_columns, threads):
+    rng = np.random.default_rng(11)
+    codes = rng.integers(0, 4, (9, 60)).astype(np.uint8)
+    codes[:, :10] = codes[0, :10]              # invariant complete columns
+    codes[rng.random(codes.shape) < 0.15] = 4  # gaps and ambiguity codes
+    codes[:, 20] = 4                           # an all-missing column
+    counts = pairwise_site_counts(codes, block_columns=block_columns, threads=threads)
+    expected = brute_force_counts(codes)
+    for key in expected:
+        np.testing.assert_array_equal(counts[key], expected[key], err_msg=key)
+
+
+def test_distance_formulas():
+    counts = counts_for(100, 10, 5)
+    p, jc69, k2p = (distances_from_counts(counts, model)[0, 1] for model in ("p", "jc69", "k2p"))
+    assert p == pytest.approx(0.15)
+    assert jc69 == pytest.approx(-0.75 * np.log(1 - 0.15 / 0.75))
+    assert k2p == pytest.approx(-0.5 * np.log(1 - 0.2 - 0.05) - 0.25 * np.log(1 - 0.1))
+    assert distances_from_counts(counts, "k2p")[0, 0] == 0.0
+
+
+def test_saturated_pairs_are_undefined():
+    # p = 0.8 is beyond the JC69 limit of 0.75, but still a valid p-distance
+    counts = counts_for(100, 40, 40)
+    assert distances_from_counts(counts, "p")[0, 1] == pytest.approx(0.8)
+    assert np.isnan(distances_from_counts(counts, "jc69")[0, 1])
+    # K2P: 1 - 2P - Q <= 0 with P = 0.45, Q = 0.1
+    assert np.isnan(distances_from_counts(counts_for(100, 45, 10), "k2p")[0, 1])
+    # K2P: 1 - 2Q <= 0 with Q = 0.5 (JC69 is still defined at p = 0.6)
+    counts = counts_for(100, 10, 50)
+    assert np.isnan(distances_from_counts(counts, "k2p")[0, 1])
+    assert np.isfinite(distances_from_counts(counts, "jc69")[0, 1])
+
+
+def test_pairs_without_comparable_sites_are_undefined():
+    codes = np.array([[0, 1, 4, 4], [4, 4, 2, 3], [0, 1, 2, 3]], dtype=np.uint8)
+    distance = distances_from_counts(pairwise_site_counts(codes), "jc69")
+    assert np.isnan(distance[0, 1])
+    assert distance[0, 2] == 0.0 and distance[1, 2] == 0.0
+    assert (np.diag(distance) == 0).all()
+    with pytest.raises(ValueError, match="Unknown distance model"):
+        distances_from_counts(pairwise_site_counts(codes), "tn93")
+
+
+def test_concatenated_counts_equal_counts_of_the_supermatrix():
+    rng = np.random.default_rng(12)
+    gene1 = rng.integers(0, 5, (3, 30)).astype(np.uint8)  # isolates a, b, c
+    gene2 = rng.integers(0, 5, (2, 20)).astype(np.uint8)  # isolates c, d
+    isolates, counts = concatenate_site_counts({
+        "gene1": (["a", "b", "c"], pairwise_site_counts(gene1)),
+        "gene2": (["c", "d"], pairwise_site_counts(gene2)),
+    })
+    assert isolates == ["a", "b", "c", "d"]
+    supermatrix = np.full((4, 50), 4, dtype=np.uint8)
+    supermatrix[:3, :30] = gene1
+    supermatrix[2:, 30:] = gene2
+    expected = brute_force_counts(supermatrix)
+    for key in expected:
+        np.testing.assert_array_equal(counts[key], expected[key], err_msg=key)
+
+
+def test_main_writes_per_gene_and_concatenated_matrices(tmp_path, monkeypatch):
+    for gene, rows in (("adhA", ["ACGTACGTAC", "ACGTACGTAT", "GCGTACGTAC"]), ("aflR", ["AAAA-CCCC", "AAAAGCCCT", "TAAAGCCCC"])):
+        (tmp_path / gene).mkdir()
+        (tmp_path / gene / f"{gene}_aligned.fasta").write_text(
+            "".join(f">{gene}_{isolate}\n{row}\n" for isolate, row in zip(("10B", "11C", "12D"), rows)))
+    prefix = str(tmp_path / "out")
+    monkeypatch.setattr(sys, "argv", ["alignment_distances.py", str(tmp_path), "--mode", "both", "--models", "p", "k2p",
+                                      "--output_prefix", prefix, "--analysis", "none", "--workers", "2"])
+    alignment_distances.main()
+
+    concatenated = pd.read_csv(f"{prefix}_concatenated_p_distance_matrix.csv", index_col="Isolate")
+    assert list(concatenated.index) == ["10B", "11C", "12D"]
+    # 10B vs 11C: 1 difference in 10 adhA sites plus 1 in 8 comparable aflR sites
+    assert concatenated.loc["10B", "11C"] == pytest.approx(2 / 18)
+    per_gene = pd.read_csv(f"{prefix}_adhA_k2p_distance_matrix.csv", index_col="Isolate")
+    assert per_gene.loc["10B", "12D"] > 0
+    assert not os.path.exists(f"{prefix}_concatenated_jc69_distance_matrix.csv")
+
+
+def test_import_does_not_load_the_plotting_stack():
+    check = ("import sys, alignment_distances; "
+             "print(','.join(m for m in ('seaborn', 'skbio', 'matplotlib', 'scipy.sparse', 'analyze_aflX_diversity', "
+             "'gene_tree_concordance') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", check], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
@@ -0,0 +1,16 @@
+from alignment_io import find_alignments, read_alignment, taxon_from_tip_label
+
+
+def test_taxon_from_tip_label():
+    assert taxon_from_tip_label("adhA_10B") == "10B"
+    assert taxon_from_tip_label("adhA_10B", strip_gene_prefix=False) == "adhA_10B"
+
+
+def test_read_and_find_alignments(tmp_path):
+    (tmp_path / "adhA_aligned.fasta").write_text(">adhA_10B desc\nAC\nGT\n>adhA_11C\nac-u\n")
+    (tmp_path / "adhA_aligned_unique.fasta").write_text(">adhA_10B\nACGT\n")
+    alignments = find_alignments([str(tmp_path), str(tmp_path / "missing")])
+    assert alignments == {"adhA": str(tmp_path / "adhA_aligned.fasta")}
+    names, codes = read_alignment(alignments["adhA"])
+    assert names == ["10B", "11C"]
+    assert codes.tolist() == [[0, 1, 2, 3], [0, 1, 4, 3]]
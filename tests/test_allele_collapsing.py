@@ -0,0 +1,47 @@
+from allele_collapsing import (NEWICK_TOKEN_PATTERN, collapse_identical_alleles, expand_alignment,
+                               expand_newick_polytomies)
+
+
+def tip_labels(newick_string):
+    """Unquoted tip labels of a Newick string, in order."""
+    labels, expect_tip = [], True
+    for token in NEWICK_TOKEN_PATTERN.findall(newick_string):
+        if token.isspace():
+            continue
+        if token in "(,":
+            expect_tip = True
+        elif token in "):;":
+            expect_tip = False
+        elif expect_tip:
+            labels.append(token[1:-1].replace("''", "'") if token.startswith("'") else token)
+            expect_tip = False
+    return labels
+
+
+def test_collapse_ignores_case_gaps_and_stops():
+    records = [("adhA_10B", "ATG-C*"), ("adhA_11C", "atgc"), ("adhA_12D", "ATGA"), ("adhA_13E", "ATGC\n")]
+    representatives, groups = collapse_identical_alleles(records)
+    assert [name for name, _ in representatives] == ["adhA_10B", "adhA_12D"]
+    assert groups == {"adhA_10B": ["adhA_10B", "adhA_11C", "adhA_13E"], "adhA_12D": ["adhA_12D"]}
+
+
+def test_expand_alignment_repeats_representative_rows(tmp_path):
+    aligned = tmp_path / "unique.fasta"
+    aligned.write_text(">a\nAC-G\n>c\nACTG\n")
+    expanded = tmp_path / "expanded.fasta"
+    expand_alignment(str(aligned), {"a": ["a", "b"], "c": ["c"]}, str(expanded))
+    assert expanded.read_text() == ">a\nAC-G\n>b\nAC-G\n>c\nACTG\n"
+
+
+def test_polytomies_keep_branch_lengths():
+    tree = "((a:0.1,c:0.2)90:0.3,d:0.4);"
+    expanded = expand_newick_polytomies(tree, {"a": ["a", "b"], "c": ["c"], "d": ["d"]})
+    assert expanded == "(((a:0,b:0):0.1,c:0.2)90:0.3,d:0.4);"
+
+
+def test_member_names_with_metacharacters_are_quoted():
+    tree = "(('d e':0.2,b:0.1):0.3,c:0.4);"
+    groups = {"d e": ["d e", "f", "o'k"], "b": ["b"], "c": ["c", "x(y):1"]}
+    expanded = expand_newick_polytomies(tree, groups)
+    assert expanded == "((('d e':0,f:0,'o''k':0):0.2,b:0.1):0.3,(c:0,'x(y):1':0):0.4);"
+    assert tip_labels(expanded) == ["d e", "f", "o'k", "b", "c", "x(y):1"]
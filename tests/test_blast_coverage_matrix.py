@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from blast_coverage_matrix import compute_coverage_matrices, merged_interval_coverage, read_blast_tables
+
+GENES = ["aflR_pathway_regulator", "pksA_polyketide_synthase"]
+GENE_LENGTHS = {"aflR_pathway_regulator": 100, "pksA_polyketide_synthase": 200}
+
+
+def brute_force_coverage(group_ids, starts, ends, n_groups):
+    covered = [set() for _ in range(n_groups)]
+    for group, start, end in zip(group_ids, starts, ends):
+        covered[group].update(range(start, end + 1))
+    return np.array([len(positions) for positions in covered], dtype=float)
+
+
+def test_overlapping_nested_and_adjacent_intervals():
+    # group 0: overlapping 1-10 / 5-20; group 1: 30-40 nested in 1-50; group 2: adjacent 1-10 / 11-20 plus gap to 25-25
+    group_ids = [0, 0, 1, 1, 2, 2, 2]
+    starts = [5, 1, 30, 1, 11, 1, 25]
+    ends = [20, 10, 40, 50, 20, 10, 25]
+    assert merged_interval_coverage(group_ids, starts, ends, 4).tolist() == [20, 50, 21, 0]
+
+
+def test_groups_do_not_merge_across_boundaries():
+    # Group 0 ends at the largest coordinate; group 1 starts at 1 and must not be absorbed into it
+    assert merged_interval_coverage([0, 1], [1, 1], [500, 5], 2).tolist() == [500, 5]
+
+
+def test_matches_brute_force_union():
+    rng = np.random.default_rng(7)
+    n_groups = 12
+    group_ids = rng.integers(0, n_groups, 400)
+    starts = rng.integers(1, 300, 400)
+    ends = starts + rng.integers(0, 60, 400)
+    np.testing.assert_array_equal(merged_interval_coverage(group_ids, starts, ends, n_groups),
+                                  brute_force_coverage(group_ids, starts, ends, n_groups))
+
+
+def test_no_intervals():
+    assert merged_interval_coverage([], [], [], 3).tolist() == [0, 0, 0]
+
+
+def write_table(blast_dir, sample, gene, rows):
+    sample_dir = blast_dir / sample
+    sample_dir.mkdir(parents=True, exist_ok=True)
+    lines = ["# BLASTN 2.14.0+", f"# Query: {gene}"]
+    for qstart, qend, pident in rows:
+        lines.append(f"{gene}\tctg1\t{pident}\t{qend - qstart + 1}\t0\t0\t{qstart}\t{qend}\t1\t100\t1e-50\t180")
+    (sample_dir / f"BLASTN_{gene}_{sample}.tab").write_text("\n".join(lines) + "\n")
+
+
+def test_matrices_for_several_samples_and_genes(tmp_path):
+    aflr, pksa = GENES
+    # S1: aflR full length in two overlapping hits; pksA half covered twice (two copies of one half)
+    write_table(tmp_path, "S1", aflr, [(1, 60, 100.0), (41, 100, 90.0)])
+    write_table(tmp_path, "S1", pksa, [(1, 100, 100.0), (1, 100, 100.0)])
+    # S2: pksA only, with swapped coordinates; S3: a table with comment lines only
+    write_table(tmp_path, "S2", pksa, [(200, 1, 95.0)])
+    write_table(tmp_path, "S3", aflr, [])
+
+    hits, samples = read_blast_tables(str(tmp_path), GENES)
+    assert samples == ["S1", "S2", "S3"]
+    matrices = compute_coverage_matrices(hits, GENES, samples, GENE_LENGTHS)
+
+    coverage = matrices["coverage"]
+    assert list(coverage.columns) == ["aflR", "pksA"]
+    assert coverage.loc["S1"].tolist() == [1.0, 0.5]
+    assert coverage.loc["S2"].tolist() == [0.0, 1.0]
+    assert coverage.loc["S3"].tolist() == [0.0, 0.0]
+    # aflR in S1: 60 bases at 100% and 60 at 90% -> mean identity 0.95
+    assert matrices["identity_weighted_coverage"].loc["S1", "aflR"] == pytest.approx(0.95)
+    assert matrices["identity_weighted_coverage"].loc["S2", "pksA"] == pytest.approx(0.95)
+    assert matrices["copy_number"].loc["S1"].tolist() == [1.2, 1.0]
+
+    filtered = compute_coverage_matrices(hits, GENES, samples, GENE_LENGTHS, min_identity=95.0)
+    assert filtered["coverage"].loc["S1", "aflR"] == 0.6
+    assert filtered["coverage"].loc["S2", "pksA"] == 1.0
+
+
+def test_no_hits(tmp_path):
+    write_table(tmp_path, "S1", GENES[0], [])
+    (tmp_path / "S2").mkdir()
+    hits, samples = read_blast_tables(str(tmp_path), GENES)
+    assert hits.empty
+    matrices = compute_coverage_matrices(hits, GENES, samples, GENE_LENGTHS, min_identity=90.0)
+    for matrix in matrices.values():
+        assert matrix.shape == (2, 2)
+        assert (matrix.to_numpy() == 0).all()
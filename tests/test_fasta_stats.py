@@ -0,0 +1,49 @@
+import pytest
+
+import fasta_stats
+from fasta_stats import scan_fasta
+
+
+@pytest.fixture(params=[64 * 1024 * 1024, 7], ids=["one_block", "many_blocks"])
+def block_size(request, monkeypatch):
+    monkeypatch.setattr(fasta_stats, "BLOCK_SIZE", request.param)
+
+
+def write(tmp_path, text, name="test.fa"):
+    path = tmp_path / name
+    path.write_bytes(text.encode())
+    return str(path)
+
+
+def test_headers_are_excluded_from_composition(tmp_path, block_size):
+    # Header text full of G/C/N must not affect GC or N content
+    stats = scan_fasta(write(tmp_path, ">ctg1 GGGCCCNNN\nACGT\nAA\n>ctg2 GCGC\nNNGG\n"))
+    assert (stats["records"], stats["total_length"], stats["N50"], stats["L50"]) == (2, 10, 6, 1)
+    assert stats["gc_percent"] == 50.0 and stats["n_percent"] == 20.0
+
+
+def test_crlf_line_endings(tmp_path, block_size):
+    stats = scan_fasta(write(tmp_path, ">a x\r\nACGT\r\nGC\r\n>b\r\nNNAA\r\n"))
+    assert (stats["records"], stats["total_length"], stats["min_length"], stats["max_length"]) == (2, 10, 4, 6)
+    assert stats["gc_percent"] == 50.0
+
+
+def test_sequence_before_first_header_is_its_own_record(tmp_path, block_size):
+    stats = scan_fasta(write(tmp_path, "AC\n>r1\nACGT\nTT\n>r2\n\n>r3\nGGGCCC"))
+    assert (stats["records"], stats["total_length"], stats["min_length"]) == (4, 14, 0)
+    assert stats["gc_percent"] == 64.29
+
+
+def test_headerless_file(tmp_path, block_size):
+    stats = scan_fasta(write(tmp_path, "ACGTNN\nGG\n"))
+    assert (stats["records"], stats["total_length"]) == (1, 8)
+    assert stats["gc_percent"] == 66.67 and stats["n_percent"] == 25.0
+
+
+def test_blank_lines_before_first_header_are_not_a_record(tmp_path, block_size):
+    stats = scan_fasta(write(tmp_path, "\n\n>a\nAC\n"))
+    assert (stats["records"], stats["total_length"]) == (1, 2)
+
+
+def test_empty_file(tmp_path):
+    assert scan_fasta(write(tmp_path, ""))["records"] == 0
@@ -0,0 +1,126 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+import gene_tree_concordance
+from gene_tree_concordance import (bipartitions_from_clades, compute_tree_bipartitions, gene_concordance_factors,
+                                   parse_newick_clades, robinson_foulds_matrix)
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def splits_of(newick_string, taxa="ABCDEF"):
+    """Canonical splits of one tree, with bits assigned in the order of taxa."""
+    taxon_index = {taxon: bit for bit, taxon in enumerate(taxa)}
+    leaf_mask, clade_masks = parse_newick_clades(newick_string, taxon_index, strip_gene_prefix=False)
+    return bipartitions_from_clades(clade_masks, leaf_mask)
+
+
+def mask(taxa, order="ABCDEF"):
+    return sum(1 << order.index(taxon) for taxon in taxa)
+
+
+def test_splits_are_canonical_across_rootings():
+    rooted_on_a = splits_of("(A,(B,((C,D),(E,F))));")
+    rooted_on_f = splits_of("(F,(E,((C,D),(A,B))));")
+    unrooted = splits_of("(A,B,((C,D),(E,F)));")
+    assert rooted_on_a == rooted_on_f == unrooted
+    # Each split is stored as the side without the lowest taxon (A)
+    assert rooted_on_a == {mask("CDEF"), mask("CD"), mask("EF")}
+
+
+def test_branch_lengths_support_values_comments_and_quoted_labels():
+    tree = "('gene_A x':0.1,'B''s':0.2,(C:0.3,D:0.4)95/100:0.5[&comment],\n(E,F)'lbl':0.6);"
+    taxon_index = {}
+    leaf_mask, clade_masks = parse_newick_clades(tree, taxon_index, strip_gene_prefix=False)
+    assert list(taxon_index) == ["gene_A x", "B's", "C", "D", "E", "F"]
+    assert leaf_mask == 0b111111
+    assert sorted(clade_masks) == [0b001100, 0b110000, 0b111111]
+
+
+def test_gene_prefix_is_stripped_from_tip_labels():
+    taxon_index = {}
+    parse_newick_clades("((adhA_10B,adhA_11C),adhA_12D);", taxon_index)
+    assert list(taxon_index) == ["10B", "11C", "12D"]
+
+
+def test_duplicate_taxon_is_rejected():
+    with pytest.raises(ValueError, match="more than once"):
+        parse_newick_clades("((adhA_x_1,adhA_y_1),adhA_2);", {})
+
+
+def test_unbalanced_parentheses_are_rejected():
+    with pytest.raises(ValueError, match="Unbalanced"):
+        parse_newick_clades("((A,B),C;", {})
+    with pytest.raises(ValueError, match="Unbalanced"):
+        parse_newick_clades("(A,B)),C;", {})
+
+
+def test_robinson_foulds_counts_and_normalization():
+    splits_by_tree = {
+        "t1": splits_of("((A,B),(C,D),(E,F));"),
+        "t2": splits_of("((A,B),(C,E),(D,F));"),
+        "t3": splits_of("((A,B),(C,D),(E,F));"),
+    }
+    counts = robinson_foulds_matrix(splits_by_tree, normalize=False)
+    # t1 and t2 share only AB|CDEF; each has two splits the other lacks
+    assert counts.loc["t1", "t2"] == 4
+    assert counts.loc["t1", "t3"] == 0
+    assert (counts.values.diagonal() == 0).all()
+    normalized = robinson_foulds_matrix(splits_by_tree)
+    assert normalized.loc["t1", "t2"] == pytest.approx(4 / 6)
+
+
+def test_trees_are_compared_on_shared_taxa(tmp_path, capsys):
+    (tmp_path / "g1.treefile").write_text("((A,B),(C,D),(E,X));")
+    (tmp_path / "g2.treefile").write_text("((A,B),(C,D),E);")
+    splits_by_tree, shared_taxa = compute_tree_bipartitions(
+        {"g1": str(tmp_path / "g1.treefile"), "g2": str(tmp_path / "g2.treefile")}, strip_gene_prefix=False)
+    assert shared_taxa == ["A", "B", "C", "D", "E"]
+    assert splits_by_tree["g1"] == splits_by_tree["g2"]
+    assert "missing from at least one tree" in capsys.readouterr().err
+
+
+def test_gene_concordance_factors():
+    reference = splits_of("((A,B),(C,D),(E,F));")
+    genes = {
+        "g1": splits_of("((A,B),(C,D),(E,F));"),
+        "g2": splits_of("((A,B),(C,E),(D,F));"),
+    }
+    gcf = gene_concordance_factors(reference, genes, list("ABCDEF")).set_index("split_taxa")
+    assert gcf.loc["C,D,E,F", "gCF"] == 100.0
+    assert gcf.loc["C,D", "gCF"] == 50.0
+    assert gcf.loc["E,F", "supporting_genes"] == 1
+
+
+def test_main_without_plots(tmp_path, monkeypatch):
+    tree_dir = tmp_path / "trees"
+    for gene, tree in [("adhA", "((adhA_A,adhA_B),(adhA_C,adhA_D),(adhA_E,adhA_F));"),
+                       ("aflR", "((aflR_A,aflR_B),(aflR_C,aflR_E),(aflR_D,aflR_F));")]:
+        (tree_dir / gene).mkdir(parents=True)
+        (tree_dir / gene / f"{gene}.treefile").write_text(tree)
+    (tree_dir / "adhA" / "adhA_unique.treefile").write_text("((adhA_A,adhA_C),adhA_B);")
+    reference = tmp_path / "concat.treefile"
+    reference.write_text("((A,B),(C,D),(E,F));")
+    prefix = str(tmp_path / "out")
+    monkeypatch.setattr(sys, "argv", ["gene_tree_concordance.py", str(tree_dir), "--reference_tree", str(reference),
+                                      "--output_prefix", prefix, "--analysis", "none"])
+    gene_tree_concordance.main()
+
+    counts = pd.read_csv(f"{prefix}_rf_counts_matrix.csv", index_col=0)
+    assert sorted(counts.index) == ["adhA", "aflR", "reference_concat"]
+    assert counts.loc["adhA", "aflR"] == 4
+    gcf = pd.read_csv(f"{prefix}_gCF.tsv", sep="\t")
+    assert sorted(gcf["gCF"]) == [50.0, 50.0, 100.0]
+
+
+def test_import_does_not_load_the_plotting_stack():
+    check = ("import sys, gene_tree_concordance; "
+             "print(','.join(m for m in ('seaborn', 'skbio', 'matplotlib', 'analyze_aflX_diversity') "
+             "if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", check], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
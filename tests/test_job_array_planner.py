@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+import job_array_planner
+
+PLANNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "job_array_planner.py")
+
+FAKE_TOOLS = {
+    # Writes a one-hit outfmt 7 table; queries named *bad* fail after leaving a partial table behind
+    "blastn": """
+        args = sys.argv[1:]
+        query, out = args[args.index("-query") + 1], args[args.index("-out") + 1]
+        if "bad" in os.path.basename(query):
+            open(out, "w").close()
+            sys.exit("blastn: simulated failure")
+        with open(out, "w") as f:
+            f.write("# BLASTN fake\\n" + os.path.basename(query) + "\\tctg1\\t99.0\\t100\\t0\\t0\\t1\\t100\\t1\\t100\\t1e-50\\t180\\n")
+    """,
+    # Prints its input, i.e. an "alignment" of already equal-length sequences
+    "mafft": """
+        sys.stdout.write(open(sys.argv[-1]).read())
+    """,
+    # Writes a star tree of the alignment's sequences; genes named *slow* hang until killed
+    "iqtree2": """
+        args = sys.argv[1:]
+        alignment, prefix = args[args.index("-s") + 1], args[args.index("--prefix") + 1]
+        if "slow" in os.path.basename(prefix):
+            time.sleep(60)
+        names = [line[1:].split()[0] for line in open(alignment) if line.startswith(">")]
+        with open(prefix + ".treefile", "w") as f:
+            f.write("(" + ",".join(names) + ");\\n")
+    """,
+}
+
+
+@pytest.fixture
+def fake_env(tmp_path, fake_tool):
+    for name, body in FAKE_TOOLS.items():
+        fake_tool(name, body)
+    env = dict(os.environ)
+    env["AFLX_HEAVY_JOBS_DIR"] = str(tmp_path / "slots")
+    return env
+
+
+def run_planner(env, *args):
+    return subprocess.run([sys.executable, PLANNER, *map(str, args)], env=env, capture_output=True, text=True, timeout=120)
+
+
+def read_telemetry(path):
+    with open(path) as f:
+        return [line.rstrip("\n").split("\t") for line in f][1:]
+
+
+def test_blast_plan_then_run_local(tmp_path, fake_env):
+    genes_dir, db_dir, contigs_dir = tmp_path / "genes", tmp_path / "db", tmp_path / "contigs"
+    blast_dir, plan_dir = tmp_path / "blast", tmp_path / "plan"
+    genes_dir.mkdir(), contigs_dir.mkdir()
+    (genes_dir / "aflR.fa").write_text(">aflR\n" + "ACGT" * 50 + "\n")
+    (genes_dir / "bad_gene.fa").write_text(">bad\n" + "ACGT" * 10 + "\n")
+    for sample in ("S1", "S2"):
+        (db_dir / sample).mkdir(parents=True)
+        (db_dir / sample / f"Aspergillus_contig_{sample}.nsq").write_text("x" * 100)
+        (contigs_dir / f"{sample}.fa").write_text(">ctg1\n" + "A" * 1000 + "\n")
+
+    planned = run_planner(fake_env, "plan", "blast", plan_dir, "--n_shards", 2, "--threads", 1,
+                          "--genes_dir", genes_dir, "--db_dir", db_dir, "--contigs_dir", contigs_dir,
+                          "--blast_dir", blast_dir, "--timeout_hours", 0.1)
+    assert planned.returncode == 0, planned.stderr
+    plan = json.loads((plan_dir / "plan.json").read_text())
+    assert sorted(u["unit_id"] for s in plan["shards"] for u in s["units"]) == [
+        "blast:aflR:S1", "blast:aflR:S2", "blast:bad_gene:S1", "blast:bad_gene:S2"]
+    assert all(u["params"]["timeout_hours"] == 0.1 for s in plan["shards"] for u in s["units"])
+    script = (plan_dir / "blast_array.pbs.sh").read_text()
+    assert "module load ncbi-blast" in script and "AFLX_HEAVY_JOBS_DIR" in script and "#PBS -J 0-1" in script
+
+    ran = run_planner(fake_env, "run-local", plan_dir / "plan.json", "--max_workers", 2)
+    # The failing gene is isolated: the rest of the batch completes, but the run reports failure
+    assert ran.returncode == 1
+    assert (blast_dir / "S1" / "BLASTN_aflR_S1.tab").stat().st_size > 0
+    assert (blast_dir / "S2" / "BLASTN_aflR_S2.tab").stat().st_size > 0
+    assert (plan_dir / "failed_units.txt").read_text().split() == ["blast:bad_gene:S1", "blast:bad_gene:S2"]
+    statuses = {row[0]: row[4] for row in read_telemetry(plan_dir / "telemetry.tsv")}
+    assert statuses == {"blast:aflR:S1": "ok", "blast:aflR:S2": "ok",
+                        "blast:bad_gene:S1": "failed", "blast:bad_gene:S2": "failed"}
+
+    # Merging again must not duplicate telemetry rows
+    merged = run_planner(fake_env, "merge", plan_dir / "plan.json")
+    assert merged.returncode == 1
+    rows = read_telemetry(plan_dir / "telemetry.tsv")
+    assert len(rows) == 4 and len({row[0] for row in rows}) == 4
+
+    # A re-plan calibrated on that telemetry reuses the measured time of the successful units
+    replanned = run_planner(fake_env, "plan", "blast", tmp_path / "plan2", "--n_shards", 2, "--threads", 1,
+                            "--genes_dir", genes_dir, "--db_dir", db_dir, "--contigs_dir", contigs_dir,
+                            "--blast_dir", blast_dir, "--telemetry", plan_dir / "telemetry.tsv")
+    assert replanned.returncode == 0, replanned.stderr
+
+
+def test_tree_stage_requires_setup_and_enforces_limits(tmp_path, fake_env):
+    core_dir, tree_dir, plan_dir = tmp_path / "core", tmp_path / "trees", tmp_path / "plan"
+    for gene in ("aflR", "slowgene"):
+        (core_dir / gene).mkdir(parents=True)
+        for isolate, seq in (("10B", "ACGTACGT"), ("11C", "ACGTACGA"), ("12D", "ACGAACGT")):
+            (core_dir / gene / f"Extracted_{gene}_{isolate}.fa").write_text(f">x\n{seq}\n")
+
+    common = ["plan", "tree", plan_dir, "--n_shards", 2, "--threads", 1,
+              "--core_genes_dir", core_dir, "--tree_output_dir", tree_dir]
+    missing_setup = run_planner(fake_env, *common)
+    assert missing_setup.returncode == 1 and "--setup" in missing_setup.stderr
+
+    planned = run_planner(fake_env, *common, "--setup", "module load mafft iqtree", "--timeout_hours", 0.001)
+    assert planned.returncode == 0, planned.stderr
+    assert "module load mafft iqtree" in (plan_dir / "tree_array.pbs.sh").read_text()
+
+    start = time.monotonic()
+    ran = run_planner(fake_env, "run-local", plan_dir / "plan.json")
+    # The hanging IQ-TREE run is killed by the supervisor after ~3.6 s instead of running for 60 s
+    assert time.monotonic() - start < 45
+    assert ran.returncode == 1
+    assert (tree_dir / "aflR" / "aflR.treefile").read_text().count("aflR_") == 3
+    assert (plan_dir / "failed_units.txt").read_text().split() == ["tree:slowgene"]
+
+
+def test_default_local_workers_do_not_oversubscribe(monkeypatch):
+    monkeypatch.setattr(os, "cpu_count", lambda: 44)
+    assert job_array_planner.default_local_workers(24) == 1
+    assert job_array_planner.default_local_workers(4) == 11
+    assert job_array_planner.default_local_workers(1) == 44
+    assert job_array_planner.default_local_workers(64) == 1
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+import minhash_sketch
+from minhash_sketch import (BASE_CODES, bottom_k_jaccard, canonical_kmer_hashes, load_or_build_sketch,
+                            read_bed_regions, sketch_fasta)
+
+COMPLEMENT = bytes.maketrans(b"ACGT", b"TGCA")
+
+
+def random_sequence(rng, length):
+    return bytes(rng.choice(list(b"ACGT"), length).astype(np.uint8))
+
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def write_fasta(path, records):
+    path.write_text("".join(f">{name}\n{sequence.decode()}\n" for name, sequence in records))
+    return str(path)
+
+
+def exact_kmers(sequence, k):
+    """Canonical k-mer strings of an ACGT(N) sequence, by brute force."""
+    kmers = set()
+    for i in range(len(sequence) - k + 1):
+        kmer = sequence[i:i + k]
+        if b"N" not in kmer:
+            kmers.add(min(kmer, reverse_complement(kmer)))
+    return kmers
+
+
+def test_hashes_are_canonical_and_skip_ambiguous_bases():
+    rng = np.random.default_rng(1)
+    sequence = random_sequence(rng, 200)
+    sequence = sequence[:100] + b"N" + sequence[101:]
+    forward = canonical_kmer_hashes(BASE_CODES[np.frombuffer(sequence, dtype=np.uint8)], 11, 42)
+    reverse = canonical_kmer_hashes(BASE_CODES[np.frombuffer(reverse_complement(sequence), dtype=np.uint8)], 11, 42)
+    assert len(forward) == 200 - 11 + 1 - 11
+    assert sorted(forward) == sorted(reverse)
+    assert len(set(forward.tolist())) == len(exact_kmers(sequence, 11))
+
+
+def test_sketch_is_strand_invariant(tmp_path):
+    rng = np.random.default_rng(2)
+    contigs = [(f"ctg{i}", random_sequence(rng, 3000)) for i in range(3)]
+    forward = sketch_fasta(write_fasta(tmp_path / "f.fa", contigs), k=15, sketch_size=500)
+    flipped = sketch_fasta(write_fasta(tmp_path / "r.fa", [(n, reverse_complement(s)) for n, s in contigs]),
+                           k=15, sketch_size=500)
+    assert len(forward) == 500
+    np.testing.assert_array_equal(forward, flipped)
+
+
+@pytest.mark.parametrize("sketch_size", [100, 100000])
+def test_chunked_sketch_matches_single_pass(tmp_path, monkeypatch, sketch_size):
+    rng = np.random.default_rng(3)
+    fasta = write_fasta(tmp_path / "g.fa", [("ctg1", random_sequence(rng, 5000)), ("ctg2", random_sequence(rng, 777))])
+    single_pass = sketch_fasta(fasta, k=21, sketch_size=sketch_size)
+    for chunk_bases in (1, 50, 1000):
+        monkeypatch.setattr(minhash_sketch, "CHUNK_BASES", chunk_bases)
+        np.testing.assert_array_equal(sketch_fasta(fasta, k=21, sketch_size=sketch_size), single_pass)
+    # A sketch larger than the k-mer set holds every distinct k-mer
+    if sketch_size > 5000:
+        assert len(single_pass) == (5000 - 20) + (777 - 20)
+
+
+def test_bottom_k_jaccard_against_exact_jaccard(tmp_path):
+    rng = np.random.default_rng(4)
+    shared = random_sequence(rng, 20000)
+    genome_a = shared + random_sequence(rng, 10000)
+    genome_b = shared + random_sequence(rng, 5000)
+    kmers_a, kmers_b = exact_kmers(genome_a, 21), exact_kmers(genome_b, 21)
+    exact = len(kmers_a & kmers_b) / len(kmers_a | kmers_b)
+
+    fasta_a = write_fasta(tmp_path / "a.fa", [("a", genome_a)])
+    fasta_b = write_fasta(tmp_path / "b.fa", [("b", genome_b)])
+    # With sketches holding every k-mer the estimate is exact
+    full_a, full_b = sketch_fasta(fasta_a, sketch_size=10 ** 6), sketch_fasta(fasta_b, sketch_size=10 ** 6)
+    assert bottom_k_jaccard(full_a, full_b, 10 ** 6) == pytest.approx(exact)
+    # A 2000-hash sketch is within a few standard errors (sqrt(J(1-J)/s) ~ 0.011)
+    small_a, small_b = sketch_fasta(fasta_a, sketch_size=2000), sketch_fasta(fasta_b, sketch_size=2000)
+    assert abs(bottom_k_jaccard(small_a, small_b, 2000) - exact) < 0.05
+    assert bottom_k_jaccard(small_a, np.empty(0, dtype=np.uint64), 2000) == 0.0
+
+
+def test_regions_from_all_bed_files_with_one_based_starts(tmp_path):
+    rng = np.random.default_rng(5)
+    contig = random_sequence(rng, 1000)
+    fasta = write_fasta(tmp_path / "g.fa", [("ctg1", contig), ("ctg2", random_sequence(rng, 500))])
+    # BLAST-style 1-based inclusive coordinates, as written by bed_files_creation.sh, in two files
+    (tmp_path / "cluster1.bed").write_text("ctg1\t101\t300\thit1\t0\t+\n")
+    (tmp_path / "cluster2.bed").write_text("track name=x\nctg1\t601\t700\thit2\t0\t-\n")
+    bed_files = [str(tmp_path / "cluster1.bed"), str(tmp_path / "cluster2.bed")]
+    assert read_bed_regions(bed_files, one_based_start=True) == {"ctg1": [(100, 300), (600, 700)]}
+
+    expected_fasta = write_fasta(tmp_path / "expected.fa", [("r1", contig[100:300]), ("r2", contig[600:700])])
+    expected = sketch_fasta(expected_fasta, sketch_size=10 ** 6)
+    _, sketch, rebuilt = load_or_build_sketch(fasta, str(tmp_path / "s.npz"), 21, 10 ** 6, 42, bed_files, True)
+    assert rebuilt
+    np.testing.assert_array_equal(sketch, expected)
+    # Unchanged inputs reuse the stored sketch; another coordinate convention rebuilds it
+    assert not load_or_build_sketch(fasta, str(tmp_path / "s.npz"), 21, 10 ** 6, 42, bed_files, True)[2]
+    assert load_or_build_sketch(fasta, str(tmp_path / "s.npz"), 21, 10 ** 6, 42, bed_files, False)[2]
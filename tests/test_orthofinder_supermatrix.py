@@ -0,0 +1,126 @@
+import os
+import sys
+
+import pytest
+
+import orthofinder_supermatrix
+import process_supervisor
+
+from orthofinder_supermatrix import build_supermatrix, species_for_header
+
+# "spA" is a prefix of "spA_2", as with isolate names such as "Af_10B" and "Af_10B_2"
+SPECIES = ["spA", "spA_2", "spB"]
+
+# Echoes its input as the "alignment"; inputs containing FAIL exit 1 and inputs containing HANG never finish
+FAKE_MAFFT = """
+text = open(sys.argv[-1]).read()
+if "FAIL" in text:
+    sys.exit("mafft: simulated failure")
+if "HANG" in text:
+    time.sleep(60)
+sys.stdout.write(text)
+"""
+
+
+@pytest.fixture
+def orthofinder_results(tmp_path, fake_tool):
+    """Results directory with one family per case: sequences only, MSA only, failing and hanging MAFFT."""
+    results = tmp_path / "Results_Jan01"
+    (results / "Orthogroups").mkdir(parents=True)
+    (results / "Single_Copy_Orthologue_Sequences").mkdir()
+    (results / "MultipleSequenceAlignments").mkdir()
+    families = {"OG1": "MKV" * 15, "OG2": "MRL" * 15, "OG3": "FAIL" + "M" * 40, "OG4": "HANG" + "M" * 40}
+    (results / "Orthogroups" / "Orthogroups_SingleCopyOrthologues.txt").write_text("\n".join(families) + "\n")
+    # Orthogroups.tsv and the orthologue sequences use bare gene IDs; MSA headers are '<species>_<gene ID>'
+    gene_ids = {(orthogroup, s): f"g{i}{k}.t1" for i, orthogroup in enumerate(families) for k, s in enumerate(SPECIES)}
+    with open(results / "Orthogroups" / "Orthogroups.tsv", "w") as f:
+        f.write("Orthogroup\t" + "\t".join(SPECIES) + "\n")
+        for orthogroup in families:
+            f.write(orthogroup + "\t" + "\t".join(gene_ids[orthogroup, s] for s in SPECIES) + "\n")
+    for orthogroup, sequence in families.items():
+        if orthogroup != "OG1":
+            # OG2 only has an MSA (with gap columns); the others have both, as with orthofinder.sh -M msa
+            text = "".join(f">{s}_{gene_ids[orthogroup, s]}\n{sequence[:10]}---{sequence[10:]}\n" for s in SPECIES)
+            (results / "MultipleSequenceAlignments" / f"{orthogroup}.fa").write_text(text)
+        if orthogroup != "OG2":
+            text = "".join(f">{gene_ids[orthogroup, s]}\n{sequence}\n" for s in SPECIES)
+            (results / "Single_Copy_Orthologue_Sequences" / f"{orthogroup}.fa").write_text(text)
+
+    return tmp_path, fake_tool("mafft", FAKE_MAFFT)
+
+
+def read_report(path):
+    with open(path) as f:
+        return {fields[0]: fields[1:] for fields in (line.rstrip("\n").split("\t") for line in f)}
+
+
+def test_realign_handles_msa_only_families_and_isolates_failures(orthofinder_results):
+    tmp_path, mafft = orthofinder_results
+    output_dir = tmp_path / "out"
+    supermatrix, partitions = build_supermatrix(str(tmp_path), str(output_dir), mafft_path=mafft, workers=2,
+                                                reuse_msa=False, mafft_timeout_hours=0.0005)
+
+    report = read_report(output_dir / "single_copy_supermatrix_families.tsv")
+    assert report["OG1"][:2] == ["ok", "45"]
+    # The MSA-only family is realigned from its ungapped sequences instead of crashing the build
+    assert report["OG2"][:2] == ["ok", "45"]
+    assert report["OG3"][0] == "failed" and "simulated failure" in report["OG3"][2]
+    assert report["OG4"][0] == "failed" and "wall-clock" in report["OG4"][2]
+    assert os.path.exists(output_dir / "mafft_logs" / "OG3_mafft.log")
+
+    with open(supermatrix) as f:
+        lines = f.read().splitlines()
+    assert lines[0::2] == [f">{s}" for s in SPECIES]
+    assert all(len(row) == 90 for row in lines[1::2])
+    # Families are appended in completion order, so only the set of ranges is fixed
+    charsets = [line.split() for line in open(partitions) if line.strip().startswith("charset")]
+    assert sorted(fields[1] for fields in charsets) == ["OG1", "OG2"]
+    assert sorted(fields[3] for fields in charsets) == ["1-45;", "46-90;"]
+    # No scratch directory is left behind
+    assert sorted(os.listdir(output_dir)) == ["mafft_logs", "single_copy_supermatrix.fasta",
+                                              "single_copy_supermatrix_families.tsv",
+                                              "single_copy_supermatrix_partitions.nex"]
+
+
+def test_reused_msa_keeps_gap_columns_below_threshold(orthofinder_results):
+    tmp_path, mafft = orthofinder_results
+    output_dir = tmp_path / "out"
+    build_supermatrix(str(tmp_path), str(output_dir), mafft_path=mafft, workers=1, mafft_timeout_hours=0.0005)
+
+    report = read_report(output_dir / "single_copy_supermatrix_families.tsv")
+    # All-gap columns of the OrthoFinder MSA exceed max_gap_fraction and are trimmed
+    assert report["OG2"][:2] == ["ok", "45"]
+    # Families with an MSA use it, with its '<species>_' headers, instead of running MAFFT
+    assert [report[og][0] for og in ("OG1", "OG3", "OG4")] == ["ok", "ok", "ok"]
+    assert os.listdir(output_dir / "mafft_logs") == ["OG1_mafft.log"]
+
+
+def test_species_for_header():
+    gene_to_species = {"g1.t1": "spA", "g2.t1": "spA_2"}
+    assert species_for_header("g1.t1 some description", gene_to_species) == "spA"
+    assert species_for_header("spA_g1.t1", gene_to_species) == "spA"
+    assert species_for_header("spA_2_g2.t1", gene_to_species) == "spA_2"
+    assert species_for_header("spC_g3.t1", gene_to_species) is None
+
+
+def test_run_iqtree_passes_limits_and_bootstrap_reps(orthofinder_results, fake_tool, monkeypatch, capsys):
+    tmp_path, mafft = orthofinder_results
+    output_dir = tmp_path / "out"
+    # Records its arguments and hangs, so the wall-clock limit has to stop it
+    fake_tool("iqtree2", f"""
+        open({str(tmp_path / "iqtree_args.txt")!r}, "w").write(" ".join(sys.argv[1:]))
+        time.sleep(60)
+    """)
+    monkeypatch.setattr(process_supervisor, "_heavy_tool_slot_dir", str(tmp_path / "slots"))
+    monkeypatch.setattr(sys, "argv", ["orthofinder_supermatrix.py", "--orthofinder_dir", str(tmp_path),
+                                      "--output_dir", str(output_dir), "--mafft_path", mafft, "--workers", "1",
+                                      "--mafft_timeout_hours", "0.0005", "--run_iqtree",
+                                      "--iqtree_bootstrap_reps", "10", "--iqtree_threads", "2",
+                                      "--iqtree_timeout_hours", "0.0005", "--iqtree_max_memory_gb", "4"])
+    orthofinder_supermatrix.main()
+
+    args = (tmp_path / "iqtree_args.txt").read_text().split()
+    assert args[args.index("-b") + 1] == "10" and args[args.index("--alrt") + 1] == "10"
+    assert args[args.index("-T") + 1] == "2"
+    assert args[args.index("-p") + 1].endswith("single_copy_supermatrix_partitions.nex")
+    assert "IQ-TREE was stopped by the supervisor: wall-clock limit" in capsys.readouterr().err
@@ -0,0 +1,56 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import population_diversity
+from population_diversity import haplotype_diversity
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts")
+
+
+def codes_of(*sequences):
+    return np.array([[{"A": 0, "C": 1, "G": 2, "T": 3}.get(base, 4) for base in seq] for seq in sequences],
+                    dtype=np.uint8)
+
+
+def test_haplotype_diversity_over_complete_columns():
+    haplotypes, hd = haplotype_diversity(codes_of("ACGT", "ACGA", "ACGT", "NCGA"))
+    # Column 0 has missing data, so haplotypes are CGT, CGA, CGT, CGA
+    assert haplotypes == 2
+    assert np.isclose(hd, 4 / 3 * (1 - 0.5 ** 2 - 0.5 ** 2))
+
+
+def test_haplotype_diversity_undefined_without_complete_columns():
+    haplotypes, hd = haplotype_diversity(codes_of("AN-", "NCG", "A-N"))
+    assert np.isnan(haplotypes) and np.isnan(hd)
+
+
+def test_main_without_plots(tmp_path, monkeypatch):
+    # adhA: 3 distinct haplotypes over its complete columns; aflR: every column has missing data
+    (tmp_path / "adhA_aligned.fasta").write_text(">adhA_10B\nACGTAC\n>adhA_11C\nACGTAT\n>adhA_12D\nGCGTAC\n>adhA_13E\nACGTAC\n")
+    (tmp_path / "aflR_aligned.fasta").write_text(">aflR_10B\nAC-\n>aflR_11C\n-CG\n>aflR_12D\nA-G\n>aflR_13E\nNCG\n")
+    prefix = str(tmp_path / "out")
+    monkeypatch.setattr(sys, "argv", ["population_diversity.py", str(tmp_path), "--output_prefix", prefix,
+                                      "--window_size", "3", "--step", "3", "--workers", "1", "--no_plots"])
+    population_diversity.main()
+
+    genes = pd.read_csv(f"{prefix}_gene_diversity.tsv", sep="\t").set_index("gene")
+    assert genes.loc["adhA", "segregating_sites"] == 2
+    assert genes.loc["adhA", "haplotypes"] == 3
+    assert genes.loc["adhA", "haplotype_diversity"] == pytest.approx(4 / 3 * (1 - 0.5 ** 2 - 0.25 ** 2 - 0.25 ** 2))
+    assert np.isnan(genes.loc["aflR", "haplotypes"]) and np.isnan(genes.loc["aflR", "haplotype_diversity"])
+    assert len(pd.read_csv(f"{prefix}_window_diversity.tsv", sep="\t")) == 3
+    assert not any(name.endswith(".png") for name in os.listdir(tmp_path))
+
+
+def test_import_does_not_load_plotting_or_tree_modules():
+    check = ("import sys, population_diversity; "
+             "print(','.join(m for m in ('seaborn', 'skbio', 'scipy.sparse', 'analyze_aflX_diversity', "
+             "'gene_tree_concordance', 'alignment_distances', 'matplotlib') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", check], cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == ""
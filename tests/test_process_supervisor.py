@@ -0,0 +1,188 @@
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import process_supervisor
+from process_supervisor import run_supervised, set_max_heavy_jobs, ResourceLimitExceeded, IQTREE_PROGRESS_PATTERN
+
+
+@pytest.fixture(autouse=True)
+def isolated_slots(tmp_path):
+    """Gives every test its own heavy-job slot directory."""
+    set_max_heavy_jobs(1, slot_dir=str(tmp_path / "slots"))
+    yield
+
+
+def python_command(code):
+    return [sys.executable, "-c", code]
+
+
+def test_output_is_streamed_to_log_and_progress_is_parsed(tmp_path):
+    log_path = tmp_path / "run.log"
+    code = (
+        "import sys\n"
+        "for i in range(1, 4):\n"
+        "    print(f'Iteration {i}00 / LogL: -123.4 / Time: 0h:0m:1s', flush=True)\n"
+        "print('some warning', file=sys.stderr)\n"
+        "print('done')\n"
+    )
+    result = run_supervised(python_command(code), str(log_path), progress_pattern=IQTREE_PROGRESS_PATTERN,
+                            poll_interval=0.1)
+
+    assert result.returncode == 0
+    assert result.last_progress.startswith("Iteration 300 / LogL")
+    log_lines = log_path.read_text().splitlines()
+    assert "done" in log_lines and "some warning" in log_lines and len(log_lines) == 5
+
+
+def test_stdout_path_receives_stdout_and_log_receives_stderr(tmp_path):
+    log_path, out_path = tmp_path / "mafft.log", tmp_path / "aligned.fasta"
+    code = "import sys\nprint('>a\\nACGT')\nprint('STEP 1 / 2', file=sys.stderr)\n"
+    run_supervised(python_command(code), str(log_path), stdout_path=str(out_path), poll_interval=0.1)
+
+    assert out_path.read_text() == ">a\nACGT\n"
+    assert log_path.read_text() == "STEP 1 / 2\n"
+
+
+def test_nonzero_exit_raises_with_log_tail(tmp_path):
+    code = "import sys\nprint('fatal: bad input', file=sys.stderr)\nsys.exit(3)\n"
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        run_supervised(python_command(code), str(tmp_path / "run.log"), poll_interval=0.1)
+
+    assert excinfo.value.returncode == 3
+    assert "fatal: bad input" in excinfo.value.stderr
+
+
+def test_timeout_kills_process_group(tmp_path):
+    pid_file = tmp_path / "grandchild.pid"
+    # The child starts a grandchild, so the kill must reach the whole process group
+    code = (
+        "import subprocess, sys, time\n"
+        "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])\n"
+        f"open({str(pid_file)!r}, 'w').write(str(p.pid))\n"
+        "time.sleep(60)\n"
+    )
+    start = time.monotonic()
+    with pytest.raises(ResourceLimitExceeded) as excinfo:
+        run_supervised(python_command(code), str(tmp_path / "run.log"), timeout_seconds=1, poll_interval=0.2)
+
+    assert "wall-clock" in excinfo.value.reason
+    assert time.monotonic() - start < 15
+    grandchild = int(pid_file.read_text())
+    for _ in range(50):
+        try:
+            os.kill(grandchild, 0)
+        except ProcessLookupError:
+            break
+        time.sleep(0.1)
+    else:
+        pytest.fail("grandchild survived the timeout kill")
+
+
+def test_missing_executable_raises_file_not_found(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        run_supervised(["definitely-not-an-installed-tool"], str(tmp_path / "run.log"))
+
+
+def test_short_lived_child_reports_peak_rss_and_cpu(tmp_path):
+    # Exits long before the first resource sample, so the figures must come from the reaped child
+    code = "block = b'x' * (300 * 1024 * 1024)\nsum(range(3_000_000))\n"
+    result = run_supervised(python_command(code), str(tmp_path / "run.log"), poll_interval=30)
+
+    assert result.peak_rss_mb > 250
+    assert result.cpu_seconds > 0
+
+
+def test_heavy_slot_is_shared_with_other_processes(tmp_path):
+    # Another process holds the only slot for about one second
+    holder_code = (
+        "import fcntl, os, sys, time\n"
+        f"os.makedirs({str(tmp_path / 'slots')!r}, exist_ok=True)\n"
+        f"f = open({str(tmp_path / 'slots' / 'slot_0.lock')!r}, 'a')\n"
+        "fcntl.flock(f, fcntl.LOCK_EX)\n"
+        "print('locked', flush=True)\n"
+        "time.sleep(1.5)\n"
+    )
+    holder = subprocess.Popen(python_command(holder_code), stdout=subprocess.PIPE, text=True)
+    assert holder.stdout.readline().strip() == "locked"
+    try:
+        process_supervisor.SLOT_RETRY_SECONDS = 0.1
+        start = time.monotonic()
+        run_supervised(python_command("pass"), str(tmp_path / "run.log"), poll_interval=0.1)
+        assert time.monotonic() - start > 0.8
+    finally:
+        process_supervisor.SLOT_RETRY_SECONDS = 1.0
+        holder.wait()
+
+
+def test_light_jobs_do_not_wait_for_heavy_slots(tmp_path):
+    slot_dir = tmp_path / "slots"
+    slot_dir.mkdir(exist_ok=True)
+    with open(slot_dir / "slot_0.lock", "a") as held:
+        fcntl.flock(held, fcntl.LOCK_EX)
+        start = time.monotonic()
+        run_supervised(python_command("pass"), str(tmp_path / "run.log"), heavy=False, poll_interval=0.1)
+        assert time.monotonic() - start < 5
+
+
+def test_heavy_jobs_in_threads_respect_slot_count(tmp_path):
+    set_max_heavy_jobs(2, slot_dir=str(tmp_path / "slots"))
+    marker_dir = tmp_path / "running"
+    marker_dir.mkdir()
+    # Each job records how many jobs are running when it starts
+    code = (
+        "import os, time, uuid\n"
+        f"d = {str(marker_dir)!r}\n"
+        "name = os.path.join(d, uuid.uuid4().hex)\n"
+        "open(name, 'w').close()\n"
+        "print(len(os.listdir(d)))\n"
+        "time.sleep(0.5)\n"
+        "os.remove(name)\n"
+    )
+    logs = [str(tmp_path / f"run{i}.log") for i in range(4)]
+    threads = [threading.Thread(target=run_supervised, args=(python_command(code), log),
+                                kwargs={"poll_interval": 0.1}) for log in logs]
+    process_supervisor.SLOT_RETRY_SECONDS = 0.05
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process_supervisor.SLOT_RETRY_SECONDS = 1.0
+    concurrent = [int(open(log).read()) for log in logs]
+    assert max(concurrent) <= 2
+
+
+def test_invalid_utf8_output_does_not_stall_the_reader(tmp_path):
+    # Enough output after the bad bytes to fill the pipe if nothing drains it
+    code = (
+        "import sys\n"
+        "sys.stdout.buffer.write(b'\\xff\\xfe bad bytes\\n')\n"
+        "for _ in range(5000):\n"
+        "    sys.stdout.buffer.write(b'y' * 99 + b'\\n')\n"
+        "sys.stdout.buffer.write(b'end\\n')\n"
+    )
+    start = time.monotonic()
+    run_supervised(python_command(code), str(tmp_path / "run.log"), timeout_seconds=20, poll_interval=0.1)
+
+    assert time.monotonic() - start < 10
+    log_lines = (tmp_path / "run.log").read_text().splitlines()
+    assert log_lines[0] == "\ufffd\ufffd bad bytes"
+    assert log_lines[-1] == "end"
+
+
+def test_proc_fallback_measures_the_whole_process_group(tmp_path, monkeypatch):
+    monkeypatch.setattr(process_supervisor, "psutil", None)
+    # A shell wrapper around the memory-hungry process, like the mafft script around its binaries
+    inner = f"{sys.executable} -c 'import time; block = bytearray(300 * 1024 * 1024); time.sleep(30)'"
+    with pytest.raises(ResourceLimitExceeded) as excinfo:
+        run_supervised(["sh", "-c", f"{inner}; true"], str(tmp_path / "run.log"),
+                       max_memory_gb=0.1, poll_interval=0.2)
+
+    assert "memory limit" in excinfo.value.reason
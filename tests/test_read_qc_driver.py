@@ -0,0 +1,111 @@
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from read_qc_driver import build_sample_manifest
+
+DRIVER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts", "read_qc_driver.py")
+
+# Writes a minimal report archive per input; inputs named *nozip* exit 0 without writing anything
+FAKE_FASTQC = """
+    import re, zipfile
+    args = sys.argv[1:]
+    out_dir = args[args.index("-o") + 1]
+    for fastq in args[args.index("-o") + 2:]:
+        if "nozip" in fastq:
+            continue
+        stem = re.sub(r"\\.(fastq|fq)(\\.gz)?$", "", os.path.basename(fastq))
+        with zipfile.ZipFile(os.path.join(out_dir, f"{stem}_fastqc.zip"), "w") as archive:
+            archive.writestr(f"{stem}_fastqc/fastqc_data.txt", "Total Sequences\\t1000\\n%GC\\t48\\n")
+            archive.writestr(f"{stem}_fastqc/summary.txt", "PASS\\tBasic Statistics\\nWARN\\tPer base sequence content\\n")
+"""
+
+# Writes the four outputs and the PE summary line; inputs named *bad* leave partial outputs and exit 1
+FAKE_TRIMMOMATIC = """
+    args = sys.argv[1:]
+    r1 = args[4]
+    outputs = args[6:10]
+    for output in outputs:
+        with open(output, "w") as f:
+            f.write("partial" if "bad" in r1 else "@read\\nACGT\\n+\\nIIII\\n")
+    if "bad" in r1:
+        sys.exit("Exception in thread main: simulated corrupt input")
+    print("Input Read Pairs: 1000 Both Surviving: 900 (90.00%) Forward Only Surviving: 50 (5.00%) "
+          "Reverse Only Surviving: 30 (3.00%) Dropped: 20 (2.00%)", file=sys.stderr)
+"""
+
+
+@pytest.fixture
+def qc_env(tmp_path, fake_tool):
+    tools = {name: fake_tool(name, body) for name, body in (("fastqc", FAKE_FASTQC), ("trimmomatic", FAKE_TRIMMOMATIC))}
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    for sample in ("10B", "11C_S3_L001", "bad1", "nozip2"):
+        for read in ("1", "2"):
+            name = f"{sample}_R{read}_001.fastq.gz" if "_S3" in sample else f"{sample}_R{read}.fastq.gz"
+            (raw_dir / name).write_text("@r\nACGT\n+\nIIII\n")
+    return tmp_path, raw_dir, tools
+
+
+def run_driver(tmp_path, raw_dir, tools, *extra):
+    command = [sys.executable, DRIVER, "--raw_data_dir", str(raw_dir), "--fastqc_dir", str(tmp_path / "fastqc"),
+               "--trimmed_dir", str(tmp_path / "trimmed"), "--total_threads", "4", "--threads_per_sample", "2",
+               "--fastqc_path", tools["fastqc"], "--trimmomatic", tools["trimmomatic"], *extra]
+    return subprocess.run(command, capture_output=True, text=True, timeout=120)
+
+
+def step_status(stdout, sample):
+    line = next(line for line in stdout.splitlines() if line.strip().startswith(f"{sample}:"))
+    return line.split(":", 1)[1].strip()
+
+
+def test_manifest_groups_pairs_and_skips_orphans(tmp_path):
+    for name in ("10B_R1.fastq.gz", "10B_R2.fastq.gz", "11C_S3_L001_R1_001.fastq.gz", "11C_S3_L001_R2_001.fastq.gz",
+                 "12D_1.fq.gz", "12D_2.fq.gz", "13E_R1.fastq.gz", "notes.txt"):
+        (tmp_path / name).write_text("")
+    manifest = build_sample_manifest(str(tmp_path))
+
+    assert list(manifest) == ["10B", "11C", "12D"]
+    assert manifest["11C"]["R2"] == str(tmp_path / "11C_S3_L001_R2_001.fastq.gz")
+    assert manifest["12D"]["R1"].endswith("12D_1.fq.gz")
+
+
+def test_failures_are_isolated_and_never_skipped(qc_env):
+    tmp_path, raw_dir, tools = qc_env
+
+    first = run_driver(tmp_path, raw_dir, tools)
+    assert first.returncode == 1
+    assert step_status(first.stdout, "10B") == "FastQC ok, Trimmomatic ok"
+    assert step_status(first.stdout, "11C") == "FastQC ok, Trimmomatic ok"
+    # Trimmomatic left partial outputs and exited 1; FastQC exited 0 without writing reports
+    assert step_status(first.stdout, "bad1") == "FastQC ok, Trimmomatic failed"
+    assert step_status(first.stdout, "nozip2") == "FastQC failed, Trimmomatic ok"
+
+    summary = pd.read_csv(tmp_path / "fastqc" / "read_qc_summary.tsv", sep="\t", index_col="sample")
+    assert summary.loc["10B", "both_surviving"] == 900
+    assert summary.loc["11C", "R1_total_sequences"] == 1000
+    assert summary.loc["11C", "R2_warn_modules"] == 1
+
+    # Successful steps are skipped, failed ones are retried (not reported up to date)
+    second = run_driver(tmp_path, raw_dir, tools)
+    assert second.returncode == 1
+    assert step_status(second.stdout, "10B") == "FastQC up_to_date, Trimmomatic up_to_date"
+    assert step_status(second.stdout, "bad1") == "FastQC up_to_date, Trimmomatic failed"
+    assert step_status(second.stdout, "nozip2") == "FastQC failed, Trimmomatic up_to_date"
+
+
+def test_newer_inputs_and_force_trigger_reruns(qc_env):
+    tmp_path, raw_dir, tools = qc_env
+    run_driver(tmp_path, raw_dir, tools)
+
+    newer = os.path.getmtime(raw_dir / "10B_R2.fastq.gz") + 10
+    os.utime(raw_dir / "10B_R2.fastq.gz", (newer, newer))
+    rerun = run_driver(tmp_path, raw_dir, tools)
+    assert step_status(rerun.stdout, "10B") == "FastQC ok, Trimmomatic ok"
+    assert step_status(rerun.stdout, "11C") == "FastQC up_to_date, Trimmomatic up_to_date"
+
+    forced = run_driver(tmp_path, raw_dir, tools, "--force")
+    assert step_status(forced.stdout, "11C") == "FastQC ok, Trimmomatic ok"
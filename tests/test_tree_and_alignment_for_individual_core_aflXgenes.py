@@ -0,0 +1,60 @@
+import pytest
+
+import process_supervisor
+from tree_and_alignment_for_individual_core_aflXgenes import run_single_gene_phylogeny
+
+# Prints its input, i.e. an "alignment" of already equal-length sequences
+FAKE_MAFFT = """
+    sys.stdout.write(open(sys.argv[-1]).read())
+"""
+
+# Writes a star tree of the alignment's sequences, or fails when FAIL_IQTREE is set
+FAKE_IQTREE = """
+    if os.environ.get("FAIL_IQTREE"):
+        sys.exit("iqtree2: simulated failure")
+    args = sys.argv[1:]
+    alignment, prefix = args[args.index("-s") + 1], args[args.index("--prefix") + 1]
+    names = [line[1:].split()[0] for line in open(alignment) if line.startswith(">")]
+    with open(prefix + ".treefile", "w") as f:
+        f.write("(" + ",".join(f"{name}:0.1" for name in names) + ");\\n")
+"""
+
+ALLELES = {"10B": "ACGTACGT", "11C": "ACGTACGT", "12D": "ACGAACGT", "13E": "ACGTACGA", "14F": "TCGTACGT", "15G": "ACCTACGT"}
+
+
+@pytest.fixture
+def gene_dirs(tmp_path, fake_tool, monkeypatch):
+    fake_tool("mafft", FAKE_MAFFT)
+    fake_tool("iqtree2", FAKE_IQTREE)
+    monkeypatch.setattr(process_supervisor, "_heavy_tool_slot_dir", str(tmp_path / "slots"))
+    core_dir = tmp_path / "core" / "adhA"
+    core_dir.mkdir(parents=True)
+    for isolate, sequence in ALLELES.items():
+        (core_dir / f"Extracted_adhA_{isolate}.fa").write_text(f">contig\n{sequence}\n")
+    return core_dir, tmp_path / "trees"
+
+
+def test_collapsed_gene_tree_is_expanded(gene_dirs):
+    core_dir, tree_dir = gene_dirs
+    run_single_gene_phylogeny(str(core_dir), str(tree_dir), "adhA")
+
+    gene_dir = tree_dir / "adhA"
+    assert (gene_dir / "adhA_aligned_unique.fasta").read_text().count(">") == 5
+    assert (gene_dir / "adhA_aligned.fasta").read_text().count(">") == 6
+    tree = (gene_dir / "adhA.treefile").read_text()
+    # The identical alleles 10B and 11C come back as a zero-length cherry (file listing order decides which leads)
+    assert "(adhA_10B:0,adhA_11C:0):0.1" in tree or "(adhA_11C:0,adhA_10B:0):0.1" in tree
+    assert tree.count("adhA_") == 6
+
+
+@pytest.mark.parametrize("collapse_identical", [True, False])
+def test_failed_iqtree_run_leaves_no_stale_tree(gene_dirs, monkeypatch, collapse_identical):
+    core_dir, tree_dir = gene_dirs
+    run_single_gene_phylogeny(str(core_dir), str(tree_dir), "adhA", collapse_identical=collapse_identical)
+    gene_dir = tree_dir / "adhA"
+    assert (gene_dir / "adhA.treefile").exists()
+
+    monkeypatch.setenv("FAIL_IQTREE", "1")
+    run_single_gene_phylogeny(str(core_dir), str(tree_dir), "adhA", collapse_identical=collapse_identical)
+    assert not (gene_dir / "adhA.treefile").exists()
+    assert not (gene_dir / "adhA_unique.treefile").exists()